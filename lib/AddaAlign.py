@@ -1,6 +1,8 @@
-import sys, os, re, time, math, copy
+import sys, os, re, time, math, copy, mmap, array
+import numpy
 import alignlib
 import ProfileLibrary
+import ProfileCache
 from AddaModule import AddaModuleRecord
 import SegmentedFile
 import AddaProfiles
@@ -57,6 +59,11 @@ class AddaAlign( AddaModuleRecord ):
         
         self.mUseCache = self.mConfig.get( "align", "use_cache", True )
         self.mCacheSize = self.mConfig.get( "align", "cache_size", 100 ) 
+        self.mCacheMemory = self.mConfig.get( "align", "cache_memory", 1000 )
+        self.mCacheDisk = self.mConfig.get( "align", "cache_disk", False )
+
+        # links are aligned in batches of batch_size links
+        self.mBatchSize = self.mConfig.get( "align", "batch_size", 100 )
 
         ###############################################
         # options for zscore check
@@ -83,13 +90,34 @@ class AddaAlign( AddaModuleRecord ):
         self.mProfileBuilder = AddaProfiles.AddaProfiles( *args, **kwargs )
 
         # the cache to store alignandum objects
-        self.mCache = {}        
+        self.mCache = None
+
+        # links waiting to be aligned
+        self.mBatch = []
 
     #--------------------------------------------------------------------------------
     def startUp( self ):
 
         if self.isComplete(): return
 
+        ###############################################
+        # the cache to store alignandum objects. Profiles 
+        # are only saved to disk if they are not prebuilt.
+        # This is done first, as a profile library
+        # replaces the default toolkit.
+        if self.mUseCache:
+            if self.mCacheDisk and not self.mUsePrebuiltProfiles:
+                filename = os.path.join( self.mTemporaryDirectory, 
+                                         os.path.basename( self.mFilenameAlignments ) + self.getSlice() + ".cache" )
+            else:
+                filename = None
+
+            self.mCache = ProfileCache.ProfileCache( max_size = self.mCacheSize,
+                                                     max_bytes = self.mCacheMemory * 1024 * 1024,
+                                                     filename = filename )
+        else:
+            self.mCache = None
+
         ###############################################
         # create objects for algorithm 
         alignlib.getDefaultToolkit().setEncoder( alignlib.getEncoder( alignlib.Protein20 ) )
@@ -132,9 +160,6 @@ class AddaAlign( AddaModuleRecord ):
                                                         self.mGop,
                                                         self.mGep )
 
-        # the cache to store alignandum objects
-        self.mCache = {}        
-        
         alignlib.setDefaultEncoder( alignlib.getEncoder( alignlib.Protein20 ) )
 
         ## initialize counters
@@ -182,37 +207,71 @@ class AddaAlign( AddaModuleRecord ):
 
     #--------------------------------------------------------------------------------
     def getAlignandum( self, nid ):
-        """get the alignandum object for an nid."""
-
-        if self.mCache:
-            if nid not in self.mCache:
-                if self.mProfileLibrary:
-                    a = self.mProfileLibrary.getProfile(nid)
-                else:
-                    a = self.getProfile( nid )
-                    
-                self.mCache[nid] = a
-                a.prepare()
-                if self.mMask: self.mask( nid, a)
+        """get the alignandum object for an nid.
+
+        Profiles are taken from the cache if possible.
+        """
+
+        if self.mCache is not None:
+            a = self.mCache.get( nid )
+            if a is not None: return a
+
+        try:
+            if self.mProfileLibrary:
+                a = self.mProfileLibrary.getProfile( nid )
             else:
-                a = self.mCache[nid]
-        else:
-            try:
-                if self.mProfileLibrary:
-                    a = alignlib.makeProfile( self.mProfileBuilder.getMali( neighbours ) )
-                else:
-                    a = self.getProfile( nid )
-            except KeyError:
-                self.warn( "profile for sequence %s not found." % str(nid))
-                return None
+                a = self.getProfile( nid )
+        except KeyError:
+            self.warn( "profile for sequence %s not found." % str(nid))
+            return None
             
-            a.prepare()
-            if self.mMask: self.mask( nid, a)
+        return self.setupAlignandum( nid, a )
+
+    def setupAlignandum( self, nid, a ):
+        """prepare and mask alignandum *a* for nid and add it to the cache."""
+
+        a.prepare()
+        if self.mMask: self.mask( nid, a)
+
+        if self.mCache is not None:
+            self.mCache.add( nid, a )
 
         if self.mLogLevel >= 5:
-            E.debug( "alignandum for rep %s\n%s" % ( nid, str(a) ) )
+            self.debug( "alignandum for rep %s\n%s" % ( nid, str(a) ) )
 
         return a
+
+    def getAlignandums( self, nids ):
+        """get the alignandum objects for a list of nids.
+
+        Profiles that are not cached are read from the profile
+        library in a single pass.
+
+        returns a dictionary mapping nids to alignandum objects.
+        """
+        result = {}
+        if not self.mProfileLibrary:
+            for nid in nids:
+                if nid not in result: result[nid] = self.getAlignandum( nid )
+            return result
+
+        missing = []
+        for nid in nids:
+            if nid in result: continue
+            a = None
+            if self.mCache is not None: a = self.mCache.get( nid )
+            result[nid] = a
+            if a is None: missing.append( nid )
+
+        found = [ nid for nid in missing if nid in self.mProfileLibrary ]
+        for nid, a in zip( found, self.mProfileLibrary.getProfiles( found ) ):
+            result[nid] = self.setupAlignandum( nid, a )
+
+        for nid in missing:
+            if result[nid] is None:
+                self.warn( "profile for sequence %s not found." % str(nid))
+
+        return result
     
     def registerExistingOutput(self, filename):
         """process existing output in filename to guess correct point to continue computation."""
@@ -246,10 +305,18 @@ class AddaAlign( AddaModuleRecord ):
                             t - self.mStartTime,
                             float(self.mReportStep * ( t - self.mStartTime )) / self.mInput, 
                             ) )
+            if self.mCache is not None: self.info( str(self.mCache) )
 
         query_nid, query_from, query_to = map(int, query_token.split("_") )
         sbjct_nid, sbjct_from, sbjct_to = map(int, sbjct_token.split("_") )
 
+        if self.mBatchSize > 1:
+            self.mBatch.append( (line[:-1],
+                                 query_nid, query_from, query_to,
+                                 sbjct_nid, sbjct_from, sbjct_to) )
+            if len(self.mBatch) >= self.mBatchSize: self.alignBatch()
+            return
+
         self.debug( "checking link between %i (%i-%i) and %i (%i-%i)" %\
                     (query_nid, query_from, query_to,
                      sbjct_nid, sbjct_from, sbjct_to) )
@@ -257,6 +324,14 @@ class AddaAlign( AddaModuleRecord ):
         passed, alignment, extra_info = self.mChecker( query_nid, query_from, query_to,
                                                        sbjct_nid, sbjct_from, sbjct_to)
 
+        self.mOutfile.write( self.formatResult( line[:-1], passed, alignment, extra_info ) )
+        self.mOutfile.flush()
+
+        self.mOutput += 1
+
+    def formatResult( self, prefix, passed, alignment, extra_info ):
+        """return output line for an aligned link and update counters."""
+
         if passed: 
             code = "+"
             self.mNPassed += 1
@@ -264,24 +339,64 @@ class AddaAlign( AddaModuleRecord ):
             code = "-"
             self.mNFailed += 1
 
-        self.mOutfile.write( "\t".join( ( 
-                    line[:-1],
-                    code,
-                    str(alignlib.AlignmentFormatEmissions( alignment )),
-                    str(alignment.getScore()), 
-                    str(alignment.getNumAligned()), 
-                    str(alignment.getNumGaps())) + extra_info ) + "\n" )                    
+        return "\t".join( ( 
+                prefix,
+                code,
+                str(alignlib.AlignmentFormatEmissions( alignment )),
+                str(alignment.getScore()), 
+                str(alignment.getNumAligned()), 
+                str(alignment.getNumGaps())) + extra_info ) + "\n"
 
-        self.mOutfile.flush()
+    def alignBatch( self ):
+        """align the links in the current batch.
 
-        self.mOutput += 1
+        The profiles for all links in the batch are obtained first.
+        The links are then aligned in input order and the results 
+        are written with a single flush.
+
+        The links are aligned sequentially, as the z-score
+        computation draws from alignlib's global random state.
+        """
+
+        batch, self.mBatch = self.mBatch, []
+        if not batch: return
+
+        nids = []
+        for link in batch: nids.extend( (link[1], link[4]) )
+        profiles = self.getAlignandums( nids )
+
+        lines = []
+        for link in batch:
+            prefix, query_nid, query_from, query_to, sbjct_nid, sbjct_from, sbjct_to = link
+            query_profile, sbjct_profile = profiles[query_nid], profiles[sbjct_nid]
+            if query_profile and sbjct_profile:
+                result = self.alignLinkZScore( query_profile, query_nid, query_from, query_to,
+                                               sbjct_profile, sbjct_nid, sbjct_from, sbjct_to,
+                                               self.mAlignator )
+            else:
+                result = None
+
+            if result is None:
+                self.warn( "could not compute link %s_%i_%i - %s_%i_%i\n" % link[1:] )
+                self.mNNotFound += 1
+                result = ( False, alignlib.makeAlignmentVector(), ("na",) )
+            lines.append( self.formatResult( link[0], *result ) )
+
+        self.mOutfile.write( "".join( lines ) )
+        self.mOutfile.flush()
+        self.mOutput += len(lines)
            
     def finish(self):    
         
+        self.alignBatch()
         self.mOutfile.close()
         
         self.info( "aligned: %i links input, %i links passed, %i links failed, %i links not found" %\
                        (self.mInput, self.mNPassed, self.mNFailed, self.mNNotFound ) )
+
+        if self.mCache is not None: 
+            self.info( str(self.mCache) )
+            self.mCache.close()
         
         AddaModuleRecord.finish( self )
         
@@ -340,11 +455,26 @@ class AddaAlign( AddaModuleRecord ):
                         sbjct_nid, sbjct_from, sbjct_to) )
             self.mNNotFound += 1
             return False, result, ("na",)
-        
+
+        return self.alignLinkZScore( query_profile, query_nid, query_from, query_to,
+                                     sbjct_profile, sbjct_nid, sbjct_from, sbjct_to,
+                                     self.mAlignator )
+
+    def alignLinkZScore( self,
+                         query_profile, query_nid, query_from, query_to,
+                         sbjct_profile, sbjct_nid, sbjct_from, sbjct_to,
+                         alignator ):
+        """align two profiles and compute the zscore of the alignment.
+
+        This method does not modify the state of the module.
+        """
+
+        result = alignlib.makeAlignmentVector()
+
         query_profile.useSegment( query_from, query_to )
         sbjct_profile.useSegment( sbjct_from, sbjct_to )        
         
-        self.mAlignator.align( result, query_profile, sbjct_profile )
+        alignator.align( result, query_profile, sbjct_profile )
         
         self.debug( "# --> %s vs %s: score=%5.2f, length=%i, numgaps=%i, row_from=%i, row_to=%i, col_from=%i, col_to=%i" %\
                     (query_nid, sbjct_nid,
@@ -373,7 +503,7 @@ class AddaAlign( AddaModuleRecord ):
         alignlib.calculateZScoreParameters( z_params,
                                             query_profile,
                                             sbjct_profile,
-                                            self.mAlignator,
+                                            alignator,
                                             self.mNumIterationsZScore)
         
         mean   = z_params.getMean()
@@ -432,6 +562,7 @@ class AddaRealign( AddaAlign ):
                             t - self.mStartTime,
                             float(self.mReportStep * ( t - self.mStartTime )) / self.mInput, 
                             ) )
+            if self.mCache is not None: self.info( str(self.mCache) )
 
         if link.passed == "+":
             self.mOutfile.write( line )
@@ -469,3 +600,59 @@ class AddaRealign( AddaAlign ):
 
         self.mOutput += 1
 
+def orderLinks( filename_in, filename_out ):
+    """write the links in *filename_in* to *filename_out* ordered by
+    the sequences of the linked domains.
+
+    Links are sorted by the smaller and then the larger nid of the
+    two domains, so that the links of a sequence are adjacent and 
+    consecutive links re-use profiles. A contiguous slice of the output 
+    covers a contiguous range of nids.
+
+    The sort is stable and the output is complete once it ends 
+    in the EOF token.
+
+    returns the number of links written.
+    """
+
+    infile = open( filename_in, "rb" )
+    if os.path.getsize( filename_in ) > 0:
+        data = mmap.mmap( infile.fileno(), 0, access = mmap.ACCESS_READ )
+    else:
+        data = ""
+
+    # collect line offsets and nids
+    starts, ends = array.array( "l" ), array.array( "l" )
+    nids1, nids2 = array.array( "l" ), array.array( "l" )
+
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find( "\n", start )
+        if end < 0: end = size
+        else: end += 1
+        if data[start] != "#":
+            query_token, sbjct_token = data[start:end].split( "\t", 2 )[:2]
+            query_nid = int( query_token[:query_token.index("_")] )
+            sbjct_nid = int( sbjct_token[:sbjct_token.index("_")] )
+            starts.append( start )
+            ends.append( end )
+            nids1.append( min( query_nid, sbjct_nid ) )
+            nids2.append( max( query_nid, sbjct_nid ) )
+        start = end
+
+    order = numpy.lexsort( ( numpy.frombuffer( nids2, dtype = numpy.int_ ),
+                             numpy.frombuffer( nids1, dtype = numpy.int_ ) ) )
+
+    tmpfile = filename_out + ".tmp"
+    outfile = open( tmpfile, "w" )
+    for x in order:
+        outfile.write( data[starts[x]:ends[x]] )
+    outfile.write( SegmentedFile.TOKEN )
+    outfile.close()
+    os.rename( tmpfile, filename_out )
+
+    if size > 0: data.close()
+    infile.close()
+
+    return len(order)
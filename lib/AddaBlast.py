@@ -22,6 +22,14 @@ class AddaBlast( AddaModuleBlock ):
         self.mBlastNumResults = self.mConfig.get( "blast", "num_results", 100000 )
 
     def applyMethod(self ):
+
+        # blast needs a fasta file, export one from binary databases
+        filename_fasta = "%s.fasta" % self.mFilenameOutputFasta
+        if not os.path.exists( filename_fasta ):
+            self.info( "exporting sequences to %s" % filename_fasta )
+            outfile = open( filename_fasta, "w" )
+            IndexedFasta.exportFasta( IndexedFasta.IndexedFasta( self.mFilenameOutputFasta ), outfile )
+            outfile.close()
         
         cmd = "formatdb -i %s.fasta -p T -n %s" % (self.mFilenameOutputFasta, self.mBlastDatabase )
 
@@ -1,10 +1,12 @@
-import sys, os, re, time, math, copy, glob, optparse, math, gzip
+import sys, os, re, time, math, copy, glob, optparse, math, gzip, array
+
+import numpy
 
 import cadda
 
 from AddaModule import AddaModuleBlock
 import AddaIO
-import CGAT.Components as Components
+import Components
 import SegmentedFile
 
 class AddaCluster( AddaModuleBlock ):
@@ -42,16 +44,18 @@ class AddaCluster( AddaModuleBlock ):
         if self.isComplete(): return
         self.mOutfile = self.openOutputStream( self.mFilenameClusters )
 
-        self.mMapId2Nid = AddaIO.readMapId2Nid( open(self.mFilenamesNids, "r") )
-        self.mMapNid2Id = dict( ( (x[1],x[0]) for x in self.mMapId2Nid.iteritems() ) )
+        self.mMapId2Nid = AddaIO.openMapId2Nid( self.mFilenamesNids )
+        self.mMapNid2Id = self.mMapId2Nid.getNid2Id()
 
     def applyMethod(self ):
         """index the graph.        
         """
-        componentor = Components.SComponents()
-
         infile = open( self.mFilenameAlignments, "r" )
 
+        # keys of query and sbjct domain of each accepted link
+        domain_keys = AddaIO.DomainKeys()
+        keys = array.array( "l" )
+
         naccepted, nrejected_score, nrejected_aligned = 0, 0, 0
         for line in infile:
             if line[0] == "#": continue
@@ -64,7 +68,8 @@ class AddaCluster( AddaModuleBlock ):
              
             if code == "+":
                 if int(naligned) >= self.mMinAlignedResidues:
-                    componentor.add( qdomain, sdomain )
+                    keys.append( domain_keys.getKey( qdomain ) )
+                    keys.append( domain_keys.getKey( sdomain ) )
                     naccepted += 1
                 else:
                     nrejected_aligned += 1
@@ -73,22 +78,28 @@ class AddaCluster( AddaModuleBlock ):
         self.info( "computing components with %i accepted links (%i rejected score, %i rejected alignment length)" %\
                    (naccepted, nrejected_score, nrejected_aligned ) )
         
-        components = componentor.getComponents()
+        # map domain keys to consecutive ids
+        if naccepted > 0:
+            domains, ids = numpy.unique( numpy.frombuffer( keys, dtype = numpy.int_ ), return_inverse = True )
+            labels = Components.getComponentLabels( ids[0::2], ids[1::2], len(domains) )
+        else:
+            domains, labels = [], numpy.array( [], dtype = numpy.int64 )
+        del keys
+
         self.mOutfile.write( "nid\tstart\tend\tfamily\n" )
 
         noutput = 0
         family_id = 0 
 
         nids = set()
-        for domains in components:
-            family_id += 1
-            for domain in domains:
-                nid, start, end = domain.split("_")
-                nids.add( nid )
-                self.mOutfile.write( "%s\t%s\t%s\t%s\n" % \
-                                         ( nid, start, end, self.mPatternFamily % family_id ) )
-
-                noutput += 1
+        for x in numpy.argsort( labels, kind = "mergesort" ):
+            family_id = labels[x] + 1
+            nid, start, end = domain_keys.getDomain( domains[x] ).split("_")
+            nids.add( nid )
+            self.mOutfile.write( "%s\t%s\t%s\t%s\n" % \
+                                     ( nid, start, end, self.mPatternFamily % family_id ) )
+
+            noutput += 1
 
         self.info( "output from mst: nsequences=%i, nclusters=%i, ndomains=%i" % (len(nids), family_id, noutput) )
         
@@ -1,4 +1,6 @@
-import sys, os, re, time, math, copy, glob, optparse, math
+import sys, os, re, time, math, copy, glob, optparse, math, array
+
+import numpy
 
 import cadda
 
@@ -31,27 +33,44 @@ class AddaComponents( AddaModuleBlock ):
         if self.isComplete(): return
         self.mOutfile = self.openOutputStream( self.mFilenameOutput )
 
-        self.mMapId2Nid = AddaIO.readMapId2Nid( open(self.mFilenamesNids, "r") )
-        self.mMapNid2Id = dict( ( (x[1],x[0]) for x in self.mMapId2Nid.iteritems() ) )
+        self.mMapId2Nid = AddaIO.openMapId2Nid( self.mFilenamesNids )
+        self.mMapNid2Id = self.mMapId2Nid.getNid2Id()
 
     def getComponents( self ):
-        '''return components.'''
+        '''return components.
+
+        Domains are mapped to 64-bit integer keys (see 
+        :class:`AddaIO.DomainKeys`) and components are computed
+        with :func:`Components.getComponentLabels`.
 
-        componentor = Components.SComponents()
+        returns an array of domain keys and an array with the component
+        label of each domain.
+        '''
 
         infile = SegmentedFile.openfile( self.mFilenameInput, "r" )
 
-        ninput = 0
+        # keys of query and sbjct domain of each link
+        self.mDomainKeys = AddaIO.DomainKeys()
+        keys = array.array( "l" )
         for line in infile:
             if line[0] == "#": continue
             
             qdomain, sdomain = line[:-1].split("\t")[:2]
-            componentor.add( qdomain, sdomain )
-            ninput += 1
+            keys.append( self.mDomainKeys.getKey( qdomain ) )
+            keys.append( self.mDomainKeys.getKey( sdomain ) )
 
+        ninput = len(keys) // 2
         self.info( "computing components with %i links" % ninput)
 
-        return componentor.getComponents()
+        if ninput == 0:
+            return numpy.array( [], dtype = numpy.int64 ), numpy.array( [], dtype = numpy.int64 )
+
+        domains, ids = numpy.unique( numpy.frombuffer( keys, dtype = numpy.int_ ), return_inverse = True )
+        del keys
+
+        labels = Components.getComponentLabels( ids[0::2], ids[1::2], len(domains) )
+
+        return domains, labels
 
     def applyMethod(self ):
         """index the graph.        
@@ -60,7 +79,7 @@ class AddaComponents( AddaModuleBlock ):
         if not self.mFilenameInput or not self.mFilenameOutput:
             raise NotImplementedError( "incomplete implemenation" )
 
-        components = self.getComponents()
+        domains, labels = self.getComponents()
 
         self.mOutfile.write( "nid\tstart\tend\tfamily\n" )
 
@@ -68,15 +87,14 @@ class AddaComponents( AddaModuleBlock ):
         family_id = 0 
 
         nids = set()
-        for domains in components:
-            family_id += 1
-            for domain in domains:
-                nid, start, end = domain.split("_")
-                nids.add( nid )
-                self.mOutfile.write( "%s\t%s\t%s\t%s\n" % \
-                                         ( nid, start, end, self.mPatternFamily % family_id ) )
-
-                noutput += 1
+        for x in numpy.argsort( labels, kind = "mergesort" ):
+            family_id = labels[x] + 1
+            nid, start, end = self.mDomainKeys.getDomain( domains[x] ).split("_")
+            nids.add( nid )
+            self.mOutfile.write( "%s\t%s\t%s\t%s\n" % \
+                                     ( nid, start, end, self.mPatternFamily % family_id ) )
+
+            noutput += 1
 
         self.info( "output from %s: nsequences=%i, nclusters=%i, ndomains=%i" %\
                    (self.mName, len(nids), family_id, noutput) )
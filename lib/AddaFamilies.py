@@ -56,8 +56,8 @@ class AddaFamilies( AddaModuleBlock ):
 
         self.mOutfile = self.openOutputStream( self.mFilenameDomains )
         self.mOutfileFamilies = self.openOutputStream( self.mFilenameFamilies )
-        self.mMapId2Nid = AddaIO.readMapId2Nid( open(self.mFilenamesNids, "r") )
-        self.mMapNid2Id = dict( ( (x[1],x[0]) for x in self.mMapId2Nid.iteritems() ) )
+        self.mMapId2Nid = AddaIO.openMapId2Nid( self.mFilenamesNids )
+        self.mMapNid2Id = self.mMapId2Nid.getNid2Id()
 
     def applyMethod(self ):
         """apply the method.
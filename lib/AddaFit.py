@@ -56,6 +56,13 @@ class AddaFit( AddaModuleRecord ):
        ``files:output_fit_overhang``: a tab-separated histogram of overhang
           values.
 
+       ``files:output_fit_counts``: the raw counts of transfer and overhang
+          values. Only non-zero bins are written. Counts of parallel runs are
+          merged by summation.
+
+       ``files:output_fit_data``: transfer and overhang values for each pair
+          of domains. This file is only written if ``fit:write_data`` is set.
+
        ``files:output_fit_details``: details of the fitting procedure. This tab-separated
            table reports the transfer and overhang for combination of domains and alignment.
 
@@ -98,6 +105,8 @@ class AddaFit( AddaModuleRecord ):
     """
 
     mName = "Fit"
+
+    mNeighboursFormat = "array"
     
     def __init__(self, *args, **kwargs ):
 
@@ -108,6 +117,8 @@ class AddaFit( AddaModuleRecord ):
         self.mFilenameTransfer = self.mConfig.get( "output", "fit_transfer", "adda.fit.transfer" )
         self.mFilenameData = self.mConfig.get( "output", "fit_data", "adda.fit.data" )
         self.mFilenameDetails = self.mConfig.get( "output", "fit_details", "adda.fit.details" )
+        self.mFilenameCounts = self.mConfig.get( "output", "fit_counts", "adda.fit.counts" )
+        self.mWriteData = self.mConfig.get( "fit", "write_data", False )
         self.mMinTransfer = float(self.mConfig.get( "fit", "min_transfer" ))
         self.mMinOverhang = float(self.mConfig.get( "fit", "min_overhang" ))
         self.mFilenameNids = self.mConfig.get( "output", "nids", "adda.nids" )
@@ -123,6 +134,11 @@ class AddaFit( AddaModuleRecord ):
         self.mOutfileData = None
         self.mDataIsComplete = False
 
+        # numeric identifiers of families for domains
+        # stored in dictionaries
+        self.mFamilyIds = {}
+        self.mFamilies = []
+
     #--------------------------------------------------------------------------        
     def isComplete( self ):
         '''check if files are complete'''
@@ -130,12 +146,12 @@ class AddaFit( AddaModuleRecord ):
         if AddaModuleRecord.isComplete( self ):
             return True
         
-        # If all the data files are complete, re-compute fit, transfer and overhang
+        # If all the count files are complete, re-compute fit, transfer and overhang
         # only and then return as complete
-        if SegmentedFile.isComplete( SegmentedFile.mangle( self.mFilenameData, self.getSlice()) ):
+        if self.isSubset() and SegmentedFile.isComplete( self.getFilenameCounts() ):
             return True
 
-        if SegmentedFile.isComplete( self.mFilenameData ):
+        if SegmentedFile.isComplete( self.mFilenameCounts ):
             return self.merge()
         
         return False
@@ -190,10 +206,11 @@ class\tnid1\tdfrom1\tdto1\tafrom1\tato1\tdnid2\tdfrom2\tdto2\tafrom2\tato2\tlali
                 # if not flushed, the header and the EOF token appear twice.
                 self.mOutfileDetails.flush()
 
-        self.mOutfileData  = self.openOutputStream( self.mFilenameData, register = True )
+        if self.mWriteData:
+            self.mOutfileData  = self.openOutputStream( self.mFilenameData, register = True )
 
-        if not self.mContinueAt:
-            self.mOutfileData.write( "class\tquery_nid\tsbjct_nid\ttransfer\tquery_overhang\tsbjct_overhang\n" )
+            if not self.mContinueAt:
+                self.mOutfileData.write( "class\tquery_nid\tsbjct_nid\ttransfer\tquery_overhang\tsbjct_overhang\n" )
 
     #--------------------------------------------------------------------------        
     def registerExistingOutput(self, filename):    
@@ -215,29 +232,75 @@ class\tnid1\tdfrom1\tdto1\tafrom1\tato1\tdnid2\tdfrom2\tdto2\tafrom2\tato2\tlali
 
         """
 
-        values.sort()
+        sums = {}
+        for f, q, s, transfer, overhang1, overhang2 in values:
+            self.addValue( sums, (f, q, s), transfer, overhang1, overhang2 )
 
-        for g, vals in itertools.groupby( values, key = lambda x: x[:3] ):
-            
-            vals = list(vals)
-            
-            transfers, overhangs = [], []
-            for f, q, s, transfer, overhang1, overhang2 in vals:
+        self.addCounts( sums )
 
-                if transfer < self.mMinTransfer: continue
+    #--------------------------------------------------------------------------
+    def addValue( self, sums, key, transfer, overhang1, overhang2 ):
+        """add a transfer value and two overhang values to the sums for key.
 
-                transfers.append( transfer )
-                overhangs.append( overhang1 )
-                overhangs.append( overhang2 )
-                
-            if transfers:
-                transfer = int(round(sum( transfers ) / float(len(transfers))))
-                self.mTransferValues[transfer] += 1
+        Values below the minimum transfer are ignored.
+        """
+        if transfer < self.mMinTransfer: return
+        try:
+            v = sums[key]
+        except KeyError:
+            v = sums[key] = [0, 0, 0]
+        v[0] += transfer
+        v[1] += 1
+        v[2] += overhang1 + overhang2
 
-            if overhangs:
-                overhang = int(math.floor(sum( overhangs ) / float(len(overhangs))))
-                if overhang >= self.mMinOverhang:
-                    self.mOverhangValues[overhang] += 1
+    #--------------------------------------------------------------------------
+    def addCounts( self, sums ):
+        """add averaged values to self.mTransferValues and self.mOverhangValues.
+
+        sums maps each group to the sum of transfer values, the
+        number of values and the sum of overhang values.
+        """
+        for sum_transfer, n, sum_overhang in sums.itervalues():
+            transfer = int(round(sum_transfer / float(n)))
+            self.mTransferValues[transfer] += 1
+
+            overhang = int(math.floor(sum_overhang / float(2 * n)))
+            if overhang >= self.mMinOverhang:
+                self.mOverhangValues[overhang] += 1
+
+    #--------------------------------------------------------------------------
+    def getFilenameCounts( self, chunk = None ):
+        '''return filename of counts for chunk.'''
+        if self.isSubset():
+            return SegmentedFile.mangle( self.mFilenameCounts, self.getSlice( chunk ) )
+        else:
+            return self.mFilenameCounts
+
+    #--------------------------------------------------------------------------
+    def writeCounts( self ):
+        """write non-zero transfer and overhang counts."""
+
+        outfile = self.openOutputStream( self.mFilenameCounts, register = False )
+        outfile.write( "bin\ttransfer\toverhang\n" )
+        for bin in numpy.flatnonzero( self.mTransferValues + self.mOverhangValues ):
+            outfile.write( "%i\t%i\t%i\n" % (bin, self.mTransferValues[bin], self.mOverhangValues[bin] ) )
+        outfile.close()
+
+    #--------------------------------------------------------------------------
+    def readCounts( self, filename ):
+        """add transfer and overhang counts in filename."""
+
+        infile = open( filename, "r" )
+        for line in infile:
+            if line.startswith("#"): continue
+            if line.startswith("bin"): continue
+            bin, transfer, overhang = map( int, line[:-1].split("\t") )
+            if bin >= len(self.mTransferValues):
+                self.warn( "ignoring counts for bin %i in %s: larger than maximum sequence length" % (bin, filename) )
+                continue
+            self.mTransferValues[bin] += transfer
+            self.mOverhangValues[bin] += overhang
+        infile.close()
 
     #--------------------------------------------------------------------------    
     def readPreviousData(self, filename = None):
@@ -369,77 +432,162 @@ class\tnid1\tdfrom1\tdto1\tafrom1\tato1\tdnid2\tdfrom2\tdto2\tafrom2\tato2\tlali
         This method normalizes per family and per sequence pair.
         """
 
-        values = []
+        query_token = neighbours.mQueryToken
 
-        for n in neighbours.mMatches:
+        # ignore links to self and those between nids without domains
+        qdomains = self.getDomains( query_token )
+        if qdomains is None: return
 
-            # ignore links to self and those between nids without domains
-            if n.mQueryToken == n.mSbjctToken or \
-                    str(n.mQueryToken) not in self.mMapNid2Domains or \
-                    str(n.mSbjctToken) not in self.mMapNid2Domains: continue
+        matches = neighbours.mMatches
+        matches = matches[matches["sbjct_nid"] != query_token]
+
+        # collect the sbjct domains
+        match_index, sdomains = [], []
+
+        for index, sbjct_token in enumerate( matches["sbjct_nid"].tolist() ):
+
+            domains = self.getDomains( sbjct_token )
+            if domains is None: continue
 
             if self.mContinueAt:
-                if (n.mQueryToken,n.mSbjctToken) == self.mContinueAt:
+                if (query_token,sbjct_token) == self.mContinueAt:
                     self.info("continuing processing at pair %s" % str(self.mContinueAt ) )
                     self.mContinueAt = None
                 continue
 
-            qdomains = self.mMapNid2Domains[str(n.mQueryToken)]
-            sdomains = self.mMapNid2Domains[str(n.mSbjctToken)]
-            
-            for family in set(qdomains.keys()).intersection( set(sdomains.keys())):
-                xdomains = qdomains[family]
-                ydomains = sdomains[family]
-                
-                total_transfer = 0
-                ntransfer = 0
-                total_overhang = 0
-                noverhang = 0
-                
-                for xfrom, xto in xdomains:
-
-                    ovlx = min(xto,n.mQueryTo) - max(xfrom,n.mQueryFrom)
-                    # no overlap between domain and alignment on query
-                    if ovlx < 0: continue                            
-                    lx = xto - xfrom
-
-                    for yfrom, yto in ydomains:
-
-                        # no overlap between domain and alignment on sbjct
-                        ovly = min(yto,n.mSbjctTo) - max(yfrom,n.mSbjctFrom)
-                        if ovly < 0: continue
-                        ly = yto - yfrom
-
-                        lali = min(n.mSbjctTo - n.mSbjctFrom, n.mQueryTo - n.mQueryFrom)
-                        
-                        # map domain from query to sbjct
-                        zfrom = max(xfrom - n.mQueryFrom + n.mSbjctFrom, n.mSbjctFrom)
-                        zto   = min(xto   - n.mQueryFrom + n.mSbjctFrom, n.mSbjctTo)  
-                        transfer = max(0, min(zto, yto) - max(zfrom, yfrom))
-
-                        A = float(transfer) / float( lali )
-                        B = float(transfer) / math.sqrt( float(lx * ly))
-
-                        if self.mOutfileDetails:
-                            self.mOutfileDetails.write( "\t".join( \
-                                    map(str, (family,
-                                              n.mQueryToken, xfrom, xto, n.mQueryFrom, n.mQueryTo,
-                                              n.mSbjctToken, yfrom, yto, n.mSbjctFrom, n.mSbjctTo,
-                                              lali, lx, ly, transfer, A, B, n.mEvalue) )) + "\n" )
-                            self.mOutfileDetails.flush()
-                        
-                        if self.mOutfileData:
-                            self.mOutfileData.write( "\t".join( \
-                                    map(str, (family, n.mQueryToken, n.mSbjctToken, 
-                                              transfer, lx-transfer, ly-transfer) ) ) + "\n")
-                            self.mOutfileData.flush()
-                            
-                        if transfer >= 0:
-                            values.append( (family, n.mQueryToken, n.mSbjctToken, 
-                                            transfer, lx-transfer, ly-transfer) ) 
-                                         
-        values.sort()
-        self.processValues( values )
+            match_index.append( index )
+            sdomains.append( domains )
+
+        if not match_index: return
+
+        # query domains sorted by family
+        qfamilies, qfrom, qto = [ numpy.asarray( x, numpy.int64 ) for x in qdomains ]
+        order = numpy.argsort( qfamilies, kind = "mergesort" )
+        qfamilies, qfrom, qto = qfamilies[order], qfrom[order], qto[order]
+
+        sfamilies = numpy.concatenate( [ x[0] for x in sdomains ] ).astype( numpy.int64 )
+        sfrom = numpy.concatenate( [ x[1] for x in sdomains ] ).astype( numpy.int64 )
+        sto = numpy.concatenate( [ x[2] for x in sdomains ] ).astype( numpy.int64 )
+        match_index = numpy.repeat( match_index, [ len(x[0]) for x in sdomains ] )
+
+        # pair each sbjct domain with all query domains of the same family
+        lower = numpy.searchsorted( qfamilies, sfamilies, "left" )
+        npairs = numpy.searchsorted( qfamilies, sfamilies, "right" ) - lower
+        sidx = numpy.repeat( numpy.arange( len(sfamilies) ), npairs )
+        qidx = numpy.arange( len(sidx) ) + numpy.repeat( lower - (numpy.cumsum( npairs ) - npairs), npairs )
+
+        midx = match_index[sidx]
+        families = sfamilies[sidx]
+        xfrom, xto = qfrom[qidx], qto[qidx]
+        yfrom, yto = sfrom[sidx], sto[sidx]
+        query_from = matches["query_start"].astype( numpy.int64 )[midx]
+        query_to = matches["query_end"].astype( numpy.int64 )[midx]
+        sbjct_from = matches["sbjct_start"].astype( numpy.int64 )[midx]
+        sbjct_to = matches["sbjct_end"].astype( numpy.int64 )[midx]
+
+        # remove pairs without overlap between domain and alignment
+        # on query or sbjct
+        take = numpy.logical_and(
+            numpy.minimum( xto, query_to ) - numpy.maximum( xfrom, query_from ) >= 0,
+            numpy.minimum( yto, sbjct_to ) - numpy.maximum( yfrom, sbjct_from ) >= 0 )
+        if not take.any(): return
+
+        midx, families = midx[take], families[take]
+        xfrom, xto, yfrom, yto = xfrom[take], xto[take], yfrom[take], yto[take]
+        query_from, query_to = query_from[take], query_to[take]
+        sbjct_from, sbjct_to = sbjct_from[take], sbjct_to[take]
+
+        lx = xto - xfrom
+        ly = yto - yfrom
+
+        # map domain from query to sbjct
+        zfrom = numpy.maximum( xfrom - query_from + sbjct_from, sbjct_from )
+        zto = numpy.minimum( xto - query_from + sbjct_from, sbjct_to )
+        transfer = numpy.maximum( 0, numpy.minimum( zto, yto ) - numpy.maximum( zfrom, yfrom ) )
+
+        if self.mOutfileDetails or self.mOutfileData:
+            self.writeValues( query_token, matches, midx, families,
+                              xfrom, xto, query_from, query_to,
+                              yfrom, yto, sbjct_from, sbjct_to,
+                              lx, ly, transfer )
+
+        # average per family and sbjct
+        take = transfer >= self.mMinTransfer
+        if not take.any(): return
+
+        keys = matches["sbjct_nid"].astype( numpy.int64 )[midx[take]] * (families.max() + 1) + families[take]
+        keys, groups = numpy.unique( keys, return_inverse = True )
+        transfer = transfer[take]
+        overhang = (lx[take] - transfer) + (ly[take] - transfer)
+
+        n = numpy.bincount( groups ).astype( numpy.float )
+        transfers = numpy.floor( numpy.bincount( groups, weights = transfer ) / n + 0.5 ).astype( numpy.int64 )
+        overhangs = numpy.floor( numpy.bincount( groups, weights = overhang ) / (2 * n) ).astype( numpy.int64 )
+
+        numpy.add.at( self.mTransferValues, transfers, 1 )
+        numpy.add.at( self.mOverhangValues, overhangs[overhangs >= self.mMinOverhang], 1 )
+
+    #--------------------------------------------------------------------------
+    def getDomains( self, nid ):
+        '''return arrays of family ids, starts and ends of the domains of nid.
+
+        returns None if there are no domains for nid.
+        '''
+        if hasattr( self.mMapNid2Domains, "getDomains" ):
+            return self.mMapNid2Domains.getDomains( nid )
+
+        if str(nid) not in self.mMapNid2Domains: return None
+
+        families, starts, ends = [], [], []
+        for family, domains in self.mMapNid2Domains[str(nid)].iteritems():
+            try:
+                family_id = self.mFamilyIds[family]
+            except KeyError:
+                family_id = self.mFamilyIds[family] = len(self.mFamilies)
+                self.mFamilies.append( family )
+            for start, end in domains:
+                families.append( family_id )
+                starts.append( start )
+                ends.append( end )
+        return families, starts, ends
+
+    #--------------------------------------------------------------------------
+    def getFamilyName( self, family ):
+        '''return the name of family with numeric identifier family.'''
+        if hasattr( self.mMapNid2Domains, "getFamilyName" ):
+            return self.mMapNid2Domains.getFamilyName( family )
+        return self.mFamilies[family]
+
+    #--------------------------------------------------------------------------
+    def writeValues( self, query_token, matches, midx, families,
+                     xfrom, xto, query_from, query_to,
+                     yfrom, yto, sbjct_from, sbjct_to,
+                     lx, ly, transfer ):
+        '''write details and data for pairs of domains.'''
+
+        sbjct_tokens = matches["sbjct_nid"][midx].tolist()
+        evalues = matches["evalue"][midx].tolist()
+
+        for x in range(len(midx)):
+            family = self.getFamilyName( families[x] )
+            sbjct_token = sbjct_tokens[x]
+            t, dx, dy = int(transfer[x]), int(lx[x]), int(ly[x])
+
+            if self.mOutfileDetails:
+                lali = min( sbjct_to[x] - sbjct_from[x], query_to[x] - query_from[x] )
+                A = float(t) / float( lali )
+                B = float(t) / math.sqrt( float(dx * dy) )
+                self.mOutfileDetails.write( "\t".join( \
+                        map(str, (family,
+                                  query_token, xfrom[x], xto[x], query_from[x], query_to[x],
+                                  sbjct_token, yfrom[x], yto[x], sbjct_from[x], sbjct_to[x],
+                                  lali, dx, dy, t, A, B, evalues[x]) )) + "\n" )
+                self.mOutfileDetails.flush()
+
+            if self.mOutfileData:
+                self.mOutfileData.write( "\t".join( \
+                        map(str, (family, query_token, sbjct_token,
+                                  t, dx-t, dy-t) ) ) + "\n")
                                         
     #--------------------------------------------------------------------------
     def writeHistogram(self, outfile, bins, frequencies ):
@@ -493,6 +641,13 @@ class\tnid1\tdfrom1\tdto1\tafrom1\tato1\tdnid2\tdfrom2\tdto2\tafrom2\tato2\tlali
     #--------------------------------------------------------------------------    
     def finish(self):
 
+        if not SegmentedFile.isComplete( self.getFilenameCounts() ):
+            self.writeCounts()
+
+        if self.mOutfileData:
+            self.mOutfileData.close()
+            self.mOutfileData = None
+
         self.info( "number of values: transfer=%i, overhang=%i" % (len(self.mTransferValues),
                                                                    len(self.mOverhangValues)) )
 
@@ -596,11 +751,30 @@ class\tnid1\tdfrom1\tdto1\tafrom1\tato1\tdnid2\tdfrom2\tdto2\tafrom2\tato2\tlali
         if glob.glob( "%s.0*" % self.mFilenameDetails):
             if not AddaModuleRecord.merge( self, (self.mFilenameDetails, ) ): return False
 
-        if not AddaModuleRecord.merge( self, (self.mFilenameData, ) ): return False
+        if glob.glob( "%s.0*" % self.mFilenameData):
+            if not AddaModuleRecord.merge( self, (self.mFilenameData, ) ): return False
+
+        self.mTransferValues = numpy.array( [0] * (self.mMaxSequenceLength + 1), numpy.int )
+        self.mOverhangValues = numpy.array( [0] * (self.mMaxSequenceLength + 1), numpy.int )
+
+        # sum the counts of all chunks
+        if SegmentedFile.isComplete( self.mFilenameCounts ):
+            self.readCounts( self.mFilenameCounts )
+        else:
+            filenames = [ self.getFilenameCounts( chunk ) for chunk in range( self.mNumChunks ) ]
+            for filename in filenames:
+                if not SegmentedFile.isComplete( filename ):
+                    self.info( "file %s is incomplete - merging aborted" % filename )
+                    return False
+            for filename in filenames:
+                self.readCounts( filename )
+
         self.mNumChunks = 1
-        self.readPreviousData( self.mFilenameData )
         self.finish()
-            
+
+        for filename in SegmentedFile.getParts( self.mFilenameCounts ):
+            os.remove( filename )
+
         return True
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 import sys, os, re, time, math, copy
 
+import numpy
+
 from AddaModule import AddaModuleRecord
 import SegmentedFile
 
@@ -37,6 +39,8 @@ class AddaGraph( AddaModuleRecord ):
     """
     
     mName = "Graph"
+
+    mNeighboursFormat = "array"
     
     def __init__(self, *args, **kwargs ):
 
@@ -81,52 +85,68 @@ class AddaGraph( AddaModuleRecord ):
                 self.mContinueAt = None
             return
 
-        if len(neighbours.mMatches) == 0:
+        matches = neighbours.mMatches
+
+        if len(matches) == 0:
             return
         
-        self.mNLinksInput += len(neighbours.mMatches)
+        self.mNLinksInput += len(matches)
         
         if self.mMergeRepeats:
-            matches = []
-            neighbours.mMatches.sort( lambda x,y: cmp( \
-                    (x.mSbjctToken, x.mQueryFrom), (y.mSbjctToken, y.mQueryFrom )))
-            last = neighbours.mMatches[0]
-            
-            for match in neighbours.mMatches[1:]:
-                if match.mSbjctToken == last.mSbjctToken and \
-                    0 < match.mQueryFrom - last.mQueryTo <= self.mMinDomainSize and \
-                    0 < match.mSbjctFrom - last.mSbjctTo <= self.mMinDomainSize: 
-                    self.mNJoined += 1
-                    last.mEvalue = min( match.mEvalue, last.mEvalue )
-                    self.debug( "joining: %s:%s-%s %s:%s-%s with %s:%s-%s %s:%s-%s" %\
-                                    (last.mQueryToken, last.mQueryFrom, last.mQueryTo,
-                                     last.mSbjctToken, last.mSbjctFrom, last.mSbjctTo,
-                                     match.mQueryToken, match.mQueryFrom, match.mQueryTo,
-                                     match.mSbjctToken, match.mSbjctFrom, match.mSbjctTo))
-                    
-                else:   
-                    matches.append(last)
-                    last = match
-                    continue
-                    
-                last.mQueryTo = max(last.mQueryTo, match.mQueryTo)
-                last.mSbjctTo = max(last.mSbjctTo, match.mSbjctTo)                
-                
-            matches.append(last)
-                 
+            # stable sort by sbjct and query start
+            matches = matches[numpy.lexsort( (matches["query_start"], matches["sbjct_nid"]) )]
+            sbjcts = matches["sbjct_nid"]
+
+            # only merge if there are several matches to the same sbjct
+            if numpy.any( sbjcts[1:] == sbjcts[:-1] ):
+                matches = self.mergeRepeats( nid, matches.tolist() )
+            else:
+                matches = matches.tolist()
         else:
-            neighbours.mMatches.sort( lambda x,y: cmp( x.mSbjctToken, y.mSbjctToken ))
-            matches = neighbours.mMatches()
+            matches = matches[numpy.argsort( matches["sbjct_nid"], kind = "mergesort" )].tolist()
             
         self.mNLinksOutput += len(matches)
-        for m in matches:
-            self.mOutfile.write( "%s\t%s\t%f\t%i\t%i\t%i\t%i\n" % \
-                                     ( m.mQueryToken, 
-                                       m.mSbjctToken, 
-                                       m.mEvalue,
-                                       m.mQueryFrom, m.mQueryTo,
-                                       m.mSbjctFrom, m.mSbjctTo ) )    
-            self.mOutfile.flush()
+
+        self.mOutfile.write( "".join( \
+                [ "%s\t%s\t%f\t%i\t%i\t%i\t%i\n" % \
+                      ( nid, sbjct_nid, evalue, 
+                        query_from, query_to, 
+                        sbjct_from, sbjct_to ) \
+                      for sbjct_nid, evalue, query_from, query_to, sbjct_from, sbjct_to in matches ] ) )
+        self.mOutfile.flush()
+
+    def mergeRepeats(self, nid, matches ):
+        """merge consecutive *matches*.
+
+        *matches* is a list of tuples sorted by sbjct and query start.
+        """
+
+        result = []
+        last = list(matches[0])
+
+        for match in matches[1:]:
+            sbjct_nid, evalue, query_from, query_to, sbjct_from, sbjct_to = match
+            if sbjct_nid == last[0] and \
+                0 < query_from - last[3] <= self.mMinDomainSize and \
+                0 < sbjct_from - last[5] <= self.mMinDomainSize: 
+                self.mNJoined += 1
+                last[1] = min( evalue, last[1] )
+                self.debug( "joining: %s:%s-%s %s:%s-%s with %s:%s-%s %s:%s-%s" %\
+                                (nid, last[2], last[3],
+                                 last[0], last[4], last[5],
+                                 nid, query_from, query_to,
+                                 sbjct_nid, sbjct_from, sbjct_to))
+                
+            else:   
+                result.append(last)
+                last = list(match)
+                continue
+                
+            last[3] = max(last[3], query_to)
+            last[5] = max(last[5], sbjct_to)                
+                
+        result.append(last)
+        return result
 
     def readPreviousData(self, filename ):
         """process existing output in filename to guess correct point to continue computation."""
@@ -1,9 +1,12 @@
-import sys, os, re, time, types, gzip, shelve, collections
+import sys, os, re, time, types, gzip, shelve, collections, array
 import alignlib
+import numpy
 from ConfigParser import ConfigParser as PyConfigParser
 import Experiment as E
 import fileinput
 import cadda
+import DomainStore
+import NidMap
 
 class ConfigParser( PyConfigParser ):
     """config parser with defaults."""
@@ -47,6 +50,65 @@ def openStream( filename ):
     else:
         return open( filename, "r" )
 
+def getShardBoundary( infile, position ):
+    """return the position of the first query after *position* in *infile*.
+
+    The query is the first column of a line. The boundary is the start
+    of the first line after all lines of the query of the first complete
+    line after *position*. As boundaries only depend on *position*,
+    neighbouring shards agree on them.
+    """
+    infile.seek( 0, 2 )
+    size = infile.tell()
+    if position <= 0: return 0
+    if position >= size: return size
+
+    infile.seek( position )
+    infile.readline()
+    line = infile.readline()
+    if not line: return size
+    query = line[:line.find("\t")]
+
+    while 1:
+        pos = infile.tell()
+        line = infile.readline()
+        if not line or line[:line.find("\t")] != query: return pos
+
+class FileShard:
+    """the lines of a file between byte positions *start* and *end*."""
+
+    def __init__(self, filename, start, end ):
+        self.mInfile = open( filename, "r" )
+        self.mInfile.seek( start )
+        self.mEnd = end
+
+    def readline( self ):
+        if self.mInfile.tell() >= self.mEnd: return ""
+        return self.mInfile.readline()
+
+    def __iter__( self ):
+        while 1:
+            line = self.readline()
+            if not line: break
+            yield line
+
+    def close( self ):
+        self.mInfile.close()
+
+def openShard( filename, nshards, shard ):
+    """open part *shard* of *nshards* of the uncompressed file *filename*.
+
+    The file is split into parts of about equal size. Parts are split
+    between queries, so that all lines of a query are in the same part.
+    The lines of a query need to be consecutive.
+    """
+    infile = open( filename, "r" )
+    size = os.path.getsize( filename )
+    start = getShardBoundary( infile, size * shard // nshards )
+    end = getShardBoundary( infile, size * (shard + 1) // nshards )
+    infile.close()
+    return FileShard( filename, start, end )
+
 # class NeighbourRecordPairsdb:
 #     """a pairwise alignment.
 
@@ -214,6 +276,42 @@ class NeighboursRecord:
         self.mQueryToken = token
         self.mMatches = matches
 
+class NeighboursArray:
+    """neighbours of a query as a numpy array of type 
+    :data:`cadda.NeighbourDtype`.
+
+    The alignment strings are kept in separate lists and are only
+    set if they have been requested.
+    """
+    def __init__(self, token, matches = None, query_alis = None, sbjct_alis = None ):
+        self.mQueryToken = token
+        if matches is None:
+            matches = numpy.zeros( 0, dtype = cadda.NeighbourDtype )
+        self.mMatches = matches
+        self.mQueryAlis = query_alis
+        self.mSbjctAlis = sbjct_alis
+
+def getNeighbours( index, nid, format = "records" ):
+    """return neighbours of *nid* in :class:`cadda.IndexedNeighbours` *index*.
+
+    *format* is one of
+    ``records``
+       a :class:`NeighboursRecord` with a list of neighbour objects.
+    ``array``
+       a :class:`NeighboursArray` without alignment strings.
+    ``alignments``
+       a :class:`NeighboursArray` with alignment strings.
+    """
+    if format == "records":
+        return NeighboursRecord( nid, index.getNeighbours( nid ) )
+    elif format == "array":
+        return NeighboursArray( nid, index.getNeighboursArray( nid ) )
+    elif format == "alignments":
+        matches, query_alis, sbjct_alis = index.getNeighboursArray( nid, alignments = True )
+        return NeighboursArray( nid, matches, query_alis, sbjct_alis )
+    else:
+        raise ValueError( "unknown neighbours format %s" % format )
+
 # class NeighboursIterator:
 
 #     def __init__(self, f, map_id2nid = None, *args, **kwargs):
@@ -370,6 +468,24 @@ def readMapId2Nid( infile, storage = "memory" ):
 
     return m
 
+def openMapId2Nid( filename ):
+    """open map between identifiers and nids for the table of
+    nids in filename.
+
+    The map is a :class:`NidMap.NidMap`. It is built by the 
+    sequences step and created from the table if it does not exist
+    or is older than the table.
+    """
+    filename_map = NidMap.getFileName( filename )
+    if not os.path.exists( filename_map ) or \
+            os.path.getmtime( filename_map ) < os.path.getmtime( filename ):
+        E.info( "building map between identifiers and nids in %s" % filename_map )
+        infile = open( filename, "r" )
+        NidMap.buildNidMap( infile, filename_map )
+        infile.close()
+
+    return NidMap.NidMap( filename_map )
+
 def readMapPid2Nid( infile, storage = "memory" ):
     """read map from adda.nids file.
 
@@ -406,65 +522,96 @@ def readMapNid2Domains( infile,
     
     Only include families matching the regulare expression rx_include.
 
+    If map_id2nid is given, the domains are stored in a
+    :class:`DomainStore.DomainStore` indexed by nid. Otherwise,
+    a dictionary indexed by identifier is returned.
+
     If storage is not ``memory``, file based storage is assumed
     with the argument giving the filename. If the file does not
-    exist, it is created and the dictionary filled and None is 
-    returned.
+    exist, the domain store is created and saved. None is 
+    returned. Use :func:`DomainStore.loadDomainStore` to open
+    the file.
     """
 
+    if storage != "memory" and not map_id2nid:
+        raise ValueError( "file based storage of domains requires map_id2nid" )
+
+    if storage != "memory" and os.path.exists( storage ):
+        return None
+
     domain_boundaries = {}
 
+    # domains for the domain store
+    nids, families, starts, ends = array.array("l"), array.array("i"), array.array("i"), array.array("i")
+    family_ids, family_names = {}, []
+
     if rx_include: rx_include = re.compile( rx_include )
     
     ninput, nskipped_nid, nskipped_family, ndomains = 0, 0, 0, 0
 
-    # build dict in memory and then save to disc
-    if storage == "memory" or not os.path.exists( storage ):
-
-        for line in infile:
-            if line[0] == "#": continue
-            if line.startswith("nid"): continue
-            if line.startswith("id"): continue
-            if line.startswith("pid"): continue
-
-            ninput += 1
-            token, start, end, family = line[:-1].split( "\t" )[:4]
-
-            if map_id2nid:
-                try:
-                    token = bytes(map_id2nid[token])
-                except KeyError:
-                    nskipped_nid += 1
-                    continue
-            else:
-                token = bytes(token)
-
-            if rx_include and not rx_include.search( family): 
-                nskipped_family += 1
+    for line in infile:
+        if line[0] == "#": continue
+        if line.startswith("nid"): continue
+        if line.startswith("id"): continue
+        if line.startswith("pid"): continue
+
+        ninput += 1
+        token, start, end, family = line[:-1].split( "\t" )[:4]
+
+        if map_id2nid:
+            try:
+                nid = map_id2nid[token]
+            except KeyError:
+                nskipped_nid += 1
                 continue
-
-            family, start, end = bytes(family), int(start), int(end)
-            if token not in domain_boundaries:
-                a = { family : [ (start, end) ] }
-                domain_boundaries[token] = a
+        else:
+            token = bytes(token)
+
+        if rx_include and not rx_include.search( family): 
+            nskipped_family += 1
+            continue
+
+        family, start, end = bytes(family), int(start), int(end)
+        ndomains += 1
+
+        if map_id2nid:
+            try:
+                family_id = family_ids[family]
+            except KeyError:
+                family_id = family_ids[family] = len(family_names)
+                family_names.append( family )
+            nids.append( nid )
+            families.append( family_id )
+            starts.append( start )
+            ends.append( end )
+            continue
+
+        if token not in domain_boundaries:
+            a = { family : [ (start, end) ] }
+            domain_boundaries[token] = a
+        else:
+            a = domain_boundaries[token]
+            if family not in a:
+                a[family] = [ (start, end) ]
             else:
-                a = domain_boundaries[token]
-                if family not in a:
-                    a[family] = [ (start, end) ]
-                else:
-                    a[family].append( (start,end) )
-            ndomains += 1
+                a[family].append( (start,end) )
+
+    if map_id2nid:
+        def _toArray( a, dtype ):
+            if len(a) == 0: return numpy.zeros( 0, dtype = dtype )
+            return numpy.frombuffer( a, dtype = dtype )
+        domain_boundaries = DomainStore.buildDomainStore( _toArray( nids, numpy.int_ ),
+                                                          _toArray( families, numpy.intc ),
+                                                          _toArray( starts, numpy.intc ),
+                                                          _toArray( ends, numpy.intc ),
+                                                          family_names )
+        del nids, families, starts, ends
             
-        E.info( "read domain information: nsequences=%i, ndomains=%i, ninput=%i, nskipped_nid=%i, nskipped_family=%i" %\
-                    (len(domain_boundaries), ndomains, ninput, nskipped_nid, nskipped_family))
+    E.info( "read domain information: nsequences=%i, ndomains=%i, ninput=%i, nskipped_nid=%i, nskipped_family=%i" %\
+                (len(domain_boundaries), ndomains, ninput, nskipped_nid, nskipped_family))
         
-        if storage != "memory":
-            d = shelve.open( storage, "n" )
-            for k,n in domain_boundaries.iteritems():
-                d[k] = n
-            d.close()
-    
     if storage != "memory":
+        domain_boundaries.save( storage )
         return None
     else:
         return domain_boundaries
@@ -496,3 +643,36 @@ def toTuple( domain ):
 def toDomain( tple ):
     '''convert a domain tuple to a string.'''
     return "%s_%s_%s" % tple
+
+class DomainKeys:
+    '''map domains of the form nid_start_end to 64-bit integer keys.
+
+    As in the vertex table of the minimum spanning tree, the nid is
+    stored in the upper 32 bits and start and end in 16 bits each.
+    Domains that do not fit are numbered with negative keys.
+    '''
+
+    def __init__(self):
+        self.mOtherKeys = {}
+        self.mOtherDomains = []
+
+    def getKey( self, domain ):
+        '''return the key of domain.'''
+        try:
+            nid, start, end = map( int, domain.split("_") )
+        except ValueError:
+            nid, start, end = -1, 0, 0
+
+        if 0 <= nid < 2147483648 and 0 <= start < 65536 and 0 <= end < 65536:
+            return (nid << 32) | (start << 16) | end
+
+        if domain not in self.mOtherKeys:
+            self.mOtherDomains.append( domain )
+            self.mOtherKeys[domain] = -len(self.mOtherDomains)
+        return self.mOtherKeys[domain]
+
+    def getDomain( self, key ):
+        '''return the domain for key.'''
+        key = int(key)
+        if key < 0: return self.mOtherDomains[-key-1]
+        return "%i_%i_%i" % (key >> 32, (key >> 16) & 0xffff, key & 0xffff)
@@ -36,6 +36,15 @@ class AddaIndex( AddaModuleBlock ):
 
         self.mAlignmentFormat = self.mConfig.get( "input", "graph_format", "pairsdb")
 
+        self.mGraphCodec = self.mConfig.get( "adda", "graph_codec", "zlib" )
+        self.mGraphLevel = self.mConfig.get( "adda", "graph_level", 9 )
+        self.mGraphChunkSize = self.mConfig.get( "adda", "graph_chunk_size", 4194304 )
+
+        # index the graph in shards of disjoint queries. Multiple input 
+        # files are always indexed separately.
+        self.mIndexShards = self.mConfig.get( "adda", "index_shards", 1 )
+        self.mSharded = self.mIndexShards > 1 and "," not in self.mFilenameInputGraph
+
         if self.mAlignmentFormat == "pairsdb":
             self.mGraphIterator = cadda.PairsDBNeighbourIteratorEmissions
         elif self.mAlignmentFormat == "pairsdb-blocks":
@@ -77,27 +86,60 @@ class AddaIndexBuild( AddaIndex ):
         """
         self.info( "indexing of %s started" % self.mFilenameInputGraph )
 
-        self.info( "loading map_id2nid from %s" % self.mConfig.get( "output", "nids", "adda.nids" ))
-        infile = open( self.mConfig.get( "output", "nids", "adda.nids" ) )
-        map_id2nid = AddaIO.readMapId2Nid( infile, 
-                                           storage = self.mConfig.get( "adda", "storage_nids", "memory" ) )
-        infile.close()
-    
-        infile = AddaIO.openStream( self.mFilenameInputGraph )
+        filename_nids = self.mConfig.get( "output", "nids", "adda.nids" )
+        self.info( "loading map_id2nid from %s" % filename_nids )
 
-        cadda.indexGraph( cadda.PairsDBNeighboursIterator( 
-                self.mGraphIterator( infile, map_id2nid, self.mLogger ), self.mLogger ),
+        if self.mSharded:
+            # shards share the memory mapped map instead of each
+            # building a dictionary of all identifiers
+            map_id2nid = AddaIO.openMapId2Nid( filename_nids )
+        else:
+            # a dictionary is used, as there are several look-ups per line of the graph
+            map_id2nid = AddaIO.openMapId2Nid( filename_nids ).getDict()
+
+        if not self.mSharded:
+            infile = AddaIO.openStream( self.mFilenameInputGraph )
+            graph_iterator = self.mGraphIterator( infile, map_id2nid, self.mLogger )
+        elif self.mFilenameInputGraph.endswith( ".gz" ):
+            # compressed input can not be split, so each shard
+            # decompresses the whole graph and skips other nids
+            infile = AddaIO.openStream( self.mFilenameInputGraph )
+            nid_range = self.getNidRange( len(map_id2nid) )
+            self.info( "indexing shard %i/%i: nids %i to %i" % \
+                           (self.mChunk, self.mNumChunks, nid_range[0], nid_range[1] - 1) )
+            graph_iterator = self.mGraphIterator( infile, map_id2nid, self.mLogger,
+                                                  nid_range = nid_range )
+        else:
+            infile = AddaIO.openShard( self.mFilenameInputGraph, self.mNumChunks, self.mChunk )
+            self.info( "indexing shard %i/%i: bytes %i to %i" % \
+                           (self.mChunk, self.mNumChunks, infile.mInfile.tell(), infile.mEnd ) )
+            graph_iterator = self.mGraphIterator( infile, map_id2nid, self.mLogger )
+
+        cadda.indexGraph( cadda.PairsDBNeighboursIterator( graph_iterator, self.mLogger ),
                           len(map_id2nid), 
                           self.mFilenameOutputGraph, 
                           self.mFilenameOutputIndex, 
-                          self.mLogger )
+                          self.mLogger,
+                          codec = self.mGraphCodec,
+                          level = self.mGraphLevel,
+                          chunk_size = self.mGraphChunkSize )
 
         del map_id2nid
 
+    def getNidRange( self, num_nids ):
+        '''return the half-open range of nids indexed in this shard.
+
+        The nids 1 to *num_nids* are split into contiguous ranges
+        of equal size.
+        '''
+        return ( 1 + (num_nids * self.mChunk) // self.mNumChunks,
+                 1 + (num_nids * (self.mChunk + 1)) // self.mNumChunks )
+
     def merge( self ):
         '''merge several runs.
         
-        simply concatenate all files and reindex
+        concatenate all files and merge their indices. If an index
+        of a part is missing, the concatenated graph is reindexed.
         '''
 
         f = self.mFilenameOutputGraph
@@ -111,7 +153,7 @@ class AddaIndexBuild( AddaIndex ):
         self.info( "merging file %s from %i chunks" % (f, self.mNumChunks) )
 
         # check if all parts have finished and are present
-        ff = []
+        ff, fi = [], []
 
         for chunk in range( self.mNumChunks ):
             fn = f + self.getSlice( chunk )
@@ -119,27 +161,32 @@ class AddaIndexBuild( AddaIndex ):
                 self.info("file %s is not present - merging aborted" % fn )
                 return False
             ff.append( fn )
+            fi.append( self.mFilenameOutputIndex + self.getSlice( chunk ) )
 
         self.info( "all files present" )
 
-        ff = " ".join( ff )
-        self.execute( "cat %s > %s" % (ff,f) )
-
-        self.info( "rebuilding index" )
+        self.execute( "cat %s > %s" % (" ".join(ff),f) )
 
         self.info( "loading map_id2nid from %s" % self.mConfig.get( "output", "nids", "adda.nids" ))
-        infile = open( self.mConfig.get( "output", "nids", "adda.nids" ) )
-        map_id2nid = AddaIO.readMapId2Nid( infile, 
-                                           storage = self.mConfig.get( "adda", "storage_nids", "memory" ) )
-        infile.close()
-
-        self.info( "starting the indexing" )
-
-        cadda.reindexGraph( 
-            len(map_id2nid), 
-            self.mFilenameOutputGraph, 
-            self.mFilenameOutputIndex, 
-            self.mLogger )
+        map_id2nid = AddaIO.openMapId2Nid( self.mConfig.get( "output", "nids", "adda.nids" ) )
+
+        if min( [ os.path.exists( x ) for x in fi ] ):
+            self.info( "merging indices" )
+
+            cadda.mergeIndices( 
+                len(map_id2nid), 
+                ff,
+                fi,
+                self.mFilenameOutputIndex, 
+                self.mLogger )
+        else:
+            self.info( "rebuilding index" )
+
+            cadda.reindexGraph( 
+                len(map_id2nid), 
+                self.mFilenameOutputGraph, 
+                self.mFilenameOutputIndex, 
+                self.mLogger )
 
         return True
 
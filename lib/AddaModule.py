@@ -91,7 +91,9 @@ class AddaModule:
         ## set in child constructors
         self.mIsComplete = False
 
-        self.mTemporaryDirectory = self.mConfig.get( "adda", "tempdir", "." )
+        ## the documented key is tmpdir, tempdir is accepted for older configurations
+        self.mTemporaryDirectory = self.mConfig.get( "adda", "tmpdir", 
+                                                     self.mConfig.get( "adda", "tempdir", "." ) )
 
         self.mMapId2Nid = kwargs.get( "map_id2nid", None )
         self.mMapNid2Domains = kwargs.get( "map_nid2domains", None )
@@ -360,6 +362,10 @@ class AddaModuleRecord( AddaModule ):
     Classes derived from this class implement parallel steps.
     """
 
+    # format of the neighbours passed to applyMethod, see
+    # AddaIO.getNeighbours
+    mNeighboursFormat = "records"
+
     def __init__(self, *args, **kwargs ):
         AddaModule.__init__(self, *args, **kwargs )
 
@@ -24,8 +24,13 @@ class AddaMst( AddaModuleBlock ):
                 
         self.mFilenameDomainGraph = self.mConfig.get( "output", "domaingraph", "adda.domaingraph.gz" )
         self.mFilenameMst = self.mConfig.get( "output", "mst", "adda.mst" )
+
+        # sort edges with `native` code or with the `external` sort utility
+        self.mSortMethod = self.mConfig.get( "mst", "sort", "native" )
+        self.mSortMemory = self.mConfig.get( "mst", "sort_memory", 1000 )
                 
         cadda.setLogLevel( self.mLogLevel )
+        cadda.setMstSortMemory( self.mSortMemory )
         # cadda.setReportStep( 1 )
 
         self.mFilenames = ( self.mFilenameMst, )
@@ -44,6 +49,24 @@ class AddaMst( AddaModuleBlock ):
         cadda.dump_parameters()
         
         tmpdir = tempfile.mkdtemp( dir = self.mTemporaryDirectory )
+
+        if self.mSortMethod == "native":
+            noutput = cadda.sort_build_mst( self.mFilenameMst, self.mFilenameDomainGraph, tmpdir )
+        elif self.mSortMethod == "external":
+            noutput = self.buildMstExternal( tmpdir )
+        else:
+            raise ValueError( "unknown sort method %s" % self.mSortMethod )
+
+        if noutput == 0:
+            self.warn( "mst construction failed" )
+        else:
+            self.info( "mst construction success: %i links output" % noutput )
+
+        shutil.rmtree( tmpdir )
+
+    def buildMstExternal( self, tmpdir ):
+        """sort the domain graph with the sort utility and build the mst."""
+
         tmpfile = os.path.join( tmpdir, "sorted" )
 
         if not os.path.exists( tmpfile ):
@@ -66,11 +89,4 @@ class AddaMst( AddaModuleBlock ):
         else:
             self.info( "skipping sorting, because sorted output already exists" )                
             
-        noutput = cadda.build_mst( self.mFilenameMst, tmpfile )
-        
-        if noutput == 0:
-            self.warn( "mst construction failed" )
-        else:
-            self.info( "mst construction success: %i links output" % noutput )
-
-        shutil.rmtree( tmpdir )
+        return cadda.build_mst( self.mFilenameMst, tmpfile )
@@ -65,6 +65,15 @@ class AddaOptimise( AddaModuleBlock ):
         self.mFilenameNids = self.mConfig.get( "output", "nids" )    
         self.mFilenameDomains = self.mConfig.get( "output", "domains" )
         self.mMaxIterations = int( self.mConfig.get( "optimise", "iterations" ) )   
+        self.mNumThreads = self.mConfig.get( "optimise", "num_threads", 1 )
+
+        # keep merged links in memory between iterations
+        self.mLinkCache = self.mConfig.get( "optimise", "link_cache", False )
+        self.mLinkCacheMemory = self.mConfig.get( "optimise", "link_cache_memory", 1000 )
+        self.mFilenameLinkCache = self.mFilenameDomains + ".links"
+
+        # only optimise sequences whose neighbourhood changed
+        self.mIncremental = self.mConfig.get( "optimise", "incremental", False )
         self.mResolution = float( self.mConfig.get( "optimise", "resolution" ) )   
         self.mMinAbsImprovement = float(self.mConfig.get( "optimise", "min_abs_improvement" ))
         self.mMinRelImprovement = float(self.mConfig.get( "optimise", "min_rel_improvement" ))
@@ -120,6 +129,11 @@ class AddaOptimise( AddaModuleBlock ):
         cadda.setLogLevel( self.mLogLevel )
         cadda.setReportStep( 1000 )
         cadda.setMaxIterations( self.mMaxIterations )
+        cadda.setNumThreads( self.mNumThreads )
+        cadda.setLinkCache( self.mLinkCache )
+        cadda.setLinkCacheMemory( self.mLinkCacheMemory )
+        cadda.setFilenameLinkCache( self.mFilenameLinkCache )
+        cadda.setIncremental( self.mIncremental )
         cadda.setResolution( self.mResolution )
         cadda.setExponentialF( self.mExponentialF )
         cadda.setExponentialE( self.mExponentialE )
@@ -1,5 +1,6 @@
 import sys, os, re, time, glob
 
+import numpy
 import alignlib
 import ProfileLibrary
 
@@ -21,6 +22,8 @@ class AddaProfiles( AddaModuleRecord ):
     """
     
     mName = "Profiles"
+
+    mNeighboursFormat = "alignments"
     
     def __init__(self, *args, **kwargs ):
 
@@ -61,6 +64,10 @@ class AddaProfiles( AddaModuleRecord ):
 
     def buildMali(self, query_nid, neighbours ):
         """build a multiple alignment from a set of neighbours.
+
+        *neighbours* is a :class:`AddaIO.NeighboursArray`. If it 
+        does not contain alignment strings, the sequences are 
+        re-aligned.
         """
         # build multiple alignment
         mali = alignlib.makeMultipleAlignment()
@@ -73,41 +80,54 @@ class AddaProfiles( AddaModuleRecord ):
         alignator = alignlib.makeAlignatorDPFull( alignlib.ALIGNMENT_LOCAL, 
                                                   -10, -2)
 
-        nskipped = 0
+        matches = neighbours.mMatches[:self.mMaxNumNeighbours]
+        nconsidered = len(matches)
 
-        for n in neighbours[:self.mMaxNumNeighbours]:
+        # select links to other sequences below the evalue threshold
+        selected = numpy.flatnonzero( matches["sbjct_nid"] != query_nid )
+        passed = matches["evalue"][selected].astype( numpy.float64 ) <= self.mMaxEvalue
+        nskipped = len(selected) - numpy.sum( passed )
+        selected = selected[passed]
 
-            if n.mSbjctToken == query_nid: continue
-            if n.mEvalue > self.mMaxEvalue: 
-                nskipped += 1
-                continue
-            sequence = self.mFasta.getSequence( n.mSbjctToken )
+        rows = matches.tolist()
 
-            E.debug( "adding %s" % str(n) )
+        # fetch all sbjct sequences in a single pass over the database
+        sequences = self.mFasta.getSequences( [ rows[x][0] for x in selected ] )
 
-            map_query2sbjct = n.getAlignment()
+        for x, sequence in zip( selected, sequences ):
 
-            if map_query2sbjct == None:
+            sbjct_nid, evalue, query_from, query_to, sbjct_from, sbjct_to = rows[x]
+            n = "\t".join( map(str, (query_nid,) + rows[x] ) )
+
+            E.debug( "adding %s" % n )
+
+            map_query2sbjct = alignlib.makeAlignmentVector()
+
+            if neighbours.mQueryAlis is not None:
+                f = alignlib.AlignmentFormatEmissions()
+                f.mRowFrom, f.mRowTo, f.mRowAlignment = query_from, query_to, neighbours.mQueryAlis[x]
+                f.mColFrom, f.mColTo, f.mColAlignment = sbjct_from, sbjct_to, neighbours.mSbjctAlis[x]
+                f.copy( map_query2sbjct )
+            else:
                 sseq = alignlib.makeSequence( sequence )
-                qseq.useSegment( n.mQueryFrom, n.mQueryTo )
-                sseq.useSegment( n.mSbjctFrom, n.mSbjctTo )
-                map_query2sbjct = alignlib.makeAlignmentVector()
+                qseq.useSegment( query_from, query_to )
+                sseq.useSegment( sbjct_from, sbjct_to )
                 alignator.align( map_query2sbjct, qseq, sseq )
 
             if map_query2sbjct.getLength() == 0:
-                self.warn( "empty alignment: %s" % str( n ) )
+                self.warn( "empty alignment: %s" % n )
                 nskipped += 1
                 continue
 
             if map_query2sbjct.getRowTo() > len(query_sequence):
                 self.warn( "alignment out of bounds for query: %i>%i, line=%s" %\
-                               (map_query2sbjct.getRowTo(), len(query_sequence), str(n)))
+                               (map_query2sbjct.getRowTo(), len(query_sequence), n))
                 nskipped += 1
                 continue
 
             elif map_query2sbjct.getColTo() > len(sequence):
                 self.warn( "alignment out of bounds for sbjct: %i>%i, line=%s" %\
-                               (map_query2sbjct.getColTo(), len(sequence), str(n)))
+                               (map_query2sbjct.getColTo(), len(sequence), n))
                 nskipped += 1
                 continue
 
@@ -120,7 +140,7 @@ class AddaProfiles( AddaModuleRecord ):
                           use_end_mali = True,
                           use_end_alignatum = False )
             except RuntimeError, msg:
-                self.warn( "problem when building alignment for %s: msg=%s" % (str(n), msg))
+                self.warn( "problem when building alignment for %s: msg=%s" % (n, msg))
                 nskipped += 1
                 continue
 
@@ -139,7 +159,7 @@ class AddaProfiles( AddaModuleRecord ):
         if nskipped > 0:
             self.warn( "nid %s: %i/%i alignments skipped" % (str(query_nid),
                                                              nskipped,
-                                                             min( len(neighbours), self.mMaxNumNeighbours ) ) )
+                                                             nconsidered ) )
             
         return mali
 
@@ -165,7 +185,7 @@ class AddaProfiles( AddaModuleRecord ):
 
         self.debug( "working on profile %s with %i neighbours" % (query_nid, len(neighbours.mMatches) ) )
 
-        mali = self.buildMali( query_nid, neighbours.mMatches )
+        mali = self.buildMali( query_nid, neighbours )
 
         self.debug( "built mali for %s with %i neighbours" % (query_nid, len(neighbours.mMatches) ) )
         
@@ -194,7 +214,7 @@ class AddaProfiles( AddaModuleRecord ):
 
             for nid in sorted(nids):
                 if nid not in self.mProfileLibrary:
-                    self.applyMethod( AddaIO.NeighboursRecord( nid, [] ) )
+                    self.applyMethod( AddaIO.NeighboursArray( nid ) )
                     nadded += 1
                 
             self.mOutput += nadded
@@ -214,33 +234,23 @@ class AddaProfiles( AddaModuleRecord ):
         
         infiles = glob.glob( "%s*" % self.mFilenameProfile )
         # remove suffixes
-        infiles = list(set([ x[:-4] for x in infiles if x != self.mFilenameProfile ]))
+        infiles = list(set([ x[:-4] for x in infiles if x[:-4] != self.mFilenameProfile ]))
         infiles.sort()
 
-        last_nid = None
-        found = set()
-        ninput, noutput, nfound, nunknown, nduplicate = 0, 0, 0, 0, 0
         tokens = set(self.mFasta.keys())
 
-        self.mProfileLibrary = ProfileLibrary.ProfileLibrary( self.mFilenameProfile,
-                                                              "w" )
+        # concatenate the parts without parsing the profiles
+        ninput, noutput, duplicates = ProfileLibrary.mergeLibraries( self.mFilenameProfile,
+                                                                      infiles,
+                                                                      force = True )
+        for nid in duplicates:
+            self.warn("duplicate nid: %s" % str(nid) )
 
-        for filename in infiles:
-            infile = ProfileLibrary.ProfileLibrary( filename, "r" )
+        found = set( ProfileLibrary.ProfileLibrary( self.mFilenameProfile, "r" ).keys() )
 
-            for nid, profile in infile.iteritems_sorted():
-                ninput += 1
-                
-                if nid in found:
-                    nduplicates += 1
-                    self.warn("duplicate nid: %i in file %s" % (nid, filename))
-                if nid not in tokens:
-                    nunknown += 1
-                    self.warn("unknown nid: %i in file %s" % (nid, filename))
-                found.add(nid)
-                nfound += 1
-                self.mProfileLibrary.add( nid, profile )
-                noutput += 1
+        unknown = found.difference( tokens )
+        for nid in unknown:
+            self.warn("unknown nid: %s" % str(nid) )
 
         missing = tokens.difference( found ) 
         if len(missing) > 0:
@@ -248,17 +258,23 @@ class AddaProfiles( AddaModuleRecord ):
             
         self.info( "adding %i missing nids" % len(missing))
         
-        for nid in missing:
-            self.applyMethod( AddaIO.NeighboursRecord( nid, [] ) )
+        if missing:
+            self.mProfileLibrary = ProfileLibrary.ProfileLibrary( self.mFilenameProfile, "a" )
+            for nid in sorted(missing):
+                self.applyMethod( AddaIO.NeighboursArray( nid ) )
+            self.mProfileLibrary.close()
 
+        nduplicate, nunknown = len(duplicates), len(unknown)
         self.info( "merging: parts=%i, ninput=%i, noutput=%i, nfound=%i, nmissing=%i, nduplicate=%i, nunknown=%i" %\
-                       (len(infiles), ninput, noutput, nfound, len(missing), nduplicate, nunknown ) )
+                       (len(infiles), ninput, noutput, len(found), len(missing), nduplicate, nunknown ) )
 
         self.info( "deleting %i parts" % len(infiles) )
         for infile in infiles:
             fn, fi = ProfileLibrary.getFileNames( infile )
             os.remove( fn )
             os.remove( fi )
+            fb = ProfileLibrary.getBinaryIndexName( infile )
+            if os.path.exists( fb ): os.remove( fb )
         
         return len(missing) == 0 and nduplicate == 0 and nunknown == 0
 
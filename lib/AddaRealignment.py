@@ -54,10 +54,10 @@ class AddaRealignment( AddaModuleRecord ):
         alignator = alignlib.makeAlignatorDPFull( alignlib.ALIGNMENT_GLOBAL, 
                                                   -10.0, -1.0, True, True, True, True)
 
-        for n in neighbours.mMatches:
+        matches = [ n for n in neighbours.mMatches if n.mSbjctToken != query_nid ]
+        sequences = self.mFasta.getSequences( [ n.mSbjctToken for n in matches ] )
 
-            if n.mSbjctToken == query_nid: continue
-            sequence = self.mFasta.getSequence( n.mSbjctToken )
+        for n, sequence in zip( matches, sequences ):
 
             blast_query2sbjct = n.getAlignment()
 
@@ -35,6 +35,8 @@ class AddaSegment( AddaModuleRecord ):
 
     mName = "Segment"
 
+    mNeighboursFormat = "array"
+
     def __init__(self, *args, **kwargs ):
         
         AddaModuleRecord.__init__( self, *args, **kwargs )
@@ -49,6 +51,7 @@ class AddaSegment( AddaModuleRecord ):
         self.add_local_bias =  self.mConfig.get('segments','matrix_add_local_bias', False )
         self.permute_matrix =  self.mConfig.get('segments','permute', False )
         self.matrix_multiply = int(self.mConfig.get('segments','multiply', 0))
+        self.matrix_dtype = numpy.dtype( self.mConfig.get('segments','matrix_dtype', 'int64') )
         self.max_sequence_length = self.mConfig.get("adda", "max_sequence_length")
 
         if self.normalize_matrix:
@@ -678,6 +681,51 @@ class AddaSegment( AddaModuleRecord ):
         
         return self.collapseTree( covering_tree )
     
+    #-----------------------------------------------------------------------------------------------------
+    def getIntervals( self,
+                      lsequence, 
+                      neighbours ):
+        """return the rows and scaled query ranges of the alignments
+        in *neighbours*. 
+
+        See :meth:`buildMatrix` for the assignment of alignments to rows
+        and for the scaling by resolution. Row 0 is the query, which is 
+        not part of the returned intervals.
+
+        returns a tuple of (number of rows, query_length, rows, starts, ends).
+        """
+        query_length = int( math.ceil(float(lsequence) / self.resolution ))
+
+        # stable sort by query start
+        matches = neighbours.mMatches
+        matches = matches[numpy.argsort( matches["query_start"], kind = "mergesort" )]
+
+        if self.combine_repeats:
+            # number sbjcts in the order of their first occurance. Note 
+            # that numbering starts at 0, so the first sbjct shares
+            # the row with the query.
+            sbjcts, first, inverse = numpy.unique( matches["sbjct_nid"],
+                                                   return_index = True,
+                                                   return_inverse = True )
+            order = numpy.zeros( len(sbjcts), numpy.int )
+            order[numpy.argsort( first )] = numpy.arange( len(sbjcts) )
+            rows = order[inverse]
+            nneighbours = len(sbjcts)
+        else:
+            rows = numpy.arange( 1, len(matches) + 1 )
+            nneighbours = len(matches)
+
+        # add query sequence
+        nneighbours += 1
+
+        yfrom = numpy.floor( matches["query_start"] / self.resolution ).astype( numpy.int )
+        yto   = numpy.ceil( matches["query_end"] / self.resolution ).astype( numpy.int )
+        yfrom = numpy.minimum( yfrom, query_length )
+        yto   = numpy.minimum( yto, query_length )
+        valid = yfrom < yto
+
+        return nneighbours, query_length, rows[valid], yfrom[valid], yto[valid]
+
     #-----------------------------------------------------------------------------------------------------
     def buildMatrix( self,
                      query_nid, 
@@ -709,65 +757,107 @@ class AddaSegment( AddaModuleRecord ):
         
         """
 
-        query_length = int( math.ceil(float(lsequence) / self.resolution ))
-
-        nindex = {}
-
-        neighbours.mMatches.sort( key = lambda x: x.mQueryFrom )
-    
-        nneighbours = 0
-        if self.combine_repeats:
-            for neighbour in neighbours.mMatches:
-                if not nindex.has_key(neighbour.mSbjctToken):
-                    nindex[neighbour.mSbjctToken] = nneighbours
-                    nneighbours += 1
-        else:
-            nneighbours = len(neighbours)
+        nneighbours, query_length, rows, yfrom, yto = self.getIntervals( lsequence, neighbours )
 
         # build matrix and add query sequence
-        nneighbours += 1
         matrix = numpy.zeros( (nneighbours, query_length), numpy.int)    
         matrix[0, 0:query_length] = 1
-        row = 1
-        
-        for n in neighbours.mMatches:
 
-            if self.combine_repeats:
-                use_row = nindex[n.mSbjctToken]
-            else:
-                use_row = row
-                row += 1
-    
-            yfrom = int(math.floor(n.mQueryFrom/self.resolution))
-            yto   = int(math.ceil(n.mQueryTo/self.resolution)) 
-            matrix[use_row, yfrom:yto] = 1
+        # enter all ranges at once: mark starts and ends of segments 
+        # and fill by a cumulative sum along each row.
+        delta = numpy.zeros( (nneighbours, query_length + 1), numpy.int )
+        numpy.add.at( delta, (rows, yfrom), 1 )
+        numpy.add.at( delta, (rows, yto), -1 )
+        matrix[numpy.cumsum( delta, axis = 1 )[:,:query_length] > 0] = 1
                 
         return matrix
     
+    #-----------------------------------------------------------------------------------------------------
+    def buildCoverageMatrix( self,
+                             query_nid, 
+                             lsequence, 
+                             neighbours,
+                             intervals = None ):
+        """build the co-coverage matrix of the query residues.
+
+        Element x_ij counts the rows of the matrix of :meth:`buildMatrix`
+        that cover both residue i and j. The result is the same as the
+        dot product of the transposed matrix with itself, but is computed
+        from the alignment ranges without building the matrix.
+
+        The matrix is accumulated with type ``segments:matrix_dtype``.
+        *intervals* are the result of :meth:`getIntervals`. They are 
+        computed if not given.
+
+        returns a tuple of (number of rows, matrix).
+        """
+
+        if intervals is None: intervals = self.getIntervals( lsequence, neighbours )
+        nneighbours, query_length, rows, yfrom, yto = intervals
+
+        # add query sequence
+        rows = numpy.append( 0, rows )
+        yfrom = numpy.append( 0, yfrom )
+        yto = numpy.append( query_length, yto )
+        
+        # merge overlapping ranges within a row. The ranges of each row are
+        # shifted by an offset so that coordinates increase from row to row.
+        offset = rows * (query_length + 1)
+        order = numpy.lexsort( (yfrom, rows) )
+        rows, starts, ends = rows[order], (yfrom + offset)[order], (yto + offset)[order]
+        reach = numpy.maximum.accumulate( ends )
+        first = numpy.ones( len(starts), numpy.bool )
+        first[1:] = starts[1:] > reach[:-1]
+        first = numpy.flatnonzero( first )
+        last = numpy.append( first[1:], len(starts) ) - 1
+        rows = rows[first]
+        starts = starts[first] - rows * (query_length + 1)
+        ends = reach[last] - rows * (query_length + 1)
+
+        # each pair of ranges (a,b) within a row adds one to the block a x b. 
+        # Blocks are entered as corners into a difference array.
+        counts = numpy.bincount( rows )
+        group_starts = numpy.cumsum( counts ) - counts
+        repeats = counts[rows]
+        a = numpy.repeat( numpy.arange( len(rows) ), repeats )
+        b = numpy.repeat( group_starts[rows], repeats ) + \
+            numpy.arange( len(a) ) - numpy.repeat( numpy.cumsum( repeats ) - repeats, repeats )
+
+        matrix = numpy.zeros( (query_length + 1, query_length + 1), self.matrix_dtype )
+        numpy.add.at( matrix, (starts[a], starts[b]), 1 )
+        numpy.add.at( matrix, (starts[a], ends[b]), -1 )
+        numpy.add.at( matrix, (ends[a], starts[b]), -1 )
+        numpy.add.at( matrix, (ends[a], ends[b]), 1 )
+        numpy.cumsum( matrix, axis = 0, out = matrix )
+        numpy.cumsum( matrix, axis = 1, out = matrix )
+
+        return nneighbours, matrix[:query_length,:query_length]
+    
     #--------------------------------------------------------------------------
     def getTree( self, nid, lsequence, neighbours):
         
-        ## retrieve blast matrix
-        ## make sure, add_self is 1, so that there are no empty columns
-        ## todo
-        blast_matrix = self.buildMatrix( nid, lsequence, neighbours )
-        
-        self.debug( "blast matrix for %s: %s" % (nid, str(blast_matrix.shape)))
-
-        if E.getLogLevel() >= 3:
-            MatlabTools.WriteMatrix(blast_matrix, 
-                                    outfile=open("blast_%s.matrix" % nid, "w"),
-                                    format = "%i" )
-    
-        nneighbours, lmatrix = blast_matrix.shape
+        intervals = self.getIntervals( lsequence, neighbours )
+        nneighbours = intervals[0]
 
         self.debug( "rows in blast matrix for %s: %s" % (nid, str(nneighbours))) 
     
         if nneighbours < int(self.mConfig.get("segments", "min_neighbours")):
             return []
+
+        ## calculate dot product of the blast matrix directly 
+        ## from the alignments
+        nneighbours, dot_matrix = self.buildCoverageMatrix( nid, lsequence, neighbours, intervals )
+        lmatrix = dot_matrix.shape[0]
         
-        ## calculate dot product of the matrix
-        dot_matrix = numpy.dot( numpy.transpose( blast_matrix ), blast_matrix, )
+        self.debug( "blast matrix for %s: %s" % (nid, str((nneighbours, lmatrix))))
+
+        if E.getLogLevel() >= 3:
+            MatlabTools.WriteMatrix(self.buildMatrix( nid, lsequence, neighbours ),
+                                    outfile=open("blast_%s.matrix" % nid, "w"),
+                                    format = "%i" )
+
+        ## residues covered in each column of the blast matrix
+        coverage = numpy.diagonal( dot_matrix ).copy()
 
         if E.getLogLevel() >= 3:
             self.debug( "correlation matrix for %s: %s" % (nid, str(dot_matrix.shape)))            
@@ -787,7 +877,7 @@ class AddaSegment( AddaModuleRecord ):
             self.addLocalBiasToMatrix( dot_matrix )
     
         if self.normalize_matrix:
-            dot_matrix = self.normalizeMatrix( dot_matrix, numpy.sum( blast_matrix, axis=0) )
+            dot_matrix = self.normalizeMatrix( dot_matrix, coverage )
 
         if E.getLogLevel() >= 3:
             self.debug( "work matrix for %s: %s" % (nid, str(dot_matrix.shape)))            
@@ -826,13 +916,105 @@ class AddaSegment( AddaModuleRecord ):
     
         return tree
 
+    #-------------------------------------------------------------------------
+    def buildSummedAreaTable( self, matrix ):
+        """return the summed-area table of *matrix*.
+
+        The table has one more row and column than *matrix*. 
+        ``table[i,j]`` is the sum of ``matrix[:i,:j]``. Sums
+        are accumulated as 64 bit integers or floats.
+        """
+        nrows, ncols = matrix.shape
+        if matrix.dtype.kind == "f":
+            dtype = numpy.float64
+        else:
+            dtype = numpy.int64
+        table = numpy.zeros( (nrows + 1, ncols + 1), dtype )
+        table[1:,1:] = numpy.cumsum( numpy.cumsum( matrix, axis = 0, dtype = dtype ), axis = 1 )
+        return table
+
+    #-------------------------------------------------------------------------
+    def getSeparation( self, matrix, xfrom, xto ):
+        """return separation values for splits of matrix in interval
+        (xfrom, xto) computed by summing over sub-matrices.
+
+        See :meth:`splitMatrix`.
+        """
+        l = xto - xfrom 
+        I = numpy.zeros( l, numpy.float )
+    
+        for x in range(xfrom+1, xto-1):
+    
+            i11 = float(numpy.sum(numpy.sum(matrix[xfrom:x,xfrom:x])))
+            i22 = float(numpy.sum(numpy.sum(matrix[x:xto,x:xto])))
+            i12 = float(numpy.sum(numpy.sum(matrix[xfrom:x,x:xto] )))
+            i21 = i12
+    
+            row1 = i11 + i12
+            row2 = i21 + i22
+            col1 = i11 + i21
+            col2 = i12 + i22
+    
+            l1 = x-xfrom
+            l2 = xto - x
+    
+            a = i11 * i22 - i21 * i12
+    
+            n = row1 * row2 * col1 * col2
+            if n > 0.0:
+                I[l1] = a * a / n
+            else:
+                I[l1] = 0.0
+
+            self.debug( "%i\t%i\t%i\t%i\t%i\t%i\t%f" % (x, l1, l2, i11, i22, i12, I[l1]))
+
+        return I
+
+    #-------------------------------------------------------------------------
+    def getSeparationFromTable( self, table, xfrom, xto ):
+        """return separation values for splits of matrix in interval
+        (xfrom, xto) computed from the summed-area *table* of the matrix.
+
+        All splits are evaluated at once. For matrices of integer 
+        counts the sums are exact and the values are the same as 
+        those of :meth:`getSeparation`.
+        """
+        l = xto - xfrom 
+        I = numpy.zeros( l, numpy.float )
+        if l < 3: return I
+
+        x = numpy.arange( xfrom+1, xto-1 )
+        
+        i11 = (table[x,x] - table[xfrom,x] - table[x,xfrom] + table[xfrom,xfrom]).astype( numpy.float )
+        i22 = (table[xto,xto] - table[x,xto] - table[xto,x] + table[x,x]).astype( numpy.float )
+        i12 = (table[x,xto] - table[xfrom,xto] - table[x,x] + table[xfrom,x]).astype( numpy.float )
+        i21 = i12
+
+        row1 = i11 + i12
+        row2 = i21 + i22
+        col1 = i11 + i21
+        col2 = i12 + i22
+
+        a = i11 * i22 - i21 * i12
+
+        n = row1 * row2 * col1 * col2
+        valid = n > 0.0
+        I[x[valid] - xfrom] = a[valid] * a[valid] / n[valid]
+
+        if self.mLogger.getLogger().isEnabledFor( logging.DEBUG ):
+            for y in range( len(x) ):
+                self.debug( "%i\t%i\t%i\t%i\t%i\t%i\t%f" % (x[y], x[y] - xfrom, xto - x[y], 
+                                                            i11[y], i22[y], i12[y], I[x[y] - xfrom]))
+        return I
+
     #-------------------------------------------------------------------------
     def splitMatrix( self,
                      nid,
                      matrix,
                      interval,
                      level,
-                     map_row_new2old = None ):
+                     map_row_new2old = None,
+                     table = None ):
         """
         calculate objective function for matrix in interval
 
@@ -855,6 +1037,11 @@ class AddaSegment( AddaModuleRecord ):
 
             I[x] = (i11*i22-i21*i12)**2 * total / row&col-sums
             I[x] = mu[x]/F[x]
+
+        For integer matrices, the sums are taken from a summed-area
+        *table* that is computed once and passed on to the recursive 
+        calls. Floating point matrices are summed directly, as 
+        differences of prefix sums are not exact.
         """
         xfrom, xto = interval
         l = xto - xfrom 
@@ -865,32 +1052,13 @@ class AddaSegment( AddaModuleRecord ):
         self.debug( "x\tlleft\tlright\ti11\ti22\ti12\tval" )
  
         ## 1. build Interfaces
-        I = numpy.zeros( l, numpy.float )
-    
-        for x in range(xfrom+1, xto-1):
-    
-            i11 = float(numpy.sum(numpy.sum(matrix[xfrom:x,xfrom:x])))
-            i22 = float(numpy.sum(numpy.sum(matrix[x:xto,x:xto])))
-            i12 = float(numpy.sum(numpy.sum(matrix[xfrom:x,x:xto] )))
-            i21 = i12
-    
-            row1 = i11 + i12
-            row2 = i21 + i22
-            col1 = i11 + i21
-            col2 = i12 + i22
-    
-            l1 = x-xfrom
-            l2 = xto - x
-    
-            a = i11 * i22 - i21 * i12
-    
-            n = row1 * row2 * col1 * col2
-            if n > 0.0:
-                I[l1] = a * a / n
-            else:
-                I[l1] = 0.0
+        if table is None and matrix.dtype.kind in "iub":
+            table = self.buildSummedAreaTable( matrix )
 
-            self.debug( "%i\t%i\t%i\t%i\t%i\t%i\t%f" % (x, l1, l2, i11, i22, i12, I[l1]))
+        if table is not None:
+            I = self.getSeparationFromTable( table, xfrom, xto )
+        else:
+            I = self.getSeparation( matrix, xfrom, xto )
 
         ## 2. split at maximum
         if self.r_min_distance_border and l > 2 * self.r_min_distance_border:
@@ -914,7 +1082,8 @@ class AddaSegment( AddaModuleRecord ):
                                           matrix,
                                           (xfrom, pos),
                                           level+1,
-                                          map_row_new2old))]
+                                          map_row_new2old,
+                                          table ))]
     
     
         if (l - xmax) > self.r_min_domain_size:
@@ -924,7 +1093,8 @@ class AddaSegment( AddaModuleRecord ):
                                           matrix,
                                           (pos,xto),
                                           level+1,
-                                          map_row_new2old))]
+                                          map_row_new2old,
+                                          table ))]
             
         return result
     
@@ -969,8 +1139,7 @@ if __name__ == "__main__":
     args = map(int, args)
 
     for nid in args:
-        neighbours = index.getNeighbours( nid )
-        module.applyMethod( AddaIO.NeighboursRecord( nid, neighbours )) 
+        module.applyMethod( AddaIO.getNeighbours( index, nid, module.mNeighboursFormat ) )
                       
     module.finish
 
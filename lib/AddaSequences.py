@@ -7,6 +7,7 @@ from AddaModule import AddaModuleBlock
 import AddaIO
 import IndexedFasta
 import SegmentedFile
+import NidMap
 
 class FastaRecord:
     def __init__(self, title, sequence ):
@@ -62,9 +63,12 @@ class AddaSequences( AddaModuleBlock ):
        ``files:input_fasta``
     
     output
-       ``files:output_fasta``: the reformatted sequence database.
+       ``files:output_fasta``: the reformatted sequence database. The
+          storage format is set by ``adda:fasta_method``.
 
-       ``files:adda.nids``: a table with sequence information.
+       ``files:adda.nids``: a table with sequence information. A map between
+          identifiers and nids is saved in ``adda.nids.index`` 
+          (:class:`NidMap.NidMap`).
 
           nid
              new numerical sequence identifier
@@ -88,6 +92,7 @@ class AddaSequences( AddaModuleBlock ):
         self.mFilenameNids = self.mConfig.get( "output", "nids", "adda.nids" )  
         self.mFilenameInputFasta = self.mConfig.get( "input", "fasta" )
         self.mFilenameOutputFasta = self.mConfig.get( "output", "fasta", "adda" )
+        self.mFastaMethod = self.mConfig.get( "adda", "fasta_method", "uncompressed" )
         self.mMaxSequenceLength = self.mConfig.get( "segments", "max_sequence_length", 10000 )
 
         self.mFilenames = (self.mFilenameNids, )
@@ -104,11 +109,14 @@ class AddaSequences( AddaModuleBlock ):
 
         # use existing fasta file
         iterator = FastaIterator( AddaIO.openStream( self.mFilenameInputFasta) )
-        fasta = IndexedFasta.IndexedFasta( self.mFilenameOutputFasta, "w" )
+        fasta = IndexedFasta.IndexedFasta( self.mFilenameOutputFasta, "w", 
+                                           method = self.mFastaMethod )
 
         outfile = self.openOutputStream(self.mFilenameNids)
         outfile.write( "nid\tpid\thid\tlength\tsequence\n" )
 
+        nidmap = NidMap.NidMapBuilder( NidMap.getFileName( self.mFilenameNids ) )
+
         nid = 1
         hids = set()
         
@@ -127,11 +135,14 @@ class AddaSequences( AddaModuleBlock ):
             hids.add(hid)
             outfile.write( "%s\t%s\t%s\t%i\t%s\n" % (nid, seq.pid, hid, len(seq.sequence), seq.sequence) )
             fasta.addSequence( nid, seq.sequence )
+            nidmap.add( seq.pid, nid )
             nid += 1
             self.mOutput += 1
 
         fasta.close()
+        # close the map last, so that it is not older than the table
         outfile.close()
+        nidmap.close()
 
     def finish(self):
         
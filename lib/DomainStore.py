@@ -0,0 +1,163 @@
+import numpy
+
+MAGIC = "ADDADOM1"
+
+# header: magic, number of nids, number of domains, size of family names
+HEADER_DTYPE = numpy.dtype( [ ("magic", "S8"),
+                              ("num_nids", "<i8"),
+                              ("num_domains", "<i8"),
+                              ("families_size", "<i8") ] )
+
+class DomainStore(object):
+    """domain boundaries of reference domains.
+
+    Domains are grouped by nid in compressed sparse row layout:
+    the domains of a nid are at positions ``offsets[nid]`` to
+    ``offsets[nid+1]`` of the arrays of family ids, starts and ends.
+    Family names are interned and stored only once.
+
+    A store is saved as a single file. Loaded stores map the file
+    into memory, so that processes share the same pages.
+
+    The store supports the dictionary interface used for the
+    reference domains: ``store[nid]`` returns a dictionary mapping
+    each family to a list of (start, end) tuples. Nids can be
+    given as integers or strings.
+    """
+
+    def __init__(self, offsets, families, starts, ends, family_names ):
+
+        self.mOffsets = offsets
+        self.mFamilies = families
+        self.mStarts = starts
+        self.mEnds = ends
+        self.mFamilyNames = family_names
+
+        self.mNumSequences = int(numpy.count_nonzero( numpy.diff( offsets ) ))
+
+    def __len__(self):
+        return self.mNumSequences
+
+    def __contains__(self, nid):
+        nid = int(nid)
+        return 0 <= nid < len(self.mOffsets) - 1 and \
+            self.mOffsets[nid] < self.mOffsets[nid+1]
+
+    def __getitem__(self, nid):
+        domains = self.getDomains( nid )
+        if domains is None: raise KeyError( nid )
+
+        result = {}
+        families, starts, ends = domains
+        for family, start, end in zip( families.tolist(), starts.tolist(), ends.tolist() ):
+            family = self.mFamilyNames[family]
+            if family not in result: result[family] = [ (start, end) ]
+            else: result[family].append( (start, end) )
+        return result
+
+    def __iter__(self):
+        for nid in numpy.flatnonzero( numpy.diff( self.mOffsets ) ):
+            yield bytes(nid)
+
+    def get(self, nid, default = None):
+        try:
+            return self[nid]
+        except KeyError:
+            return default
+
+    def getDomains( self, nid ):
+        '''return arrays of family ids, starts and ends of the domains of nid.
+
+        returns None if there are no domains for nid.
+        '''
+        nid = int(nid)
+        if nid < 0 or nid >= len(self.mOffsets) - 1: return None
+        start, end = self.mOffsets[nid], self.mOffsets[nid+1]
+        if start == end: return None
+        return self.mFamilies[start:end], self.mStarts[start:end], self.mEnds[start:end]
+
+    def getFamilyName( self, family ):
+        '''return the name of family with numeric identifier family.'''
+        return self.mFamilyNames[family]
+
+    def getNumFamilies( self ):
+        '''return the number of families.'''
+        return len(self.mFamilyNames)
+
+    def save( self, filename ):
+        '''save store in filename.'''
+
+        names = "\n".join( self.mFamilyNames )
+
+        header = numpy.zeros( 1, dtype = HEADER_DTYPE )
+        header["magic"] = MAGIC
+        header["num_nids"] = len(self.mOffsets) - 1
+        header["num_domains"] = len(self.mStarts)
+        header["families_size"] = len(names)
+
+        outfile = open( filename, "wb" )
+        outfile.write( header.tostring() )
+        outfile.write( self.mOffsets.astype( "<i8" ).tostring() )
+        outfile.write( self.mFamilies.astype( "<i4" ).tostring() )
+        outfile.write( self.mStarts.astype( "<i4" ).tostring() )
+        outfile.write( self.mEnds.astype( "<i4" ).tostring() )
+        outfile.write( names )
+        outfile.close()
+
+def buildDomainStore( nids, families, starts, ends, family_names ):
+    '''build a :class:`DomainStore` from sequences of nids,
+    family ids, starts and ends.
+
+    The order of domains of the same nid is preserved.
+    '''
+    nids = numpy.asarray( nids, dtype = numpy.int64 )
+    order = numpy.argsort( nids, kind = "mergesort" )
+
+    if len(nids): num_nids = nids.max() + 1
+    else: num_nids = 0
+
+    offsets = numpy.zeros( num_nids + 1, dtype = numpy.int64 )
+    numpy.cumsum( numpy.bincount( nids, minlength = num_nids ), out = offsets[1:] )
+
+    return DomainStore( offsets,
+                        numpy.asarray( families, dtype = numpy.int32 )[order],
+                        numpy.asarray( starts, dtype = numpy.int32 )[order],
+                        numpy.asarray( ends, dtype = numpy.int32 )[order],
+                        list(family_names) )
+
+def loadDomainStore( filename ):
+    '''load a :class:`DomainStore` from filename.
+
+    The arrays are mapped into memory read-only.
+    '''
+    header = numpy.fromfile( filename, dtype = HEADER_DTYPE, count = 1 )
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError( "%s is not a domain store" % filename )
+
+    num_nids = int(header["num_nids"][0])
+    num_domains = int(header["num_domains"][0])
+    families_size = int(header["families_size"][0])
+
+    def _map( dtype, offset, size ):
+        if size == 0: return numpy.zeros( 0, dtype = dtype )
+        return numpy.memmap( filename, dtype = dtype, mode = "r", offset = offset, shape = (size,) )
+
+    offset = HEADER_DTYPE.itemsize
+    offsets = _map( "<i8", offset, num_nids + 1 )
+    offset += 8 * (num_nids + 1)
+    families = _map( "<i4", offset, num_domains )
+    offset += 4 * num_domains
+    starts = _map( "<i4", offset, num_domains )
+    offset += 4 * num_domains
+    ends = _map( "<i4", offset, num_domains )
+    offset += 4 * num_domains
+
+    infile = open( filename, "rb" )
+    infile.seek( offset )
+    names = infile.read( families_size )
+    infile.close()
+
+    if names: family_names = names.split( "\n" )
+    else: family_names = []
+
+    return DomainStore( offsets, families, starts, ends, family_names )
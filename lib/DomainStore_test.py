@@ -0,0 +1,77 @@
+import unittest, os, glob, re, tempfile, gzip
+
+import DomainStore
+
+class TestDomainStore(unittest.TestCase):
+
+    # nid, family, start, end - nids are not sorted
+    mDomains = ( (3, 0, 10, 20),
+                 (1, 1, 0, 50),
+                 (3, 1, 30, 40),
+                 (1, 1, 60, 90),
+                 (7, 2, 5, 15),
+                 )
+    mFamilyNames = ( "fam0", "fam1", "fam2" )
+
+    def setUp(self):
+        fd, self.mFilename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        if os.path.exists(self.mFilename):
+            os.remove( self.mFilename )
+
+    def build( self ):
+        nids, families, starts, ends = zip( *self.mDomains )
+        return DomainStore.buildDomainStore( nids, families, starts, ends, self.mFamilyNames )
+
+    def checkStore( self, store ):
+        self.assertEqual( len(store), 3 )
+        self.assertEqual( store.getNumFamilies(), 3 )
+        self.assertEqual( store.getFamilyName( 2 ), "fam2" )
+        self.assertEqual( store[1], { "fam1" : [ (0, 50), (60, 90) ] } )
+        self.assertEqual( store[3], { "fam0" : [ (10, 20) ], "fam1" : [ (30, 40) ] } )
+        self.assertEqual( store[7], { "fam2" : [ (5, 15) ] } )
+        self.assertEqual( sorted( list(store) ), ["1", "3", "7"] )
+
+    def testBuild( self ):
+        self.checkStore( self.build() )
+
+    def testSaveLoad( self ):
+        self.build().save( self.mFilename )
+        self.checkStore( DomainStore.loadDomainStore( self.mFilename ) )
+
+    def testStringNids( self ):
+        store = self.build()
+        for nid in (1, 3, 7):
+            self.assertTrue( str(nid) in store )
+            self.assertEqual( store[str(nid)], store[nid] )
+
+    def testMissing( self ):
+        store = self.build()
+        for nid in (0, 2, 8, -1, 1000):
+            self.assertFalse( nid in store )
+            self.assertRaises( KeyError, store.__getitem__, nid )
+            self.assertEqual( store.get( nid ), None )
+            self.assertEqual( store.getDomains( nid ), None )
+        self.assertEqual( store.get( 2, {} ), {} )
+
+    def testEmpty( self ):
+        store = DomainStore.buildDomainStore( [], [], [], [], [] )
+        self.assertEqual( len(store), 0 )
+        self.assertEqual( list(store), [] )
+        self.assertFalse( 0 in store )
+        store.save( self.mFilename )
+        store = DomainStore.loadDomainStore( self.mFilename )
+        self.assertEqual( len(store), 0 )
+        self.assertEqual( store.getNumFamilies(), 0 )
+        self.assertEqual( store.get( 1 ), None )
+
+    def testBadFile( self ):
+        outfile = open( self.mFilename, "w" )
+        outfile.write( "nid\tfamily\n" )
+        outfile.close()
+        self.assertRaises( ValueError, DomainStore.loadDomainStore, self.mFilename )
+
+if __name__ == '__main__':
+    unittest.main()
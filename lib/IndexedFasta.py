@@ -38,7 +38,10 @@ import math
 import random
 import zlib
 import gzip
+import mmap
+import collections
 import cStringIO
+import numpy
 
 ##------------------------------------------------------------
 class SArray(array.array):
@@ -323,10 +326,31 @@ def createDatabase( db,
             for val in vals:
                 outfile_index.write( "%s\t%s\n" % (key, val) )
 
+# header of the index of binary databases: magic, size of the
+# offset and length arrays, number of sequences
+BINARY_MAGIC = "ADDASEQ1"
+BINARY_HEADER_DTYPE = numpy.dtype( [ ("magic", "S8"),
+                                     ("num_slots", "<i8"),
+                                     ("num_sequences", "<i8") ] )
+
+# header of the index of block compressed databases. The binary
+# header is followed by the number of blocks and the block size.
+BLOCKS_MAGIC = "ADDABSQ1"
+BLOCKS_HEADER_DTYPE = numpy.dtype( [ ("magic", "S8"),
+                                     ("num_slots", "<i8"),
+                                     ("num_sequences", "<i8"),
+                                     ("num_blocks", "<i8"),
+                                     ("block_size", "<i8") ] )
+
+# methods storing sequences by nid in binary format
+BINARY_METHODS = ("binary", "blocks")
+
 # map of names
 # order is suffix data, suffix index, noSeek
 NAME_MAP={
+    'binary'       : ('seq',   'sdx', False),
     'uncompressed' : ('fasta', 'idx', False),
+    'blocks'       : ('bsq',   'bdx', False),
     'lzo'          : ('lzo',   'cdx', True ),    
     'dictzip'      : ('dz',    'idx', False ),
     'zlib'         : ('zlib',  'cdx', True ),
@@ -334,14 +358,32 @@ NAME_MAP={
     'debug'        : ('debug', 'cdx', True ),
     }
 
-PREFERENCES=('uncompressed', 'lzo', 'dictzip', 'zlib', 'gzip', 'debug')
+PREFERENCES=('binary', 'uncompressed', 'blocks', 'lzo', 'dictzip', 'zlib', 'gzip', 'debug')
 
 class IndexedFasta:
+    """an indexed sequence database.
+
+    With the ``binary`` method, sequences are identified by
+    integer nids. The sequences are packed back-to-back into a 
+    single data file and the index consists of two arrays with the
+    offset and length of each sequence, indexed by nid. Both files
+    are mapped into memory read-only, so that processes working
+    on the same database share pages and sequence look-ups do not
+    require system calls.
+
+    The ``blocks`` method stores the packed sequences in zlib 
+    compressed blocks of about *block_size* bytes. Sequences do
+    not span blocks, so that a sequence is obtained by inflating a 
+    single block. The last *cache_size* inflated blocks are kept
+    in memory.
+    """
 
-    def __init__( self, dbname, mode="r", method ="uncompressed" ):
+    def __init__( self, dbname, mode="r", method ="uncompressed",
+                  block_size = 65536, cache_size = 16 ):
 
         self.mOutfileIndex = None
         self.mOutfileFasta = None
+        self.mMethod = method
         
         if mode == "r":
             for x in PREFERENCES:
@@ -371,11 +413,25 @@ class IndexedFasta:
                 raise ValueError( "database %s already exists." % self.mDbname )
             if os.path.exists( self.mNameIndex ):
                 raise ValueError( "database index %s already exists." % self.mNameIndex )
-            self.mOutfileIndex = open(self.mNameIndex, "w")
-            self.mOutfileFasta = open(self.mDbname, "w")
+            if method in BINARY_METHODS:
+                self.mOutfileIndex = open(self.mNameIndex, "wb")
+                self.mOutfileFasta = open(self.mDbname, "wb")
+                self.mBinaryNids = array.array( "l" )
+                self.mBinaryOffsets = array.array( "l" )
+                self.mBinaryLengths = array.array( "l" )
+                self.mBinaryOffset = 0
+                self.mBlockSize = block_size
+                self.mBlock = []
+                self.mBlockStarts = array.array( "l", [0] )
+                self.mBlockOffsets = array.array( "l", [0] )
+            else:
+                self.mOutfileIndex = open(self.mNameIndex, "w")
+                self.mOutfileFasta = open(self.mDbname, "w")
 
         self.mIsLoaded = False
         self.mSynonyms = {} 
+        self.mCacheSize = cache_size
+        self.mCache = collections.OrderedDict()
 
     def __getitem__(self, key ):
         """return full length sequence."""
@@ -386,20 +442,24 @@ class IndexedFasta:
 
         assert self.mCreateMode == False, "asked to read from database opened for writing"
 
-        if self.mMethod == "uncompressed":
+        if self.mMethod in BINARY_METHODS:
+            self.__loadBinaryIndex()
+            return
+        elif self.mMethod == "uncompressed":
             self.mDatabaseFile = open( self.mDbname, "r" )
         elif self.mMethod == "dictzip":
             import dictzip
-            self.mDatabaseFile = dictzip.GzipFile( self.mNameDb)
+            self.mDatabaseFile = dictzip.GzipFile( self.mDbname )
         elif self.mMethod == "lzo":
             import lzo
-            self.mDatabaseFile = Uncompressor( self.mNameDb, lzo.decompress )
+            self.mDatabaseFile = Uncompressor( self.mDbname, lzo.decompress )
         elif self.mMethod == "gzip":
-            self.mDatabaseFile = Uncompressor( self.mNameDb, gzip_demangler )
+            self.mDatabaseFile = Uncompressor( self.mDbname, gzip_demangler )
         elif self.mMethod == "zlib":
-            self.mDatabaseFile = Uncompressor( self.mNameDb, zlib.decompress )
-        elif eslf.mMethod == "bz2":
-            self.mDatabaseFile = bz2.BZ2File( self.mNameDb  )
+            self.mDatabaseFile = Uncompressor( self.mDbname, zlib.decompress )
+        elif self.mMethod == "bz2":
+            import bz2
+            self.mDatabaseFile = bz2.BZ2File( self.mDbname )
         elif self.mMethod == "debug":
             self.mDatabaseFile = Uncompressor( self.mDbname + ".debug", lambda x: x )            
 
@@ -421,8 +481,101 @@ class IndexedFasta:
                     
         self.mIsLoaded = True
 
+    def __loadBinaryIndex( self ):
+        """map binary database and index into memory."""
+
+        if self.mMethod == "blocks":
+            header_dtype, magic = BLOCKS_HEADER_DTYPE, BLOCKS_MAGIC
+        else:
+            header_dtype, magic = BINARY_HEADER_DTYPE, BINARY_MAGIC
+
+        header = numpy.fromfile( self.mNameIndex, dtype = header_dtype, count = 1 )
+        if len(header) == 0 or header["magic"][0] != magic:
+            raise ValueError( "%s is not a %s sequence index" % (self.mNameIndex, self.mMethod) )
+
+        def _map( offset, size ):
+            if size == 0: return numpy.zeros( 0, dtype = numpy.int64 )
+            return numpy.memmap( self.mNameIndex, dtype = "<i8", mode = "r",
+                                 offset = offset, shape = (size,) )
+
+        num_slots = int(header["num_slots"][0])
+        offset = header_dtype.itemsize
+        self.mOffsets = _map( offset, num_slots )
+        offset += 8 * num_slots
+        self.mLengths = _map( offset, num_slots )
+        offset += 8 * num_slots
+
+        if self.mMethod == "blocks":
+            # uncompressed start and position in file of each block
+            num_blocks = int(header["num_blocks"][0])
+            self.mBlockStarts = _map( offset, num_blocks + 1 )
+            offset += 8 * (num_blocks + 1)
+            self.mBlockOffsets = _map( offset, num_blocks + 1 )
+
+        self.mNids = numpy.flatnonzero( self.mLengths >= 0 )
+
+        self.mDatabaseFile = open( self.mDbname, "rb" )
+        if os.path.getsize( self.mDbname ) > 0:
+            self.mData = mmap.mmap( self.mDatabaseFile.fileno(), 0, access = mmap.ACCESS_READ )
+        else:
+            self.mData = ""
+
+        self.mIsLoaded = True
+
+    def __getBinaryEntry( self, nid ):
+        """return offset and length of sequence nid in binary database."""
+        try:
+            x = int(nid)
+        except ValueError:
+            raise KeyError( "%s not in index" % str(nid) )
+        if x < 0 or x >= len(self.mLengths) or self.mLengths[x] < 0:
+            raise KeyError( "%s not in index" % str(nid) )
+        return int(self.mOffsets[x]), int(self.mLengths[x])
+
+    def __readBinary( self, start, end ):
+        """return data in range start:end of a binary database.
+
+        For block compressed databases, start:end must be within
+        a single block.
+        """
+        if self.mMethod == "binary":
+            return self.mData[start:end]
+        if start >= end: return ""
+
+        block = int(numpy.searchsorted( self.mBlockStarts, start, "right" )) - 1
+        block_start = int(self.mBlockStarts[block])
+        return self.__getBlock( block )[start - block_start:end - block_start]
+
+    def __getBlock( self, block ):
+        """return inflated block, using the cache of recently used blocks."""
+        data = self.mCache.pop( block, None )
+        if data is None:
+            data = zlib.decompress( self.mData[int(self.mBlockOffsets[block]):int(self.mBlockOffsets[block+1])] )
+            if len(self.mCache) >= self.mCacheSize:
+                self.mCache.popitem( last = False )
+        self.mCache[block] = data
+        return data
+
     def addSequence( self, identifier, sequence ):
 
+        if self.mMethod in BINARY_METHODS:
+            self.mBinaryNids.append( int(identifier) )
+            self.mBinaryOffsets.append( self.mBinaryOffset )
+            self.mBinaryLengths.append( len(sequence) )
+            self.mBinaryOffset += len(sequence)
+            if self.mMethod == "binary":
+                self.mOutfileFasta.write( sequence )
+                return
+
+            # start a new block unless sequence fits into current block
+            if self.mBlock and \
+                    self.mBinaryOffset - self.mBlockStarts[-1] > self.mBlockSize:
+                self.writeBlock( self.mBinaryOffset - len(sequence) )
+            self.mBlock.append( sequence )
+            if self.mBinaryOffset - self.mBlockStarts[-1] >= self.mBlockSize:
+                self.writeBlock( self.mBinaryOffset )
+            return
+
         identifier_pos = self.mOutfileFasta.tell()
         self.mOutfileFasta.write( ">%s\n" % identifier )
         sequence_pos = self.mOutfileFasta.tell()
@@ -439,25 +592,92 @@ class IndexedFasta:
 
     def close( self ):
         if self.mOutfileFasta: 
+            if self.mMethod == "blocks" and self.mBlock:
+                self.writeBlock( self.mBinaryOffset )
             self.mOutfileFasta.close()
             self.mOutfileFasta = None
         if self.mOutfileIndex: 
-            self.mOutfileIndex.write( "#//\n" )
+            if self.mMethod in BINARY_METHODS:
+                self.writeBinaryIndex()
+            else:
+                self.mOutfileIndex.write( "#//\n" )
             self.mOutfileIndex.close()
             self.mOutfileIndex = None
 
+    def writeBlock( self, end ):
+        """compress and write current block ending at uncompressed position end."""
+        self.mOutfileFasta.write( zlib.compress( "".join( self.mBlock ) ) )
+        self.mBlockStarts.append( end )
+        self.mBlockOffsets.append( self.mOutfileFasta.tell() )
+        self.mBlock = []
+
+    def writeBinaryIndex( self ):
+        """write index of a binary database.
+
+        Slots of nids without sequence have a length of -1.
+        """
+        def _toArray( a ):
+            if len(a) == 0: return numpy.zeros( 0, dtype = numpy.int64 )
+            return numpy.frombuffer( a, dtype = numpy.int_ ).astype( numpy.int64 )
+
+        nids = _toArray( self.mBinaryNids )
+        if len(nids) and nids.min() < 0:
+            raise ValueError( "negative nid %i in binary database" % nids.min() )
+        if len(nids) != len(numpy.unique( nids )):
+            raise ValueError( "duplicate nids in binary database" )
+
+        if len(nids): num_slots = nids.max() + 1
+        else: num_slots = 0
+
+        offsets = numpy.zeros( num_slots, dtype = "<i8" )
+        lengths = numpy.zeros( num_slots, dtype = "<i8" ) - 1
+        offsets[nids] = _toArray( self.mBinaryOffsets )
+        lengths[nids] = _toArray( self.mBinaryLengths )
+
+        if self.mMethod == "blocks":
+            header = numpy.zeros( 1, dtype = BLOCKS_HEADER_DTYPE )
+            header["magic"] = BLOCKS_MAGIC
+            header["num_blocks"] = len(self.mBlockStarts) - 1
+            header["block_size"] = self.mBlockSize
+        else:
+            header = numpy.zeros( 1, dtype = BINARY_HEADER_DTYPE )
+            header["magic"] = BINARY_MAGIC
+
+        header["num_slots"] = num_slots
+        header["num_sequences"] = len(nids)
+
+        self.mOutfileIndex.write( header.tostring() )
+        self.mOutfileIndex.write( offsets.tostring() )
+        self.mOutfileIndex.write( lengths.tostring() )
+
+        if self.mMethod == "blocks":
+            self.mOutfileIndex.write( _toArray( self.mBlockStarts ).astype( "<i8" ).tostring() )
+            self.mOutfileIndex.write( _toArray( self.mBlockOffsets ).astype( "<i8" ).tostring() )
+
     def __len__(self):
         if not self.mIsLoaded: self.__loadIndex()
+        if self.mMethod in BINARY_METHODS: return len(self.mNids)
         return len(self.mIndex)
 
     def __contains__(self, key):
         if not self.mIsLoaded: self.__loadIndex()
+        if self.mMethod in BINARY_METHODS:
+            try:
+                self.__getBinaryEntry( key )
+            except KeyError:
+                return False
+            return True
         return key in self.mIndex
 
     def keys(self):
         if not self.mIsLoaded: self.__loadIndex()
+        if self.mMethod in BINARY_METHODS: return self.mNids.tolist()
         return self.mIndex.keys()
 
+    def getTokens(self):
+        """return list of sequence identifiers."""
+        return self.keys()
+
     def getDatabaseName( self ):
         """returns the name of the database."""
         return self.mDbname
@@ -465,11 +685,14 @@ class IndexedFasta:
     def getLength( self, sbjct_token ):
         """return sequence length for sbjct_token."""
         if not self.mIsLoaded: self.__loadIndex()
+        if self.mMethod in BINARY_METHODS: return self.__getBinaryEntry( sbjct_token )[1]
         return self.mIndex[sbjct_token][2]
 
     def getContigSizes( self ):
         """return hash with contig sizes."""
         if not self.mIsLoaded: self.__loadIndex()
+        if self.mMethod in BINARY_METHODS:
+            return dict( zip( self.mNids.tolist(), self.mLengths[self.mNids].tolist() ) )
         contig_sizes = {}
         for key, val in self.mIndex.items():
             contig_sizes[key] = val[2]
@@ -500,16 +723,19 @@ class IndexedFasta:
         if contig in self.mSynonyms:
             contig = self.mSynonyms[contig]
 
-        if contig not in self.mIndex:
-            raise KeyError, "%s not in index" % contig
-
-        data = self.mIndex[contig]
-        # dummy is
-        # -> pos_seq for seekable streams
-        # -> block_size for unseekable streams
-        pos_id, dummy, lsequence = data[:3]
-        pos_seq = dummy
-        block_size = dummy
+        if self.mMethod in BINARY_METHODS:
+            pos_seq, lsequence = self.__getBinaryEntry( contig )
+        else:
+            if contig not in self.mIndex:
+                raise KeyError, "%s not in index" % contig
+
+            data = self.mIndex[contig]
+            # dummy is
+            # -> pos_seq for seekable streams
+            # -> block_size for unseekable streams
+            pos_id, dummy, lsequence = data[:3]
+            pos_seq = dummy
+            block_size = dummy
         
         if end == 0: end = lsequence
         
@@ -529,9 +755,15 @@ class IndexedFasta:
                 
         assert( first_pos < last_pos )
         
+        if self.mMethod in BINARY_METHODS and not as_array and str(strand) not in ("-", "0", "-1"):
+            return self.__readBinary( pos_seq + first_pos, pos_seq + last_pos )
+
         p = SArray( "c" )
         
-        if self.mNoSeek:
+        if self.mMethod in BINARY_METHODS:
+            ## slice from memory mapped data
+            p.fromstring( self.__readBinary( pos_seq + first_pos, pos_seq + last_pos ) )
+        elif self.mNoSeek:
             ## read directly from position
             p.fromstring( self.mDatabaseFile.read( block_size, data[3], first_pos, last_pos) )
         else:
@@ -553,6 +785,81 @@ class IndexedFasta:
             # cast to string
             return p[:]
 
+    def getSequences( self, nids, max_gap = 65536 ):
+        """return full length sequences for a list of nids.
+
+        Sequences are read in the order of their position in the
+        database. Reads of sequences that are less than *max_gap*
+        bytes apart are coalesced into a single read and the operating
+        system is advised to read ahead where supported.
+
+        The sequences are returned in the order of nids.
+        """
+
+        if not self.mIsLoaded: self.__loadIndex()
+
+        nids = list(nids)
+
+        # collect position and length of each sequence
+        entries = []
+        for nid in nids:
+            if self.mMethod in BINARY_METHODS:
+                entries.append( self.__getBinaryEntry( nid ) )
+                continue
+            contig = self.mSynonyms.get( nid, nid )
+            if contig not in self.mIndex:
+                raise KeyError, "%s not in index" % contig
+            data = self.mIndex[contig]
+            if self.mNoSeek:
+                entries.append( (data[3][0], data[2]) )
+            else:
+                entries.append( (data[1], data[2]) )
+
+        order = sorted( range(len(nids)), key = lambda x: entries[x][0] )
+        result = [None] * len(nids)
+
+        if self.mNoSeek:
+            # compressed databases are read block-wise
+            for x in order:
+                result[x] = self.getSequence( nids[x] )
+            return result
+
+        x = 0
+        while x < len(order):
+            # extend run while the gap to the next sequence is small
+            start = entries[order[x]][0]
+            end = start + entries[order[x]][1]
+            y = x + 1
+            while y < len(order) and entries[order[y]][0] - end <= max_gap:
+                end = max( end, entries[order[y]][0] + entries[order[y]][1] )
+                y += 1
+
+            if self.mMethod in BINARY_METHODS:
+                if self.mMethod == "binary": self.__adviseReadAhead( start, end )
+                for z in order[x:y]:
+                    pos, length = entries[z]
+                    result[z] = self.__readBinary( pos, pos+length )
+            else:
+                self.mDatabaseFile.seek( start )
+                block = self.mDatabaseFile.read( end - start )
+                for z in order[x:y]:
+                    pos, length = entries[z]
+                    result[z] = block[pos-start:pos-start+length]
+            x = y
+
+        return result
+
+    def __adviseReadAhead( self, start, end ):
+        """advise the operating system that the mapped data
+        in range start:end will be needed.
+
+        This is a no-op if madvise is not available.
+        """
+        if not hasattr( self.mData, "madvise" ): return
+        start -= start % mmap.PAGESIZE
+        if end > start:
+            self.mData.madvise( mmap.MADV_WILLNEED, start, end - start )
+
     def getRandomCoordinates( self, size ):
         """returns coordinates for a random fragment of size #.
 
@@ -564,16 +871,20 @@ class IndexedFasta:
         """
         if not self.mIsLoaded: self.__loadIndex()
 
-        token = random.choice( self.mIndex.keys() )        
+        if self.mMethod in BINARY_METHODS:
+            token = int(random.choice( self.mNids ))
+            lcontig = self.getLength( token )
+        else:
+            token = random.choice( self.mIndex.keys() )        
+            pos_id, pos_seq, lcontig = self.mIndex[token][:3]
         strand = random.choice( ("+", "-") )
-        pos_id, pos_seq, lcontig = self.mIndex[token][:3]
-        rpos = random.randint( 0, lcontig )
-        if random.choice( ("True", "False") ):
+        rpos = random.randint( 0, lcontig - 1 )
+        if random.choice( (True, False) ):
             start = rpos
             end = min(rpos + size, lcontig)
         else:
-            start = max(0, rpos - size)
-            end = rpos
+            end = rpos + 1
+            start = max(0, end - size)
             
         return token, strand, start, end
 
@@ -694,12 +1005,12 @@ def verify( fasta1, fasta2, num_iterations, fragment_size,
     Get segment from fasta1 and check for presence in fasta2.
     """
     if not quiet:
-        options.stdout.write("verifying %s and %s using %i random segments of length %i\n" %\
+        stdout.write("verifying %s and %s using %i random segments of length %i\n" %\
                              (fasta1.getDatabaseName(),
                               fasta2.getDatabaseName(),
                               num_iterations,
                               fragment_size ))
-        options.stdout.flush()
+        stdout.flush()
     nerrors = 0
     for x in range(num_iterations):
         contig, strand, start, end = fasta1.getRandomCoordinates( fragment_size )
@@ -707,11 +1018,77 @@ def verify( fasta1, fasta2, num_iterations, fragment_size,
         s2 = fasta2.getSequence(contig,strand,start,end)
         if s1 != s2:
             if not quiet:
-                options.stdout.write("discordant segment: %s:%s:%i:%i\n%s\n%s\n" %\
+                stdout.write("discordant segment: %s:%s:%i:%i\n%s\n%s\n" %\
                                      (contig, strand, start, end, s1, s2) )
             nerrors += 1
     return nerrors
 
+def copyDatabase( fasta, dbname, method, **kwargs ):
+    """copy all sequences in fasta into a new database dbname
+    using method.
+
+    Sequences are copied in sorted order of their identifiers.
+    returns the new database opened for reading.
+    """
+    outfile = IndexedFasta( dbname, "w", method = method, **kwargs )
+    for key in sorted( fasta.keys() ):
+        outfile.addSequence( key, fasta.getSequence( key ) )
+    outfile.close()
+    return IndexedFasta( dbname )
+
+def exportFasta( fasta, outfile ):
+    """write all sequences in fasta to outfile in fasta format.
+
+    Sequences are written in sorted order of their identifiers.
+    """
+    keys = sorted( fasta.keys() )
+    for x in range( 0, len(keys), 1000 ):
+        chunk = keys[x:x+1000]
+        for key, sequence in zip( chunk, fasta.getSequences( chunk ) ):
+            outfile.write( ">%s\n%s\n" % (key, sequence) )
+
+def benchmarkDatabase( fasta, dbname, method = "blocks",
+                       num_iterations = 10000, fragment_size = 100,
+                       stdout = sys.stdout, **kwargs ):
+    """benchmark method against database fasta.
+
+    Copies fasta to dbname using method, checks that all 
+    sequences are identical, checks random fragments with
+    :func:`verify` and times random access with 
+    :func:`benchmarkRandomFragment` in both databases.
+
+    returns the number of errors.
+    """
+
+    t = time.time()
+    copy = copyDatabase( fasta, dbname, method, **kwargs )
+    stdout.write( "# copied %i sequences to %s in %i seconds\n" % \
+                      (len(copy), copy.getDatabaseName(), time.time() - t ) )
+
+    # round trip
+    nerrors = 0
+    for key in fasta.keys():
+        if fasta.getSequence( key ) != copy.getSequence( key ):
+            stdout.write( "discordant sequence: %s\n" % str(key) )
+            nerrors += 1
+
+    # random access
+    nerrors += verify( fasta, copy, num_iterations, fragment_size, stdout = stdout )
+    nerrors += verify( copy, fasta, num_iterations, fragment_size, stdout = stdout )
+
+    stdout.write( "database\tsize\titer\tfragment\ttime\n" )
+    for db in (fasta, copy):
+        size = os.path.getsize( db.getDatabaseName() )
+        t = time.time()
+        for x in range(num_iterations):
+            benchmarkRandomFragment( db, fragment_size )
+        stdout.write( "%s\t%i\t%i\t%i\t%f\n" % \
+                          (db.getDatabaseName(), size, num_iterations,
+                           fragment_size, time.time() - t ) )
+
+    stdout.write( "errors=%i\n" % nerrors )
+    return nerrors
+
 if __name__ == "__main__":
 
     import Experiment
@@ -745,6 +1122,11 @@ if __name__ == "__main__":
     parser.add_option( "--benchmark-fragment-size", dest="benchmark_fragment_size", type="int",
                        help="benchmark: fragment size [%DEFAULT%]." )
 
+    parser.add_option( "--benchmark-method", dest="benchmark_method", type="choice",
+                       choices=("binary", "blocks"),
+                       help="benchmark: copy database to a new database given as second argument "
+                       "using this method and compare round-trip and random access [%DEFAULT%]." )
+
     parser.add_option( "--verify", dest="verify", type="string",
                        help="verify against other database.")
 
@@ -760,6 +1142,7 @@ if __name__ == "__main__":
         benchmark_fragment_size = 1000,
         benchmark_num_iterations = 1000000,
         benchmark = False,
+        benchmark_method = None,
         compression = None,
         random_access_points = 0,
         synonyms = None,
@@ -793,6 +1176,12 @@ if __name__ == "__main__":
                                       converter = converter )
         options.stdout.write( ">%s\n%s\n" % \
                               ( options.extract, sequence ) )
+    elif options.benchmark and options.benchmark_method:
+        nerrors = benchmarkDatabase( IndexedFasta( args[0] ), args[1],
+                                     method = options.benchmark_method,
+                                     num_iterations = options.benchmark_num_iterations,
+                                     fragment_size = options.benchmark_fragment_size,
+                                     stdout = options.stdout )
     elif options.benchmark:
         import timeit
         timer = timeit.Timer( stmt="benchmarkRandomFragment( fasta = fasta, size = %i)" % (options.benchmark_fragment_size),
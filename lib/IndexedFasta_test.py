@@ -0,0 +1,114 @@
+import unittest, os, glob, re, tempfile, gzip, random
+
+import IndexedFasta
+
+class TestBlocks(unittest.TestCase):
+
+    mBlockSize = 10
+    mCacheSize = 16
+
+    def setUp(self):
+        self.mTempdir = tempfile.mkdtemp()
+        self.mDbname = os.path.join( self.mTempdir, "test" )
+
+    def tearDown(self):
+        for f in glob.glob( os.path.join( self.mTempdir, "*" ) ):
+            os.remove( f )
+        os.rmdir( self.mTempdir )
+
+    def build( self, sequences ):
+        '''write sequences as (nid, sequence) tuples and return database.'''
+        outfile = IndexedFasta.IndexedFasta( self.mDbname, "w", method = "blocks",
+                                             block_size = self.mBlockSize )
+        for nid, sequence in sequences: outfile.addSequence( nid, sequence )
+        outfile.close()
+        fasta = IndexedFasta.IndexedFasta( self.mDbname, cache_size = self.mCacheSize )
+        self.assertEqual( fasta.mMethod, "blocks" )
+        return fasta
+
+    def checkSequences( self, fasta, sequences ):
+        self.assertEqual( len(fasta), len(sequences) )
+        self.assertEqual( sorted( fasta.keys() ), sorted( [ x[0] for x in sequences ] ) )
+        for nid, sequence in sequences:
+            self.assertEqual( fasta.getLength( nid ), len(sequence) )
+            self.assertEqual( fasta.getSequences( [nid] ), [sequence] )
+            if sequence: self.assertEqual( fasta.getSequence( nid ), sequence )
+
+    def getNumBlocks( self, fasta ):
+        return len(fasta.mBlockStarts) - 1
+
+    def testExactBlock( self ):
+        sequences = [ (1, "A" * 10), (2, "C" * 10), (3, "D" * 4) ]
+        fasta = self.build( sequences )
+        self.checkSequences( fasta, sequences )
+        self.assertEqual( list(fasta.mBlockStarts), [0, 10, 20, 24] )
+
+    def testSharedBlock( self ):
+        sequences = [ (1, "A" * 4), (2, "C" * 6), (3, "D" * 7), (5, "E" * 3) ]
+        fasta = self.build( sequences )
+        self.checkSequences( fasta, sequences )
+        self.assertEqual( list(fasta.mBlockStarts), [0, 10, 20] )
+
+    def testLargeSequences( self ):
+        sequences = [ (1, "A" * 3), (2, "C" * 25), (3, "D" * 31), (4, "E" * 2) ]
+        fasta = self.build( sequences )
+        self.checkSequences( fasta, sequences )
+        # sequences do not span blocks
+        self.assertEqual( list(fasta.mBlockStarts), [0, 3, 28, 59, 61] )
+        self.assertEqual( fasta.getSequence( 3, "+", 20, 25 ), "DDDDD" )
+
+    def testZeroLength( self ):
+        sequences = [ (1, ""), (2, "A" * 10), (3, ""), (4, "C" * 5), (6, "") ]
+        fasta = self.build( sequences )
+        self.checkSequences( fasta, sequences )
+        self.assertTrue( 1 in fasta )
+        self.assertFalse( 5 in fasta )
+        self.assertEqual( fasta.getSequences( [6, 3, 4, 1] ), ["", "", "C" * 5, ""] )
+
+    def testEmpty( self ):
+        fasta = self.build( [] )
+        self.assertEqual( len(fasta), 0 )
+        self.assertEqual( fasta.getSequences( [] ), [] )
+        self.assertEqual( self.getNumBlocks( fasta ), 0 )
+
+    def testMissing( self ):
+        fasta = self.build( [ (2, "ACD") ] )
+        self.assertRaises( KeyError, fasta.getSequence, 1 )
+        self.assertRaises( KeyError, fasta.getSequence, 3 )
+        self.assertRaises( KeyError, fasta.getSequences, [2, 1] )
+
+    def testCacheEviction( self ):
+        self.mCacheSize = 1
+        sequences = [ (1, "A" * 10), (2, "C" * 10), (3, "D" * 10) ]
+        fasta = self.build( sequences )
+        for nid in (1, 2, 1, 3, 3, 2, 1):
+            self.assertEqual( fasta.getSequence( nid ), dict(sequences)[nid] )
+            self.assertEqual( len(fasta.mCache), 1 )
+            self.assertEqual( list(fasta.mCache), [nid - 1] )
+        self.checkSequences( fasta, sequences )
+
+    def testCacheOrder( self ):
+        self.mCacheSize = 2
+        sequences = [ (1, "A" * 10), (2, "C" * 10), (3, "D" * 10) ]
+        fasta = self.build( sequences )
+        fasta.getSequence( 1 )
+        fasta.getSequence( 2 )
+        # using block 0 makes block 1 the least recently used
+        fasta.getSequence( 1 )
+        fasta.getSequence( 3 )
+        self.assertEqual( list(fasta.mCache), [0, 2] )
+
+    def testGetSequencesOrder( self ):
+        random.seed( 1 )
+        sequences = [ (nid, "".join( [ random.choice( "ACDEFGHIKL" ) for x in range( random.randint( 0, 30 ) ) ] ) )
+                      for nid in range( 1, 200, 3 ) ]
+        fasta = self.build( sequences )
+        self.checkSequences( fasta, sequences )
+        nids = [ x[0] for x in sequences ]
+        query = random.sample( nids, 40 ) + [ nids[0], nids[-1], nids[0] ]
+        for max_gap in (0, 10, 65536):
+            self.assertEqual( fasta.getSequences( query, max_gap = max_gap ),
+                              [ dict(sequences)[x] for x in query ] )
+
+if __name__ == '__main__':
+    unittest.main()
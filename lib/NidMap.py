@@ -0,0 +1,213 @@
+import os, mmap, array, zlib, tempfile, shutil
+import numpy
+
+MAGIC = "ADDANID1"
+
+# header: magic, number of identifiers, number of hash buckets,
+# size of identifier table
+HEADER_DTYPE = numpy.dtype( [ ("magic", "S8"),
+                              ("num_ids", "<i8"),
+                              ("num_buckets", "<i8"),
+                              ("strings_size", "<i8") ] )
+
+def getFileName( filename_nids ):
+    '''return filename of the map for the table of nids in filename_nids.'''
+    return filename_nids + ".index"
+
+def hashId( identifier ):
+    '''return hash value of identifier.'''
+    return zlib.crc32( identifier ) & 0xffffffff
+
+class NidMap(object):
+    """map between sequence identifiers and nids.
+
+    The map is saved in a single file and mapped into memory.
+    Entries are sorted by nid. The file contains
+
+    * the nids
+    * offsets of each identifier in a table of identifiers
+    * a hash index of the identifiers, with entries grouped by bucket
+    * the table of identifiers
+
+    The map behaves like a dictionary mapping identifiers to
+    nids (``map[id] -> nid``). Nids are mapped to identifiers with
+    :meth:`getId` or the dictionary returned by :meth:`getNid2Id`.
+    """
+
+    def __init__(self, filename ):
+
+        self.mFilename = filename
+        self.mFile = open( filename, "rb" )
+        self.mData = mmap.mmap( self.mFile.fileno(), 0, access = mmap.ACCESS_READ )
+
+        header = numpy.frombuffer( self.mData, dtype = HEADER_DTYPE, count = 1 )
+        if header["magic"][0] != MAGIC:
+            raise ValueError( "%s is not a nid map" % filename )
+
+        num_ids = int(header["num_ids"][0])
+        self.mNumBuckets = int(header["num_buckets"][0])
+
+        offset = HEADER_DTYPE.itemsize
+        self.mNids = numpy.frombuffer( self.mData, dtype = "<i8", count = num_ids, offset = offset )
+        offset += 8 * num_ids
+        self.mOffsets = numpy.frombuffer( self.mData, dtype = "<i8", count = num_ids + 1, offset = offset )
+        offset += 8 * (num_ids + 1)
+        self.mBuckets = numpy.frombuffer( self.mData, dtype = "<i8", count = self.mNumBuckets + 1, offset = offset )
+        offset += 8 * (self.mNumBuckets + 1)
+        self.mEntries = numpy.frombuffer( self.mData, dtype = "<i8", count = num_ids, offset = offset )
+        offset += 8 * num_ids
+        self.mStrings = offset
+
+    def __len__(self):
+        return len(self.mNids)
+
+    def __contains__(self, identifier):
+        return self.getIndex( identifier ) >= 0
+
+    def __getitem__(self, identifier):
+        x = self.getIndex( identifier )
+        if x < 0: raise KeyError( identifier )
+        return int(self.mNids[x])
+
+    def get(self, identifier, default = None ):
+        x = self.getIndex( identifier )
+        if x < 0: return default
+        return int(self.mNids[x])
+
+    def iteritems(self):
+        for x in xrange(len(self.mNids)):
+            yield self.getIdAt( x ), int(self.mNids[x])
+
+    def getIdAt( self, x ):
+        '''return identifier of entry x.'''
+        return self.mData[self.mStrings + self.mOffsets[x]:self.mStrings + self.mOffsets[x+1]]
+
+    def getIndex( self, identifier ):
+        '''return entry of identifier or -1 if not present.'''
+        if len(self.mNids) == 0: return -1
+        identifier = str(identifier)
+        bucket = hashId( identifier ) % self.mNumBuckets
+        for x in self.mEntries[self.mBuckets[bucket]:self.mBuckets[bucket+1]]:
+            if self.getIdAt( x ) == identifier: return x
+        return -1
+
+    def getId( self, nid ):
+        '''return identifier for nid.'''
+        nid = int(nid)
+        x = numpy.searchsorted( self.mNids, nid )
+        if x >= len(self.mNids) or self.mNids[x] != nid: raise KeyError( nid )
+        return self.getIdAt( x )
+
+    def getDict( self ):
+        '''return a dictionary mapping identifiers to nids.
+
+        A dictionary is faster than the map for many look-ups,
+        but uses more memory.
+        '''
+        strings = self.mData[self.mStrings:self.mStrings + int(self.mOffsets[-1])]
+        offsets = self.mOffsets.tolist()
+        return dict( zip( [ strings[offsets[x]:offsets[x+1]] for x in xrange(len(self.mNids)) ],
+                          self.mNids.tolist() ) )
+
+    def getNid2Id( self ):
+        '''return a dictionary-like object mapping nids to identifiers.'''
+        return _Nid2Id( self )
+
+    def close(self):
+        self.mNids = self.mOffsets = self.mBuckets = self.mEntries = None
+        self.mData.close()
+        self.mFile.close()
+
+class _Nid2Id(object):
+    '''reverse lookup in a :class:`NidMap`.'''
+    def __init__(self, nidmap ):
+        self.mNidMap = nidmap
+    def __len__(self):
+        return len(self.mNidMap)
+    def __contains__(self, nid):
+        try:
+            self.mNidMap.getId( nid )
+        except KeyError:
+            return False
+        return True
+    def __getitem__(self, nid):
+        return self.mNidMap.getId( nid )
+
+class NidMapBuilder(object):
+    """build a :class:`NidMap`.
+
+    Identifiers are added with increasing nids and the map is
+    written to filename when the builder is closed. Identifiers
+    are kept in a temporary file while building.
+    """
+
+    def __init__(self, filename ):
+        self.mFilename = filename
+        self.mNids = array.array( "l" )
+        self.mOffsets = array.array( "l", [0] )
+        self.mHashes = array.array( "I" )
+        self.mStrings = tempfile.TemporaryFile( dir = os.path.dirname( os.path.abspath( filename ) ) )
+
+    def add( self, identifier, nid ):
+        '''add identifier for nid.'''
+        if self.mNids and nid <= self.mNids[-1]:
+            raise ValueError( "nids not in increasing order: %i after %i" % (nid, self.mNids[-1]) )
+        identifier = str(identifier)
+        self.mNids.append( nid )
+        self.mStrings.write( identifier )
+        self.mOffsets.append( self.mOffsets[-1] + len(identifier) )
+        self.mHashes.append( hashId( identifier ) )
+
+    def close( self ):
+        '''write the map.'''
+
+        num_ids = len(self.mNids)
+        num_buckets = max( 1, num_ids )
+
+        def _toArray( a, dtype ):
+            if len(a) == 0: return numpy.zeros( 0, dtype = dtype )
+            return numpy.frombuffer( a, dtype = dtype )
+
+        buckets = _toArray( self.mHashes, numpy.uint32 ).astype( numpy.int64 ) % num_buckets
+        entries = numpy.argsort( buckets, kind = "mergesort" ).astype( "<i8" )
+        bucket_offsets = numpy.zeros( num_buckets + 1, dtype = "<i8" )
+        numpy.cumsum( numpy.bincount( buckets, minlength = num_buckets ), out = bucket_offsets[1:] )
+
+        header = numpy.zeros( 1, dtype = HEADER_DTYPE )
+        header["magic"] = MAGIC
+        header["num_ids"] = num_ids
+        header["num_buckets"] = num_buckets
+        header["strings_size"] = self.mOffsets[-1]
+
+        tmpfile = "%s.tmp%i" % (self.mFilename, os.getpid())
+        outfile = open( tmpfile, "wb" )
+        outfile.write( header.tostring() )
+        outfile.write( _toArray( self.mNids, numpy.int_ ).astype( "<i8" ).tostring() )
+        outfile.write( _toArray( self.mOffsets, numpy.int_ ).astype( "<i8" ).tostring() )
+        outfile.write( bucket_offsets.tostring() )
+        outfile.write( entries.tostring() )
+        self.mStrings.seek( 0 )
+        shutil.copyfileobj( self.mStrings, outfile )
+        outfile.close()
+        self.mStrings.close()
+        os.rename( tmpfile, self.mFilename )
+
+def buildNidMap( infile, filename ):
+    '''build a :class:`NidMap` in filename from the table of nids in infile.
+
+    returns the number of identifiers.
+    '''
+
+    entries = []
+    for line in infile:
+        if line.startswith("#"): continue
+        if line.startswith("nid"): continue
+        data = line[:-1].split("\t")[:2]
+        entries.append( (int(data[0]), data[1]) )
+
+    entries.sort()
+    builder = NidMapBuilder( filename )
+    for nid, identifier in entries: builder.add( identifier, nid )
+    builder.close()
+
+    return len(entries)
@@ -0,0 +1,99 @@
+import unittest, os, glob, re, tempfile, gzip
+
+import NidMap
+
+class TestNidMap(unittest.TestCase):
+
+    mNumIds = 100
+
+    def setUp(self):
+        fd, self.mFilename = tempfile.mkstemp()
+        os.close(fd)
+        # nids are not contiguous and not sorted in the table
+        self.mIds = dict( [ ("seq%i" % x, 2 * x + 1) for x in range( self.mNumIds, 0, -1 ) ] )
+        self.mIds["12345"] = 500
+
+    def tearDown(self):
+        if os.path.exists(self.mFilename):
+            os.remove( self.mFilename )
+
+    def build( self, ids ):
+        lines = [ "nid\tpid\thid\tlength\tsequence\n",
+                  "# comment\n" ]
+        for identifier, nid in ids.items():
+            lines.append( "%i\t%s\tx\t1\tA\n" % (nid, identifier) )
+        self.assertEqual( NidMap.buildNidMap( lines, self.mFilename ), len(ids) )
+        return NidMap.NidMap( self.mFilename )
+
+    def testLookup( self ):
+        m = self.build( self.mIds )
+        self.assertEqual( len(m), len(self.mIds) )
+        for identifier, nid in self.mIds.items():
+            self.assertTrue( identifier in m )
+            self.assertEqual( m[identifier], nid )
+            self.assertEqual( m.get( identifier ), nid )
+            self.assertEqual( m.getId( nid ), identifier )
+        self.assertEqual( dict( m.iteritems() ), self.mIds )
+        self.assertEqual( m.getDict(), self.mIds )
+        m.close()
+
+    def testIntAndStrIdentifiers( self ):
+        m = self.build( self.mIds )
+        self.assertEqual( m[12345], 500 )
+        self.assertEqual( m["12345"], 500 )
+        self.assertTrue( 12345 in m )
+        m.close()
+
+    def testNid2Id( self ):
+        m = self.build( self.mIds )
+        nid2id = m.getNid2Id()
+        self.assertEqual( len(nid2id), len(self.mIds) )
+        self.assertEqual( nid2id[3], "seq1" )
+        self.assertEqual( nid2id["3"], "seq1" )
+        self.assertTrue( 3 in nid2id )
+        self.assertTrue( "3" in nid2id )
+        self.assertFalse( 2 in nid2id )
+        self.assertFalse( 10000 in nid2id )
+        m.close()
+
+    def testMissing( self ):
+        m = self.build( self.mIds )
+        for identifier in ("seq0", "seq", "", "unknown"):
+            self.assertFalse( identifier in m )
+            self.assertRaises( KeyError, m.__getitem__, identifier )
+            self.assertEqual( m.get( identifier ), None )
+        self.assertEqual( m.get( "seq0", -1 ), -1 )
+        self.assertRaises( KeyError, m.getId, 2 )
+        self.assertRaises( KeyError, m.getId, 0 )
+        self.assertRaises( KeyError, m.getId, 10000 )
+        m.close()
+
+    def testEmpty( self ):
+        m = self.build( {} )
+        self.assertEqual( len(m), 0 )
+        self.assertFalse( "seq1" in m )
+        self.assertEqual( m.get( "seq1" ), None )
+        self.assertRaises( KeyError, m.getId, 1 )
+        self.assertEqual( m.getDict(), {} )
+        self.assertEqual( list( m.iteritems() ), [] )
+        m.close()
+
+    def testOrder( self ):
+        builder = NidMap.NidMapBuilder( self.mFilename )
+        builder.add( "a", 2 )
+        self.assertRaises( ValueError, builder.add, "b", 2 )
+        self.assertRaises( ValueError, builder.add, "b", 1 )
+        builder.add( "b", 3 )
+        builder.close()
+        m = NidMap.NidMap( self.mFilename )
+        self.assertEqual( m.getDict(), { "a" : 2, "b" : 3 } )
+        m.close()
+
+    def testBadFile( self ):
+        outfile = open( self.mFilename, "w" )
+        outfile.write( "nid\tpid\n" * 10 )
+        outfile.close()
+        self.assertRaises( ValueError, NidMap.NidMap, self.mFilename )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os, collections
+
+import ProfileLibrary
+
+# estimated memory used by a profile per residue: counts, frequencies
+# and scores for 20 residues in double precision.
+BYTES_PER_RESIDUE = 20 * 3 * 8
+
+def getProfileSize( profile ):
+    '''return the estimated size of *profile* in bytes.'''
+    return profile.getLength() * BYTES_PER_RESIDUE
+
+class ProfileCache(object):
+    """a cache of profiles.
+
+    Profiles are kept in memory until either more than ``max_size``
+    profiles are cached or the profiles use more than ``max_bytes``
+    bytes. The least recently used profiles are evicted first.
+
+    If ``filename`` is given, evicted profiles are saved in a
+    :class:`ProfileLibrary.ProfileLibrary` and are loaded from
+    there on the next request instead of being rebuilt. The
+    library is deleted when the cache is closed.
+    """
+
+    def __init__(self, max_size = None, max_bytes = None, filename = None ):
+
+        self.mMaxSize = max_size
+        self.mMaxBytes = max_bytes
+        self.mCache = collections.OrderedDict()
+        self.mBytes = 0
+
+        self.mNHits, self.mNMisses, self.mNEvictions = 0, 0, 0
+        self.mNDiskHits, self.mNDiskWrites = 0, 0
+
+        self.mFilename = filename
+        if filename:
+            self.mLibrary = ProfileLibrary.ProfileLibrary( filename, "w", force = True )
+        else:
+            self.mLibrary = None
+
+    def __len__(self):
+        return len(self.mCache)
+
+    def __contains__(self, key):
+        return key in self.mCache
+
+    def __str__(self):
+        return "cache: profiles=%i, bytes=%i, hits=%i, misses=%i, evictions=%i, disk_hits=%i, disk_writes=%i" %\
+            (len(self.mCache), self.mBytes, self.mNHits, self.mNMisses, self.mNEvictions,
+             self.mNDiskHits, self.mNDiskWrites )
+
+    def getLibrary( self ):
+        '''return the profile library used for evicted profiles.'''
+        return self.mLibrary
+
+    def get( self, key ):
+        '''return profile for *key*.
+
+        Profiles on disk are loaded, prepared and moved back
+        into memory.
+
+        returns None if the profile is not in the cache.
+        '''
+        profile = self.mCache.pop( key, None )
+        if profile is not None:
+            self.mNHits += 1
+            self.mCache[key] = profile
+            return profile
+
+        if self.mLibrary is not None and str(key) in self.mLibrary:
+            self.mNDiskHits += 1
+            profile = self.mLibrary.getProfile( str(key) )
+            profile.prepare()
+            self.add( key, profile )
+            return profile
+
+        self.mNMisses += 1
+        return None
+
+    def add( self, key, profile ):
+        '''add *profile* for *key* to the cache.'''
+        if key in self.mCache:
+            self.mBytes -= getProfileSize( self.mCache.pop( key ) )
+
+        self.mCache[key] = profile
+        self.mBytes += getProfileSize( profile )
+
+        # keep at least the profile just added
+        while len(self.mCache) > 1 and \
+                ( (self.mMaxSize and len(self.mCache) > self.mMaxSize) or \
+                      (self.mMaxBytes and self.mBytes > self.mMaxBytes) ):
+            self.evict()
+
+    def evict( self ):
+        '''evict the least recently used profile.'''
+        key, profile = self.mCache.popitem( last = False )
+        self.mBytes -= getProfileSize( profile )
+        self.mNEvictions += 1
+
+        if self.mLibrary is not None and str(key) not in self.mLibrary:
+            self.mLibrary.add( str(key), profile )
+            self.mNDiskWrites += 1
+
+    def close( self ):
+        '''clear the cache and remove the profile library.'''
+        self.mCache.clear()
+        self.mBytes = 0
+        if self.mLibrary is not None:
+            self.mLibrary.close()
+            for filename in ProfileLibrary.getFileNames( self.mFilename ) + \
+                    (ProfileLibrary.getBinaryIndexName( self.mFilename ),):
+                if os.path.exists( filename ): os.remove( filename )
+            self.mLibrary = None
@@ -0,0 +1,142 @@
+import unittest, os, glob, re, tempfile, gzip, shutil
+
+import ProfileLibrary
+import ProfileCache
+
+class Profile:
+    '''a stub profile.'''
+
+    def __init__(self, data ):
+        self.mData = data
+        self.mPrepared = False
+
+    def getLength( self ):
+        return len(self.mData)
+
+    def save( self, outfile ):
+        outfile.write( "%i\n" % len(self.mData) )
+        outfile.write( self.mData )
+
+    def prepare( self ):
+        self.mPrepared = True
+
+class Alignlib:
+    '''stub for alignlib to load :class:`Profile` objects.'''
+
+    @staticmethod
+    def loadAlignandum( infile ):
+        return Profile( infile.read( int( infile.readline() ) ) )
+
+    @staticmethod
+    def makeToolkit():
+        return None
+
+    @staticmethod
+    def setDefaultToolkit( toolkit ):
+        pass
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.mAlignlib = ProfileLibrary.alignlib
+        ProfileLibrary.alignlib = Alignlib
+        self.mTempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        ProfileLibrary.alignlib = self.mAlignlib
+        shutil.rmtree( self.mTempdir )
+
+    def getSize( self, length ):
+        return length * ProfileCache.BYTES_PER_RESIDUE
+
+    def testLRU( self ):
+        cache = ProfileCache.ProfileCache( max_size = 3 )
+        for x in (1, 2, 3): cache.add( x, Profile( "A" * 10 ) )
+        self.assertEqual( list(cache.mCache), [1, 2, 3] )
+        # get moves a profile to the end
+        self.assertNotEqual( cache.get( 1 ), None )
+        self.assertEqual( list(cache.mCache), [2, 3, 1] )
+        cache.add( 4, Profile( "A" * 10 ) )
+        self.assertEqual( list(cache.mCache), [3, 1, 4] )
+        self.assertEqual( cache.get( 2 ), None )
+        self.assertFalse( 2 in cache )
+        self.assertEqual( (cache.mNHits, cache.mNMisses, cache.mNEvictions), (1, 1, 1) )
+
+    def testMaxSize( self ):
+        cache = ProfileCache.ProfileCache( max_size = 2 )
+        for x in range( 5 ): cache.add( x, Profile( "A" * 10 ) )
+        self.assertEqual( list(cache.mCache), [3, 4] )
+        self.assertEqual( cache.mNEvictions, 3 )
+        self.assertEqual( cache.mBytes, 2 * self.getSize( 10 ) )
+
+    def testMaxBytes( self ):
+        cache = ProfileCache.ProfileCache( max_bytes = self.getSize( 10 ) )
+        cache.add( 1, Profile( "A" * 4 ) )
+        cache.add( 2, Profile( "A" * 4 ) )
+        self.assertEqual( list(cache.mCache), [1, 2] )
+        cache.add( 3, Profile( "A" * 4 ) )
+        self.assertEqual( list(cache.mCache), [2, 3] )
+        self.assertEqual( cache.mBytes, self.getSize( 8 ) )
+        cache.add( 4, Profile( "A" * 9 ) )
+        self.assertEqual( list(cache.mCache), [4] )
+        self.assertEqual( cache.mBytes, self.getSize( 9 ) )
+
+    def testReplace( self ):
+        cache = ProfileCache.ProfileCache( max_size = 2 )
+        cache.add( 1, Profile( "A" * 4 ) )
+        cache.add( 1, Profile( "A" * 6 ) )
+        self.assertEqual( len(cache), 1 )
+        self.assertEqual( cache.mBytes, self.getSize( 6 ) )
+        self.assertEqual( cache.get( 1 ).getLength(), 6 )
+
+    def testKeepAdded( self ):
+        # profiles larger than the budget are kept until the next one is added
+        cache = ProfileCache.ProfileCache( max_bytes = self.getSize( 5 ) )
+        cache.add( 1, Profile( "A" * 10 ) )
+        self.assertEqual( list(cache.mCache), [1] )
+        cache.add( 2, Profile( "A" * 20 ) )
+        self.assertEqual( list(cache.mCache), [2] )
+        self.assertEqual( cache.mBytes, self.getSize( 20 ) )
+
+        cache = ProfileCache.ProfileCache( max_size = 1 )
+        cache.add( 1, Profile( "A" ) )
+        cache.add( 2, Profile( "C" ) )
+        self.assertEqual( list(cache.mCache), [2] )
+
+    def testDisk( self ):
+        filename = os.path.join( self.mTempdir, "cache" )
+        cache = ProfileCache.ProfileCache( max_size = 1, filename = filename )
+        cache.add( 1, Profile( "ACD" ) )
+        cache.add( 2, Profile( "EFGH" ) )
+        self.assertEqual( cache.mNDiskWrites, 1 )
+        self.assertTrue( "1" in cache.getLibrary() )
+
+        # loaded from disk, prepared and moved back into memory
+        profile = cache.get( 1 )
+        self.assertEqual( profile.mData, "ACD" )
+        self.assertTrue( profile.mPrepared )
+        self.assertEqual( list(cache.mCache), [1] )
+        self.assertEqual( (cache.mNDiskHits, cache.mNDiskWrites), (1, 2) )
+
+        profile = cache.get( 2 )
+        self.assertEqual( profile.mData, "EFGH" )
+        self.assertTrue( profile.mPrepared )
+
+        # profiles already on disk are not written again
+        self.assertEqual( (cache.mNDiskHits, cache.mNDiskWrites), (2, 2) )
+        self.assertEqual( cache.get( 3 ), None )
+        self.assertEqual( cache.mNMisses, 1 )
+
+    def testClose( self ):
+        filename = os.path.join( self.mTempdir, "cache" )
+        cache = ProfileCache.ProfileCache( max_size = 1, filename = filename )
+        cache.add( 1, Profile( "ACD" ) )
+        cache.add( 2, Profile( "EFGH" ) )
+        cache.close()
+        self.assertEqual( len(cache), 0 )
+        self.assertEqual( cache.mBytes, 0 )
+        self.assertEqual( cache.getLibrary(), None )
+        self.assertEqual( os.listdir( self.mTempdir ), [] )
+
+if __name__ == '__main__':
+    unittest.main()
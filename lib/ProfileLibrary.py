@@ -25,7 +25,8 @@
 #--------------------------------------------------------
 # import of system libraries
 #--------------------------------------------------------
-import os, sys, string, re, tempfile, subprocess, optparse, time, math
+import os, sys, string, re, tempfile, subprocess, optparse, time, math, types, zlib
+import numpy
 
 #--------------------------------------------------------
 #--------------------------------------------------------
@@ -65,6 +66,96 @@ import alignlib
 
 SUFFIX_DATABASE = ".pdb"
 SUFFIX_INDEX=".pix"
+SUFFIX_BINARY_INDEX=".pbx"
+
+# binary index: header followed by arrays of nids (sorted), 
+# offsets and lengths of profiles in the database. The header
+# contains the size and crc32 checksum of the database.
+BINARY_MAGIC = "ADDAPRF1"
+BINARY_VERSION = 2
+BINARY_HEADER_DTYPE = numpy.dtype( [ ("magic", "S8"),
+                                     ("version", "<i8"),
+                                     ("num_profiles", "<i8"),
+                                     ("database_size", "<i8"),
+                                     ("checksum", "<i8") ] )
+
+# buffer size for reading and copying databases
+BUFFER_SIZE = 16 * 1024 * 1024
+
+def toKey( name ):
+    '''return key for profile name.
+
+    Names that are numeric identifiers (nids) are converted to
+    integers, so that ``library[nid]`` and ``library[str(nid)]`` 
+    refer to the same profile.
+    '''
+    try:
+        return int(name)
+    except ValueError:
+        return name
+
+class BinaryIndex(object):
+    """binary index of a profile library.
+
+    The index maps nids to the (start, end) positions of their
+    profiles in the database. The arrays are mapped into memory
+    read-only and nids are looked up by binary search.
+    """
+
+    def __init__(self, filename ):
+
+        header = numpy.fromfile( filename, dtype = BINARY_HEADER_DTYPE, count = 1 )
+        if len(header) == 0 or header["magic"][0] != BINARY_MAGIC:
+            raise ValueError( "%s is not a binary profile index" % filename )
+        if header["version"][0] != BINARY_VERSION:
+            raise ValueError( "%s: unknown version %i of binary profile index" % \
+                                  (filename, header["version"][0] ) )
+
+        num_profiles = int(header["num_profiles"][0])
+        self.mDatabaseSize = int(header["database_size"][0])
+        self.mChecksum = int(header["checksum"][0])
+
+        def _map( offset ):
+            if num_profiles == 0: return numpy.zeros( 0, dtype = numpy.int64 )
+            return numpy.memmap( filename, dtype = "<i8", mode = "r", 
+                                 offset = offset, shape = (num_profiles,) )
+
+        offset = BINARY_HEADER_DTYPE.itemsize
+        self.mNids = _map( offset )
+        self.mOffsets = _map( offset + 8 * num_profiles )
+        self.mLengths = _map( offset + 16 * num_profiles )
+
+    def getIndex( self, name ):
+        '''return entry of name or -1 if not present.'''
+        key = toKey( name )
+        if type(key) not in (types.IntType, types.LongType): return -1
+        x = numpy.searchsorted( self.mNids, key )
+        if x >= len(self.mNids) or self.mNids[x] != key: return -1
+        return x
+
+    def __len__(self):
+        return len(self.mNids)
+
+    def __contains__(self, name):
+        return self.getIndex( name ) >= 0
+
+    def __getitem__(self, name):
+        x = self.getIndex( name )
+        if x < 0: raise KeyError( name )
+        start = int(self.mOffsets[x])
+        return (start, start + int(self.mLengths[x]))
+
+    def keys(self):
+        return self.mNids.tolist()
+
+    def iterkeys(self):
+        for nid in self.mNids: yield int(nid)
+
+    def getLastKey( self ):
+        '''return the nid of the last profile in the database.'''
+        if len(self.mNids) == 0: return None
+        return int(self.mNids[numpy.argmax( self.mOffsets )])
+
 
 class ProfileLibrary:
     """create or open a profile library.
@@ -76,6 +167,11 @@ class ProfileLibrary:
           "r" open an existing library for reading.
           "w" open a new library for writing. Set force==True to
           overwrite an existing library.
+          "a" append to an existing library.
+
+    The index is kept as a text file while writing. If all names 
+    are nids, a sorted binary index (:class:`BinaryIndex`) is 
+    written when the library is closed and used for reading.
     """
     
     mSuffixDatabase = SUFFIX_DATABASE
@@ -87,6 +183,7 @@ class ProfileLibrary:
 
         self.mFilenameProfiles = self.mName + self.mSuffixDatabase
         self.mFilenameIndex = self.mName + self.mSuffixIndex
+        self.mFilenameBinaryIndex = self.mName + SUFFIX_BINARY_INDEX
         self.mIndex = {}
         self.mWeightor = None
         self.mRegularizor = None
@@ -94,18 +191,30 @@ class ProfileLibrary:
         
         self.mOutfileDatabase = None
         self.mOutfileIndex = None
+        self.mInfileDatabase = None
         self.mLastInsertedKey = None
+        self.mChecksumFile = None
+        self.mChecksum = 0
 
         if mode == "r":
-            self.__loadIndex()
+            self.__loadIndex( binary = True )
         elif mode == "w":
             if not force and os.path.exists( self.mFilenameProfiles):
                 raise IOError( "profile database %s already exists." % self.mFilenameProfiles )
+            self.removeBinaryIndex()
             self.mOutfileDatabase = open( self.mFilenameProfiles, "wb" )
             self.mOutfileIndex = open( self.mFilenameIndex, "w" )
         elif mode == "a":
             self.__loadIndex()
+            # continue the checksum of the existing database
+            index = self.openBinaryIndex()
+            if index is not None:
+                self.mChecksum = index.mChecksum
+            else:
+                self.mChecksum = getChecksum( self.mFilenameProfiles )
+            self.removeBinaryIndex()
             self.mInfileDatabase.close()
+            self.mInfileDatabase = None
             self.mOutfileDatabase = open( self.mFilenameProfiles, "ab" )
             self.mOutfileIndex = open( self.mFilenameIndex, "a" )
 
@@ -115,9 +224,19 @@ class ProfileLibrary:
     def close(self):
         if self.mOutfileDatabase:
             self.mOutfileDatabase.close()
+            self.mOutfileDatabase = None
         if self.mOutfileIndex:
+            writeBinaryIndex( self.mFilenameBinaryIndex, self.mFilenameProfiles, self.mIndex,
+                              checksum = self.mChecksum & 0xffffffff )
             self.mOutfileIndex.write( "#//\n" )
             self.mOutfileIndex.close()
+            self.mOutfileIndex = None
+        if self.mChecksumFile:
+            self.mChecksumFile.close()
+            self.mChecksumFile = None
+        if self.mInfileDatabase:
+            self.mInfileDatabase.close()
+            self.mInfileDatabase = None
 
     def __getitem__(self, key):
         return self.getProfile( key )
@@ -130,7 +249,7 @@ class ProfileLibrary:
             yield (name, self[name])
             
     def __contains__(self, key):
-        return key in self.mIndex
+        return toKey( key ) in self.mIndex
             
     def keys(self):
         return list(self.iterkeys())
@@ -146,7 +265,7 @@ class ProfileLibrary:
     def iteritems_sorted(self):
         k = self.mIndex.keys()
         k.sort( key=lambda x: self.mIndex[x] )
-        for name in self.mIndex.keys():
+        for name in k:
             yield (name, self[name])
 
     def __del__(self):
@@ -181,11 +300,23 @@ class ProfileLibrary:
         """set the regularizor to use for profile creation."""
         self.mToolkit.setRegularizor( regularizor )
 
-    def __loadIndex( self ):
+    def __loadIndex( self, binary = False ):
+        """load the index.
+
+        If binary is set, the binary index is used if it exists.
+        """
 
         if not os.path.exists( self.mFilenameProfiles):
             raise IOError( "profile database %s could not be found." % self.mFilenameProfiles )
 
+        if binary:
+            index = self.openBinaryIndex()
+            if index is not None:
+                self.mIndex = index
+                self.mLastInsertedKey = self.mIndex.getLastKey()
+                self.mInfileDatabase = open( self.mFilenameProfiles, "rb" )
+                return
+
         if not os.path.exists( self.mFilenameIndex):
             raise IOError( "index %s could not be found." % self.mFilenameIndex )
         
@@ -195,17 +326,39 @@ class ProfileLibrary:
         for line in infile:
             if line[0] == "#": continue
             name, first_pos, last_pos = line[:-1].split("\t")
+            name = toKey( name )
             self.mIndex[name] = (int(first_pos), int(last_pos) )
+            self.mLastInsertedKey = name
 
-        self.mLastInsertedKey = name
+        infile.close()
             
         self.mInfileDatabase = open( self.mFilenameProfiles, "rb" )
 
+    def openBinaryIndex( self ):
+        """return the binary index.
+
+        returns None if there is no binary index or if its version
+        or database size do not match.
+        """
+        if not os.path.exists( self.mFilenameBinaryIndex ): return None
+        try:
+            index = BinaryIndex( self.mFilenameBinaryIndex )
+        except ValueError:
+            return None
+        if index.mDatabaseSize != os.path.getsize( self.mFilenameProfiles ): return None
+        return index
+
+    def removeBinaryIndex( self ):
+        """remove the binary index, which is invalid once the library is modified."""
+        if os.path.exists( self.mFilenameBinaryIndex ):
+            os.remove( self.mFilenameBinaryIndex )
+
     def add( self, name, profile ):
         """add a profile to this library.
         
         The profile is appended.
         """
+        name = toKey( name )
         if name in self.mIndex:
             raise IndexError("profile with name %s already exists" % name )
         
@@ -217,18 +370,70 @@ class ProfileLibrary:
                                                     str(self.mOutfileDatabase.tell()) ))
         self.mOutfileDatabase.flush()
         self.mOutfileIndex.flush()
-        self.mIndex[name] = start
+        end = self.mOutfileDatabase.tell()
+        self.mIndex[name] = (start, end)
         self.mLastInsertedKey = name
 
+        # update checksum from the profile just written
+        if self.mChecksumFile is None:
+            self.mChecksumFile = open( self.mFilenameProfiles, "rb" )
+        self.mChecksumFile.seek( start )
+        self.mChecksum = zlib.crc32( self.mChecksumFile.read( end - start ), self.mChecksum )
+
     def getProfile( self, name ):
-        """append a profile to this library."""
+        """return profile name from this library."""
 
+        name = toKey( name )
         if name not in self.mIndex: raise KeyError, name
 
+        # profiles added to a library opened for writing
+        if self.mInfileDatabase is None:
+            self.mInfileDatabase = open( self.mFilenameProfiles, "rb" )
+
         self.mInfileDatabase.seek( self.mIndex[name][0] )
         p = alignlib.loadAlignandum( self.mInfileDatabase )
             
         return p
+
+    def getProfiles( self, names ):
+        """return a list of profiles for names.
+
+        Profiles are read in the order of their position in the
+        database, so that profiles are read sequentially. The 
+        profiles are returned in the order of names.
+        """
+
+        positions = []
+        for name in names:
+            key = toKey( name )
+            if key not in self.mIndex: raise KeyError, name
+            positions.append( self.mIndex[key] )
+
+        if not positions: return []
+
+        if self.mInfileDatabase is None:
+            self.mInfileDatabase = open( self.mFilenameProfiles, "rb" )
+
+        order = sorted( range(len(positions)), key = lambda x: positions[x][0] )
+
+        # advise the operating system to read ahead
+        if hasattr( os, "posix_fadvise" ):
+            start = positions[order[0]][0]
+            end = max( [ x[1] for x in positions ] )
+            os.posix_fadvise( self.mInfileDatabase.fileno(), start, end - start, 
+                              os.POSIX_FADV_WILLNEED )
+
+        result = [None] * len(positions)
+        last_end = None
+        for x in order:
+            start, end = positions[x]
+            # avoid seeking if profiles are adjacent
+            if start != last_end:
+                self.mInfileDatabase.seek( start )
+            result[x] = alignlib.loadAlignandum( self.mInfileDatabase )
+            last_end = end
+
+        return result
     
     def create( self, infile ):
         """create profile library from file."""
@@ -279,6 +484,166 @@ class ProfileLibrary:
 def getFileNames( name ):
     return name + SUFFIX_DATABASE, name + SUFFIX_INDEX
 
+def getBinaryIndexName( name ):
+    return name + SUFFIX_BINARY_INDEX
+
+def getChecksum( filename ):
+    '''return crc32 checksum of the contents of filename.'''
+    checksum = 0
+    infile = open( filename, "rb" )
+    while 1:
+        buf = infile.read( BUFFER_SIZE )
+        if not buf: break
+        checksum = zlib.crc32( buf, checksum )
+    infile.close()
+    return checksum & 0xffffffff
+
+def writeBinaryIndex( filename, filename_database, index, checksum = None ):
+    '''write a binary index for the profiles in index to filename.
+
+    index maps names to (start, end) positions in filename_database.
+    If checksum is not given, it is computed from filename_database.
+
+    No index is written if there are names that are not nids.
+    '''
+    for key in index.iterkeys():
+        if type(key) not in (types.IntType, types.LongType): return
+
+    if checksum is None: checksum = getChecksum( filename_database )
+
+    nids = numpy.array( sorted( index.keys() ), dtype = "<i8" )
+    positions = numpy.array( [ index[x] for x in nids.tolist() ], dtype = "<i8" )
+    positions.shape = (len(nids), 2)
+
+    header = numpy.zeros( 1, dtype = BINARY_HEADER_DTYPE )
+    header["magic"] = BINARY_MAGIC
+    header["version"] = BINARY_VERSION
+    header["num_profiles"] = len(nids)
+    header["database_size"] = os.path.getsize( filename_database )
+    header["checksum"] = checksum
+
+    outfile = open( filename, "wb" )
+    outfile.write( header.tostring() )
+    outfile.write( nids.tostring() )
+    outfile.write( positions[:,0].copy().tostring() )
+    outfile.write( (positions[:,1] - positions[:,0]).tostring() )
+    outfile.close()
+
+def mergeLibraries( name, parts, force = False ):
+    '''merge the profile libraries in *parts* into a new library *name*.
+
+    The databases are concatenated byte by byte and only the
+    index is rewritten. Profiles are not parsed. Parts with a 
+    binary index are validated against the size and checksum
+    of their database. For duplicate names, the first profile
+    is kept.
+
+    returns a tuple of the number of profiles in the parts, the
+    number of profiles in the merged library and a list of 
+    duplicate names.
+    '''
+
+    filename_database, filename_index = getFileNames( name )
+    if not force and os.path.exists( filename_database ):
+        raise IOError( "profile database %s already exists." % filename_database )
+
+    # write to temporary files that are renamed after success
+    tmpname = os.path.join( os.path.dirname( name ), 
+                            ".%s.tmp%i" % (os.path.basename( name ), os.getpid() ) )
+    tmp_database, tmp_index = getFileNames( tmpname )
+    tmp_binary_index = getBinaryIndexName( tmpname )
+
+    try:
+        ninput, noutput, duplicates = _mergeLibraries( tmpname, parts )
+    except:
+        for filename in (tmp_database, tmp_index, tmp_binary_index):
+            if os.path.exists( filename ): os.remove( filename )
+        raise
+
+    # rename text index last, as it marks the library as complete
+    if os.path.exists( tmp_binary_index ):
+        os.rename( tmp_binary_index, getBinaryIndexName( name ) )
+    elif os.path.exists( getBinaryIndexName( name ) ):
+        os.remove( getBinaryIndexName( name ) )
+    os.rename( tmp_database, filename_database )
+    os.rename( tmp_index, filename_index )
+
+    return ninput, noutput, duplicates
+
+def _mergeLibraries( name, parts ):
+    '''merge parts into library name, see :func:`mergeLibraries`.'''
+
+    filename_database, filename_index = getFileNames( name )
+    outfile = open( filename_database, "wb" )
+    outfile_index = open( filename_index, "w" )
+
+    index = {}
+    duplicates = []
+    checksum, offset, ninput = 0, 0, 0
+
+    for part in parts:
+        part_database, part_filename_index = getFileNames( part )
+        part_binary_index = getBinaryIndexName( part )
+        size = os.path.getsize( part_database )
+
+        part_index = None
+        if os.path.exists( part_binary_index ):
+            # indices of an older version are ignored
+            try:
+                part_index = BinaryIndex( part_binary_index )
+            except ValueError:
+                pass
+
+        if part_index is not None:
+            if part_index.mDatabaseSize != size:
+                raise ValueError( "size mismatch for %s: expected %i, got %i" % \
+                                      (part_database, part_index.mDatabaseSize, size ) )
+            expected = part_index.mChecksum
+        else:
+            part_index = {}
+            for line in open( part_filename_index, "r" ):
+                if line[0] == "#": continue
+                key, first_pos, last_pos = line[:-1].split("\t")
+                part_index[toKey(key)] = (int(first_pos), int(last_pos))
+            expected = None
+
+        entries = [ (part_index[key], key) for key in part_index.iterkeys() ]
+        entries.sort()
+        if entries and entries[-1][0][1] > size:
+            raise ValueError( "index of %s points beyond end of database" % part )
+
+        # copy database and compute checksums on the fly
+        part_checksum = 0
+        infile = open( part_database, "rb" )
+        while 1:
+            buf = infile.read( BUFFER_SIZE )
+            if not buf: break
+            part_checksum = zlib.crc32( buf, part_checksum )
+            checksum = zlib.crc32( buf, checksum )
+            outfile.write( buf )
+        infile.close()
+
+        if expected is not None and part_checksum & 0xffffffff != expected:
+            raise ValueError( "checksum mismatch for %s" % part_database )
+
+        for (start, end), key in entries:
+            ninput += 1
+            if key in index:
+                duplicates.append( key )
+                continue
+            index[key] = (start + offset, end + offset)
+            outfile_index.write( "%s\t%i\t%i\n" % (key, start + offset, end + offset) )
+
+        offset += size
+
+    outfile.close()
+    writeBinaryIndex( getBinaryIndexName( name ), filename_database, index, 
+                      checksum = checksum & 0xffffffff )
+    outfile_index.write( "#//\n" )
+    outfile_index.close()
+
+    return ninput, len(index), duplicates
+
 
 #--------------------------------------------------------
 #--------------------------------------------------------
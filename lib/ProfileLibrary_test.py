@@ -0,0 +1,247 @@
+import unittest, os, glob, re, tempfile, gzip, shutil
+
+import numpy
+
+import ProfileLibrary
+from ProfileCache_test import Profile, Alignlib
+
+class TestProfileLibraryBase(unittest.TestCase):
+
+    def setUp(self):
+        self.mAlignlib = ProfileLibrary.alignlib
+        ProfileLibrary.alignlib = Alignlib
+        self.mTempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        ProfileLibrary.alignlib = self.mAlignlib
+        shutil.rmtree( self.mTempdir )
+
+    def getName( self, name ):
+        return os.path.join( self.mTempdir, name )
+
+    def build( self, name, profiles ):
+        '''build library *name* from a list of (name, data) tuples.'''
+        name = self.getName( name )
+        library = ProfileLibrary.ProfileLibrary( name, "w" )
+        for key, data in profiles: library.add( key, Profile( data ) )
+        library.close()
+        return name
+
+    def checkProfiles( self, name, profiles ):
+        library = ProfileLibrary.ProfileLibrary( name, "r" )
+        self.assertEqual( len(library), len(profiles) )
+        for key, data in profiles:
+            self.assertEqual( library.getProfile( key ).mData, data )
+        return library
+
+class TestMergeLibraries(TestProfileLibraryBase):
+
+    mParts = ( ( (1, "ACD"), (2, "EFGHI") ),
+               ( (3, "K"), (4, "LMNPQ"), (5, "RS") ),
+               ( (6, "TVW"), ) )
+
+    def buildParts( self ):
+        return [ self.build( "part%i" % x, profiles ) for x, profiles in enumerate( self.mParts ) ]
+
+    def getFiles( self ):
+        return sorted( os.listdir( self.mTempdir ) )
+
+    def testMerge( self ):
+        parts = self.buildParts()
+        name = self.getName( "merged" )
+        self.assertEqual( ProfileLibrary.mergeLibraries( name, parts ), (6, 6, []) )
+
+        library = self.checkProfiles( name, sum( self.mParts, () ) )
+        self.assertTrue( isinstance( library.mIndex, ProfileLibrary.BinaryIndex ) )
+        self.assertEqual( library.mIndex.mChecksum, ProfileLibrary.getChecksum( name + ".pdb" ) )
+        self.assertEqual( library.mIndex.mDatabaseSize, os.path.getsize( name + ".pdb" ) )
+
+        # positions are shifted by the size of the preceding parts
+        offset = 0
+        for part in parts:
+            part_library = ProfileLibrary.ProfileLibrary( part, "r" )
+            for key in part_library.keys():
+                start, end = part_library.mIndex[key]
+                self.assertEqual( library.mIndex[key], (start + offset, end + offset) )
+            offset += os.path.getsize( part + ".pdb" )
+
+        # the text index agrees
+        os.remove( name + ".pbx" )
+        library = self.checkProfiles( name, sum( self.mParts, () ) )
+        self.assertTrue( isinstance( library.mIndex, dict ) )
+
+    def testTextIndex( self ):
+        parts = self.buildParts()
+        os.remove( parts[1] + ".pbx" )
+        name = self.getName( "merged" )
+        self.assertEqual( ProfileLibrary.mergeLibraries( name, parts ), (6, 6, []) )
+        self.checkProfiles( name, sum( self.mParts, () ) )
+
+    def testDuplicates( self ):
+        parts = self.buildParts()
+        parts.append( self.build( "dups", ( (4, "DUP"), (7, "Y"), (1, "DUP") ) ) )
+        name = self.getName( "merged" )
+        ninput, noutput, duplicates = ProfileLibrary.mergeLibraries( name, parts )
+        self.assertEqual( (ninput, noutput), (9, 7) )
+        self.assertEqual( sorted( duplicates ), [1, 4] )
+        self.checkProfiles( name, sum( self.mParts, () ) + ( (7, "Y"), ) )
+
+    def testExists( self ):
+        parts = self.buildParts()
+        name = self.getName( "merged" )
+        ProfileLibrary.mergeLibraries( name, parts[:1] )
+        self.assertRaises( IOError, ProfileLibrary.mergeLibraries, name, parts )
+        ProfileLibrary.mergeLibraries( name, parts, force = True )
+        self.checkProfiles( name, sum( self.mParts, () ) )
+
+    def checkFailedMerge( self, parts ):
+        files = self.getFiles()
+        name = self.getName( "merged" )
+        self.assertRaises( ValueError, ProfileLibrary.mergeLibraries, name, parts )
+        # no partial or temporary files are left
+        self.assertEqual( self.getFiles(), files )
+
+    def testChecksumMismatch( self ):
+        parts = self.buildParts()
+        filename = parts[1] + ".pdb"
+        data = open( filename, "rb" ).read()
+        outfile = open( filename, "wb" )
+        outfile.write( data[:-1] + chr( ord( data[-1] ) ^ 1 ) )
+        outfile.close()
+        self.checkFailedMerge( parts )
+
+    def testSizeMismatch( self ):
+        parts = self.buildParts()
+        outfile = open( parts[2] + ".pdb", "ab" )
+        outfile.write( "X" )
+        outfile.close()
+        self.checkFailedMerge( parts )
+
+    def testFailedMergeKeepsLibrary( self ):
+        parts = self.buildParts()
+        name = self.getName( "merged" )
+        ProfileLibrary.mergeLibraries( name, parts[:1] )
+        outfile = open( parts[2] + ".pdb", "ab" )
+        outfile.write( "X" )
+        outfile.close()
+        files = self.getFiles()
+        self.assertRaises( ValueError, ProfileLibrary.mergeLibraries, name, parts, force = True )
+        self.assertEqual( self.getFiles(), files )
+        self.checkProfiles( name, self.mParts[0] )
+
+class TestChecksum(TestProfileLibraryBase):
+
+    def checkChecksum( self, name ):
+        index = ProfileLibrary.BinaryIndex( name + ".pbx" )
+        self.assertEqual( index.mChecksum, ProfileLibrary.getChecksum( name + ".pdb" ) )
+
+    def testWrite( self ):
+        name = self.build( "lib", ( (1, "ACD"), (5, "EF"), (3, "GHIK") ) )
+        self.checkChecksum( name )
+
+    def testAppend( self ):
+        name = self.build( "lib", ( (1, "ACD"), (5, "EF") ) )
+        library = ProfileLibrary.ProfileLibrary( name, "a" )
+        self.assertFalse( os.path.exists( name + ".pbx" ) )
+        library.add( 7, Profile( "GHIK" ) )
+        library.close()
+        self.checkChecksum( name )
+        self.checkProfiles( name, ( (1, "ACD"), (5, "EF"), (7, "GHIK") ) )
+
+    def testAppendWithoutBinaryIndex( self ):
+        name = self.build( "lib", ( (1, "ACD"), (5, "EF") ) )
+        os.remove( name + ".pbx" )
+        library = ProfileLibrary.ProfileLibrary( name, "a" )
+        library.add( 7, Profile( "GHIK" ) )
+        library.close()
+        self.checkChecksum( name )
+        self.checkProfiles( name, ( (1, "ACD"), (5, "EF"), (7, "GHIK") ) )
+
+class TestBinaryIndex(TestProfileLibraryBase):
+
+    mProfiles = ( (12, "ACD"), (5, "EF"), (300, "GHIK"), (7, "") )
+
+    def setHeader( self, filename, field, value ):
+        header = numpy.fromfile( filename, dtype = ProfileLibrary.BINARY_HEADER_DTYPE, count = 1 )
+        header[field] = value
+        outfile = open( filename, "r+b" )
+        outfile.write( header.tostring() )
+        outfile.close()
+
+    def testRoundTrip( self ):
+        name = self.build( "lib", self.mProfiles )
+        library = self.checkProfiles( name, self.mProfiles )
+        self.assertTrue( isinstance( library.mIndex, ProfileLibrary.BinaryIndex ) )
+        self.assertEqual( sorted( library.keys() ), [5, 7, 12, 300] )
+        self.assertEqual( library.getLastInsertedKey(), 7 )
+        for key in (5, "5"):
+            self.assertTrue( key in library )
+            self.assertEqual( library.getProfile( key ).mData, "EF" )
+        for key in (6, "6", 1000, "abc"):
+            self.assertFalse( key in library )
+            self.assertRaises( KeyError, library.getProfile, key )
+        self.assertEqual( [ x.mData for x in library.getProfiles( [300, 12, 300] ) ],
+                          ["GHIK", "ACD", "GHIK"] )
+
+    def testIndexAgrees( self ):
+        name = self.build( "lib", self.mProfiles )
+        index = ProfileLibrary.BinaryIndex( name + ".pbx" )
+        os.remove( name + ".pbx" )
+        library = ProfileLibrary.ProfileLibrary( name, "r" )
+        self.assertTrue( isinstance( library.mIndex, dict ) )
+        for key in library.keys():
+            self.assertEqual( index[key], library.mIndex[key] )
+        self.assertEqual( index.mDatabaseSize, os.path.getsize( name + ".pdb" ) )
+
+    def testEmpty( self ):
+        name = self.build( "lib", () )
+        library = ProfileLibrary.ProfileLibrary( name, "r" )
+        self.assertTrue( isinstance( library.mIndex, ProfileLibrary.BinaryIndex ) )
+        self.assertEqual( len(library), 0 )
+        self.assertEqual( library.getProfiles( [] ), [] )
+
+    def testNames( self ):
+        # no binary index for names that are not nids
+        profiles = ( ("abc", "ACD"), (5, "EF") )
+        name = self.build( "lib", profiles )
+        self.assertFalse( os.path.exists( name + ".pbx" ) )
+        self.checkProfiles( name, profiles )
+
+    def testWriteBinaryIndex( self ):
+        name = self.build( "lib", self.mProfiles )
+        library = ProfileLibrary.ProfileLibrary( name, "r" )
+        index = dict( [ (key, library.mIndex[key]) for key in library.keys() ] )
+        filename = self.getName( "other.pbx" )
+        ProfileLibrary.writeBinaryIndex( filename, name + ".pdb", index )
+        other = ProfileLibrary.BinaryIndex( filename )
+        self.assertEqual( other.mChecksum, ProfileLibrary.getChecksum( name + ".pdb" ) )
+        self.assertEqual( sorted( other.keys() ), sorted( index.keys() ) )
+
+    def testStaleSize( self ):
+        name = self.build( "lib", self.mProfiles )
+        outfile = open( name + ".pdb", "ab" )
+        outfile.write( "X" )
+        outfile.close()
+        library = self.checkProfiles( name, self.mProfiles )
+        self.assertTrue( isinstance( library.mIndex, dict ) )
+
+    def testOldVersion( self ):
+        name = self.build( "lib", self.mProfiles )
+        self.setHeader( name + ".pbx", "version", ProfileLibrary.BINARY_VERSION - 1 )
+        self.assertRaises( ValueError, ProfileLibrary.BinaryIndex, name + ".pbx" )
+        library = self.checkProfiles( name, self.mProfiles )
+        self.assertTrue( isinstance( library.mIndex, dict ) )
+
+        # merging uses the text index of the part
+        merged = self.getName( "merged" )
+        self.assertEqual( ProfileLibrary.mergeLibraries( merged, [name] ), (4, 4, []) )
+        self.checkProfiles( merged, self.mProfiles )
+
+    def testBadMagic( self ):
+        name = self.build( "lib", self.mProfiles )
+        self.setHeader( name + ".pbx", "magic", "XXXXXXXX" )
+        library = self.checkProfiles( name, self.mProfiles )
+        self.assertTrue( isinstance( library.mIndex, dict ) )
+
+if __name__ == '__main__':
+    unittest.main()
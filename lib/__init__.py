@@ -25,6 +25,9 @@ __all__ = [
            "SegmentedFile",
            "FileSlice",
            "ProfileLibrary",
+           "ProfileCache",
+           "DomainStore",
+           "NidMap",
            "FastaIterator",
            "AddaSequences",
            "AddaCluster",
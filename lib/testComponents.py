@@ -1,4 +1,6 @@
-import unittest, os, glob, re, tempfile, gzip
+import unittest, os, glob, re, tempfile, gzip, random
+
+import numpy
 
 from Components import *
 
@@ -33,5 +35,54 @@ class TestSComponents(unittest.TestCase, MyTest):
         self.assertEqual( c.getNumNodes(), 6 )
         self.assertEqual( c.getComponents(), [["1", "2", "3"], ["4", "5", "6"]] )
 
+class TestComponentLabels(unittest.TestCase, MyTest):
+
+    def testLinks( self ):
+        a, b = zip( *self.links )
+        labels = getComponentLabels( a, b, 8 )
+        self.assertEqual( list(labels), [0,1,1,1,2,2,2,3] )
+
+    def testEmpty( self ):
+        labels = getComponentLabels( [], [], 4 )
+        self.assertEqual( list(labels), [0,1,2,3] )
+        labels = getComponentLabels( [], [], 0 )
+        self.assertEqual( len(labels), 0 )
+
+    def testSelfLoops( self ):
+        labels = getComponentLabels( [0,2,2], [0,2,3], 5 )
+        self.assertEqual( list(labels), [0,1,2,2,3] )
+
+    def testOutOfRange( self ):
+        self.assertRaises( ValueError, getComponentLabels, [0,1], [1,4], 4 )
+        self.assertRaises( ValueError, getComponentLabels, [-1], [1], 4 )
+        self.assertRaises( ValueError, getComponentLabels, [0,1], [1], 4 )
+
+    def testRandom( self ):
+        random.seed( 1 )
+        num_nodes, num_edges = 1000, 600
+        a = [ random.randint( 0, num_nodes - 1 ) for x in range(num_edges) ]
+        b = [ random.randint( 0, num_nodes - 1 ) for x in range(num_edges) ]
+        labels = getComponentLabels( numpy.array( a ), numpy.array( b ), num_nodes )
+
+        # IComponents uses 0 for unknown nodes, so shift ids by one
+        c = IComponents()
+        for x, y in zip( a, b ): c.add( x + 1, y + 1 )
+        components = c.getComponents()
+        for component in components:
+            self.assertEqual( len( set( [ labels[x-1] for x in component ] ) ), 1 )
+        self.assertEqual( len( set( [ labels[component[0]-1] for component in components ] ) ),
+                          len( components ) )
+
+        # nodes without edges are components on their own
+        connected = set( a + b )
+        self.assertEqual( len( set( labels ) ),
+                          len( components ) + num_nodes - len( connected ) )
+
+        # labels are numbered in order of the smallest node
+        first = []
+        for x in labels:
+            if x not in first: first.append( x )
+        self.assertEqual( first, range( len(first) ) )
+
 if __name__ == '__main__':
     unittest.main()
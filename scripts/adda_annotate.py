@@ -76,7 +76,7 @@ def annotateAlignmentGraph( infile, outfiles ):
     toDomain = AddaIO.toDomain
     # build map of id to nid
     E.info( "reading map between pid and nid" )
-    map_nid2pid = AddaIO.readMapPid2Nid( open(PARAMS["eval_filename_adda_nids"], "r") )
+    map_nid2pid = AddaIO.openMapId2Nid( PARAMS["eval_filename_adda_nids"] ).getNid2Id()
 
     def getOverlappingDomains( pid, start, end ):
         '''get domains overlapping pid:start..end'''
@@ -5,11 +5,12 @@ USAGE="""adda.py [OPTIONS] cmds
 interface to compute adda
 """
 
-import sys, os, re, time, math, copy, glob, optparse, logging, traceback, shelve, types
+import sys, os, re, time, math, copy, glob, optparse, logging, traceback, types
 from multiprocessing import Process, cpu_count, Pool
 import multiprocessing
 
 import fileinput
+import numpy
 import cadda
 
 import Adda.Experiment as E
@@ -61,10 +62,7 @@ class RunOnGraph(Run):
         if command == "fit":
 
             L.info( "loading map_id2nid from %s" % config.get( "output", "nids", "adda.nids" ))
-            infile = open( config.get( "output", "nids", "adda.nids" ) )
-            self.mMapId2Nid = AddaIO.readMapId2Nid( infile, 
-                                                    storage = config.get( "adda", "storage_nids", "memory" ) )
-            infile.close()
+            self.mMapId2Nid = AddaIO.openMapId2Nid( config.get( "output", "nids", "adda.nids" ) )
 
             L.info( "loading domain boundaries from %s" % config.get( "input", "reference") )
             infile = AddaIO.openStream( config.get( "input", "reference") )
@@ -85,6 +83,58 @@ class RunOnGraph(Run):
 
         self.mFilenameGraph = config.get( "output", "graph", "adda.graph")
         self.mFilenameIndex = config.get( "output", "index", "adda.graph.index")
+        self.mGraphAccess = config.get( "adda", "graph_access", "mmap" )
+        self.mSchedule = config.get( "adda", "schedule", "cost" )
+        self.mBoundaries = None
+
+    def getNids( self ):
+        """return sorted list of nids to work with."""
+        nids = map(int, self.mFasta.keys())
+        nids.sort()
+        return nids
+
+    def prepare( self, nchunks ):
+        """split the nids into *nchunks* contiguous chunks.
+
+        With the ``cost`` schedule, the chunks are balanced by the
+        size of the records of each nid in the graph index. Otherwise,
+        each chunk receives the same number of nids.
+
+        returns a list with the cost of each chunk.
+        """
+        nids = self.getNids()
+
+        if self.mSchedule == "cost":
+            index = cadda.IndexedNeighbours( self.mFilenameGraph, 
+                                             self.mFilenameIndex,
+                                             mode = self.mGraphAccess )
+            sizes = index.getRecordSizes()
+            del index
+            # count each nid to account for the overhead per nid
+            costs = numpy.ones( len(nids), dtype = numpy.int64 )
+            nids_array = numpy.array( nids, dtype = numpy.int64 )
+            valid = nids_array < len(sizes)
+            costs[valid] += sizes[nids_array[valid]]
+            cumulative = numpy.cumsum( costs )
+            targets = cumulative[-1] * numpy.arange( 1, nchunks ) / float(nchunks)
+            # assign each nid to the chunk containing the midpoint of its cost
+            midpoints = cumulative - costs / 2.0
+            boundaries = [0] + list( numpy.searchsorted( midpoints, targets ) ) + [len(nids)]
+            cumulative = numpy.append( 0, cumulative )
+            chunk_costs = [ int(cumulative[boundaries[x+1]] - cumulative[boundaries[x]]) for x in range(nchunks) ]
+        elif self.mSchedule == "nids":
+            increment = int( math.ceil( len(nids) / float(nchunks) ) )
+            boundaries = [ min( x * increment, len(nids) ) for x in range( nchunks + 1 ) ]
+            chunk_costs = [ boundaries[x+1] - boundaries[x] for x in range(nchunks) ]
+        else:
+            raise ValueError( "unknown schedule `%s`" % self.mSchedule )
+
+        self.mBoundaries = map( int, boundaries )
+
+        L.info( "schedule %s: chunk costs min=%i, max=%i, total=%i" % \
+                    (self.mSchedule, min(chunk_costs), max(chunk_costs), sum(chunk_costs) ) )
+
+        return chunk_costs
 
     def __call__(self, argv ):
         """run job, catching all exceptions and returning a tuple."""
@@ -108,7 +158,7 @@ class RunOnGraph(Run):
         if self.mLoadMapNid2Domains and self.mMapNid2Domains == None:
             # load all maps that were not inherited from the parent process
             L.info( "opening map_nid2domains from cache" )
-            self.mMapNid2Domains = shelve.open( config.get( "adda", "storage_domains", "memory" ), "r")
+            self.mMapNid2Domains = DomainStore.loadDomainStore( config.get( "adda", "storage_domains", "memory" ) )
 
         # build the modules
         if module( config = config, 
@@ -132,27 +182,33 @@ class RunOnGraph(Run):
         module.startUp()
 
         # find out nids to work with
-        nids = map(int, self.mFasta.keys())
-        nids.sort()
-        increment = int( math.ceil( len(nids) / float(nchunks) ) )
-        start = chunk * increment
-        nids = nids[start:start+increment]
-        
+        if self.mBoundaries == None or len(self.mBoundaries) != nchunks + 1:
+            self.prepare( nchunks )
+        nids = self.getNids()[self.mBoundaries[chunk]:self.mBoundaries[chunk+1]]
+
+        if len(nids) == 0:
+            L.info( "chunk %i: no nids to work with" % (chunk,) )
+            module.finish()
+            return
+
         L.info( "chunk %i: starting work on %i nids from %s to %s" % (chunk, len(nids), str(nids[0]), str(nids[-1]) ) )
 
-        index = cadda.IndexedNeighbours( self.mFilenameGraph, self.mFilenameIndex )
+        index = cadda.IndexedNeighbours( self.mFilenameGraph, 
+                                         self.mFilenameIndex,
+                                         mode = self.mGraphAccess )
 
         iteration = 0
         for nid in nids:
             iteration += 1
-            neighbours = index.getNeighbours( nid )
+            record = AddaIO.getNeighbours( index, nid, module.mNeighboursFormat )
+            nneighbours = len(record.mMatches)
 
-            L.info( "chunk %i: started nid=%s, neighbours=%i, progress=%i/%i (%5.1f%%)" % (chunk, str(nid), len(neighbours), iteration, len(nids), 100.0 * iteration / len(nids) ) )
+            L.info( "chunk %i: started nid=%s, neighbours=%i, progress=%i/%i (%5.1f%%)" % (chunk, str(nid), nneighbours, iteration, len(nids), 100.0 * iteration / len(nids) ) )
 
-            if neighbours:
-                module.run( AddaIO.NeighboursRecord( nid, neighbours ) )
+            if nneighbours > 0:
+                module.run( record )
 
-            L.info( "chunk %i: finished nid=%s, neighbours=%i, progress=%i/%i (%5.1f%%)" % (chunk, str(nid), len(neighbours), iteration, len(nids), 100.0 * iteration / len(nids) ) )
+            L.info( "chunk %i: finished nid=%s, neighbours=%i, progress=%i/%i (%5.1f%%)" % (chunk, str(nid), nneighbours, iteration, len(nids), 100.0 * iteration / len(nids) ) )
             
             if options.test and iteration >= options.test:
                 break
@@ -288,13 +344,20 @@ def runParallel( runner, filename, options, module, config, kwargs ):
         nchunks, chunks = getChunks( options, config )
         args = [ (filename, chunk, nchunks, options, module, config, kwargs ) for chunk in chunks ]
 
+    if hasattr( runner, "prepare" ):
+        # start with the most expensive chunks 
+        costs = runner.prepare( nchunks )
+        args.sort( key = lambda x: -costs[x[1]] )
+
     L.info( "running %i chunks in %i parallel jobs" % (len(chunks), njobs ))
 
     logging.info('starting parallel jobs')
 
     pool = Pool( njobs )
 
-    errors = pool.map( runner, args )
+    # submit chunks one at a time so that idle workers pick
+    # up the next chunk as soon as they are finished.
+    errors = list( pool.imap_unordered( runner, args, chunksize = 1 ) )
     pool.close()
     pool.join()
 
@@ -313,12 +376,16 @@ def runParallel( runner, filename, options, module, config, kwargs ):
 def runSequentially( runner, filename, options, module, config, kwargs ):
     """process filename sequentially."""
 
-    nchunks, chunks = getChunks( options, config )
+    if type(filename) in (types.TupleType, types.ListType):
+        nchunks = len( filename )
+        chunks = range( nchunks )
+        args = [ (filename[chunk], chunk, nchunks, options, module, config, kwargs ) for chunk in chunks ]
+    else:
+        nchunks, chunks = getChunks( options, config )
+        args = [ (filename, chunk, nchunks, options, module, config, kwargs ) for chunk in chunks ]
     
     L.info( "running %i chunks sequentially" % (len(chunks) ))
 
-    args = [ (filename, chunk, nchunks, options, module, config, kwargs ) for chunk in chunks ]
-
     for (job, argv) in enumerate(args):
         L.info( "job %i started" % job )
         error = runner( argv )
@@ -470,9 +537,15 @@ def main():
             E.info("output of command `%s` present and complete" % options.command )
         else:
             filename_graph = config.get( "input", "graph", "pairsdb_40x40.links.gz")
-            if "," in filename_graph:
-                filename_graph = filename_graph.split(",")
-                # permit parallel processing of multiple files
+            nshards = config.get( "adda", "index_shards", 1 )
+            if "," in filename_graph or nshards > 1:
+                if "," in filename_graph:
+                    # permit parallel processing of multiple files
+                    filename_graph = filename_graph.split(",")
+                else:
+                    # each shard indexes a disjoint set of queries
+                    filename_graph = [ filename_graph ] * nshards
+
                 run_parallel( 
                     run_on_files,
                     filename = filename_graph,
@@ -516,7 +589,7 @@ def main():
             module.run()
             module.finish()
 
-    elif options.command in ("fit", "segment"): 
+    elif options.command in ("fit", "segment", "profiles"): 
 
         run_on_graph = RunOnGraph( config, options.command )
 
@@ -537,9 +610,20 @@ def main():
 
     elif options.command in ("align" ):
 
+        filename_mst = config.get( "output", "mst", "adda.mst" )
+
+        # order links so that each chunk works on a range of sequences
+        if config.get( "align", "schedule", "nids" ) == "nids":
+            filename_ordered = filename_mst + ".ordered"
+            if not SegmentedFile.isComplete( filename_ordered ):
+                L.info( "ordering links in %s by nid" % filename_mst )
+                nlinks = AddaAlign.orderLinks( filename_mst, filename_ordered )
+                L.info( "ordered %i links into %s" % (nlinks, filename_ordered) )
+            filename_mst = filename_ordered
+
         run_parallel( 
             run_on_file,
-            filename = config.get( "output", "mst", "adda.mst" ),
+            filename = filename_mst,
             options = options,
             module = map_module[options.command],
             config = config,
@@ -16,6 +16,7 @@ cadda = Extension(
     [ "src/cadda.pyx",        # filename of our Pyrex/Cython source
         'src/cadda_parameters.cpp',
         'src/cadda_io.cpp',
+        'src/cadda_codec.cpp',
         'src/cadda_optimise.cpp',
         'src/cadda_index.cpp', 
         'src/cadda_convert.cpp',
@@ -23,7 +24,7 @@ cadda = Extension(
         'src/gzstream.C'],
     library_dirs=[],
     include_dirs=["src",],
-    libraries=["z"],              
+    libraries=["z", "pthread"],              
     language="c++",               # this causes Pyrex/Cython to create C++ source
     )
 
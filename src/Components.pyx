@@ -21,8 +21,13 @@ USAGE:
 # retrieve components
 >>> print x.getComponents()
 
+For large graphs, :func:`getComponentLabels` computes components
+for edges given as numpy arrays of integer node ids.
+
 This is a cython extension class."""
 
+import numpy
+
 cdef extern from "connected_components.h":
 
     ctypedef struct cSComponents "CharComponents":
@@ -150,3 +155,65 @@ cdef class IComponents:
         """clear graph.
         """
         self.thisptr.reset()
+
+def getComponentLabels( a, b, num_nodes ):
+    """compute connected components for the edges between
+    the nodes in the integer arrays *a* and *b*. Nodes are 
+    numbered from 0 to *num_nodes* - 1.
+
+    return an array with the component label of each node. 
+    Components are numbered consecutively from 0 in the order
+    of their smallest node.
+    """
+    a = numpy.ascontiguousarray( a, dtype = numpy.int64 )
+    b = numpy.ascontiguousarray( b, dtype = numpy.int64 )
+    if len(a) != len(b):
+        raise ValueError( "arrays of different length: %i != %i" % (len(a), len(b)) )
+    if len(a) > 0 and (min( a.min(), b.min() ) < 0 or max( a.max(), b.max() ) >= num_nodes):
+        raise ValueError( "node ids out of range 0 to %i" % num_nodes )
+
+    parents = numpy.arange( num_nodes, dtype = numpy.int64 )
+    labels = numpy.empty( num_nodes, dtype = numpy.int64 )
+
+    cdef size_t address
+    cdef long long * pa, * pb, * parent, * label
+    address = a.__array_interface__["data"][0]
+    pa = <long long *>address
+    address = b.__array_interface__["data"][0]
+    pb = <long long *>address
+    address = parents.__array_interface__["data"][0]
+    parent = <long long *>address
+    address = labels.__array_interface__["data"][0]
+    label = <long long *>address
+
+    cdef long long i, j, x, n, nedges
+    n = num_nodes
+    nedges = len(a)
+
+    # union-find with path halving. The root of each component 
+    # is its smallest node.
+    for x from 0 <= x < nedges:
+        i = pa[x]
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        j = pb[x]
+        while parent[j] != j:
+            parent[j] = parent[parent[j]]
+            j = parent[j]
+        if i < j: parent[j] = i
+        elif j < i: parent[i] = j
+
+    # roots precede all other nodes in their component
+    cdef long long ncomponents = 0
+    for x from 0 <= x < n:
+        i = x
+        while parent[i] != i:
+            i = parent[i]
+        if i == x:
+            label[x] = ncomponents
+            ncomponents += 1
+        else:
+            label[x] = label[i]
+
+    return labels
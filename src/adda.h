@@ -63,12 +63,55 @@ typedef std::vector<Nid> NidMap;
 typedef ogzstream OutStream;
 typedef igzstream InStream;
 
+//------------------------------------------------------------------------
+// ADDA graph format
+//
+// Version 2 graphs start with a GraphHeader. Each record is
+// followed by the uncompressed and compressed size of its data
+// and the data split into blocks of at most chunk_size bytes.
+// Graphs without header are version 1 graphs with a single
+// zlib compressed block per record.
+#define GRAPH_MAGIC "ADDAGRPH"
+#define GRAPH_MAGIC_LENGTH 8
+#define GRAPH_VERSION 2
+#define GRAPH_CODEC_ZLIB 0
+#define GRAPH_CODEC_LZF 1
+#define GRAPH_DEFAULT_CHUNK_SIZE 4194304
+// maximum record size in version 1 graphs
+#define GRAPH_LEGACY_BUFFER_SIZE 100000000
+
+struct GraphHeader
+{
+  char magic[GRAPH_MAGIC_LENGTH];
+  unsigned int version;
+  unsigned int codec;
+  int level;
+  unsigned int chunk_size;
+};
+
+void initGraphHeader( GraphHeader *, unsigned int, int, unsigned int );
+int writeGraphHeader( FILE *, const GraphHeader * );
+int readGraphHeader( FILE *, GraphHeader * );
+long parseGraphHeader( const unsigned char *, size_t, GraphHeader * );
+int readRecordHeader( FILE *, GraphHeader *, Nid *, size_t *, void * );
+int toCompressedRecord( const GraphHeader *, const unsigned char *, size_t, FILE * );
+int fromCompressedRecord( const GraphHeader *, unsigned char **, size_t *, size_t *, FILE * );
+long fromCompressedMemory( const GraphHeader *, unsigned char **, size_t *, size_t *, const unsigned char *, size_t );
+int skipCompressedRecord( const GraphHeader *, FILE * );
+
+size_t compressBlock( unsigned int, int, unsigned char *, size_t, const unsigned char *, size_t );
+int decompressBlock( unsigned int, unsigned char *, size_t, const unsigned char *, size_t );
+
 //------------------------------------------------------------------------
 FILE * openFileForRead( const std::string & filename );
 FILE * openFileForWrite( const std::string & filename );
 int toCompressedFile( unsigned char *, size_t, FILE *);
 int fromCompressedFile( unsigned char *, size_t, FILE *);
 void fillFileIndexMap( FileIndexMap & map_nid2fileindex, std::string & file_name_index);
+unsigned char * mapFile( const char *, size_t *);
+int unmapFile( unsigned char *, size_t);
+long fileIndexToOffset( const void * );
+void offsetToFileIndex( long, void * );
 
 //------------------------------------------------------------------------
 template< class Array >
@@ -169,23 +212,21 @@ typedef std::vector< LinkList > Links;
 /** fill links from infile.
 
     The infile is a compressed ADDA graph. It is assumed to
-    be correctly positioned.
+    be correctly positioned. The header is the header of the 
+    graph as returned by readGraphHeader.
 */
 template< class OutputIter >
 void fillLinks( FILE * infile,
+		const GraphHeader & header,
 		const Nid & nid,
 		OutputIter it)
 {
 
   size_t nneighbours;
   Nid query_nid;
-	
-  int n = 0;
-  
-  n = fread( &query_nid, sizeof(Nid), 1, infile );
-  n += fread( &nneighbours, sizeof(size_t), 1, infile );
-  
-  if (n != 2 || ferror( infile ))
+  GraphHeader h = header;
+
+  if (readRecordHeader( infile, &h, &query_nid, &nneighbours, NULL ) != 0)
     {
       std::cerr << "error while reading neighbours: can not read query_nid" << std::endl;
       exit(EXIT_FAILURE);
@@ -200,9 +241,10 @@ void fillLinks( FILE * infile,
   if (query_nid == 0) return;
   
   
-#define MAX_BUFFER_SIZE 100000000
-  unsigned char * buffer = (unsigned char *)calloc( MAX_BUFFER_SIZE, sizeof(unsigned char) );
-  int retval = fromCompressedFile( buffer, MAX_BUFFER_SIZE, infile );
+  unsigned char * buffer = NULL;
+  size_t allocated = 0;
+  size_t size = 0;
+  int retval = fromCompressedRecord( &header, &buffer, &allocated, &size, infile );
   if (retval != 0)
     {
       std::cerr << "error during uncompression for nid " << query_nid << ":" << retval << std::endl;
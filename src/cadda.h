@@ -17,6 +17,7 @@ void cadda_setFilenameDomains( const char * f);
 void cadda_setFilenameTransfers( const char * f);
 void cadda_setFilenameDomainGraph( const char * f);
 void cadda_setFilenameMst( const char * f);
+void cadda_setFilenameLinkCache( const char * f);
 
 void cadda_setDisallowShortening( int f);
 void cadda_setDescend( int f);
@@ -25,6 +26,10 @@ void cadda_setOnlyQuery( int f);
 void cadda_setRelativeOverhang( int f);
 
 void cadda_setMaxIterations( int f);
+void cadda_setNumThreads( int f);
+void cadda_setLinkCache( int f);
+void cadda_setLinkCacheMemory( int f);
+void cadda_setIncremental( int f);
 
 void cadda_setResolution( double f);
 void cadda_setK( double f) ;
@@ -35,6 +40,7 @@ void cadda_setE( double f) ;
 void cadda_setF( double f) ;
 void cadda_setLogLevel( int f);
 void cadda_setReportStep( int f);
+void cadda_setMstSortMemory( int f);
 
 void cadda_setEvalueThresholdTrustedLinks( double f);
 
@@ -59,6 +65,11 @@ int cadda_convert( const char * f);
 int cadda_build_mst( const char * out,
 		     const char * in);
 
+// sort edges and construct mst
+int cadda_sort_build_mst( const char * out,
+			  const char * in,
+			  const char * tmpdir );
+
 // dump parameters
 void cadda_dump_parameters();
 
@@ -67,3 +78,15 @@ int toCompressedFile( unsigned char *, size_t, FILE *);
 
 // read buffer to file with compression
 int fromCompressedFile( unsigned char *, size_t, FILE *);
+
+// map file read-only into memory
+unsigned char * mapFile( const char *, size_t *);
+
+// release memory mapped file
+int unmapFile( unsigned char *, size_t);
+
+// convert file position to byte offset
+long fileIndexToOffset( const void * );
+
+// convert byte offset to file position
+void offsetToFileIndex( long, void * );
@@ -74,6 +74,7 @@ cdef extern from "cadda.h":
     long cadda_optimise_get_num_partitions()
     int cadda_convert( char * )
     long cadda_build_mst( char *, char * )
+    long cadda_sort_build_mst( char *, char *, char * )
     int cadda_build_index()
     int cadda_check_index()
     void cadda_dump_parameters()
@@ -85,9 +86,11 @@ cdef extern from "cadda.h":
     void cadda_setFilenameDomains( char *)
     void cadda_setFilenameDomainGraph( char *)
     void cadda_setFilenameMst( char *)
+    void cadda_setFilenameLinkCache( char *)
     void cadda_setLogLevel(int)
     void cadda_setResolution( int )
     void cadda_setReportStep( int )
+    void cadda_setMstSortMemory( int )
     void cadda_setK(double)
     void cadda_setC(double)
     void cadda_setMax(double)
@@ -99,10 +102,18 @@ cdef extern from "cadda.h":
     void cadda_setDescend( int )
     void cadda_setDisallowShortening( int )
     void cadda_setMaxIterations( int )
+    void cadda_setNumThreads( int )
+    void cadda_setLinkCache( int )
+    void cadda_setLinkCacheMemory( int )
+    void cadda_setIncremental( int )
     void cadda_setEvalueThresholdTrustedLinks( double) 
     int toCompressedFile( unsigned char *, size_t, FILE * )
     int fromCompressedFile( unsigned char *, size_t, FILE * )
-    
+    unsigned char * mapFile( char *, size_t * )
+    int unmapFile( unsigned char *, size_t )
+    long fileIndexToOffset( void * )
+    void offsetToFileIndex( long, void * )
+
 def optimise_iteration():
     return cadda_optimise_iteration()
 
@@ -127,6 +138,9 @@ def convert( filename):
 def build_mst( out_filename, in_filename ):
     return cadda_build_mst( out_filename, in_filename )
 
+def sort_build_mst( out_filename, in_filename, tmpdir ):
+    return cadda_sort_build_mst( out_filename, in_filename, tmpdir )
+
 def build_index():
     return cadda_build_index()
 
@@ -168,6 +182,10 @@ def setFilenameTransfers(v):
     """set input filename with transfer data."""
     cadda_setFilenameTransfers(v)
 
+def setFilenameLinkCache(v):
+    """set filename for links spilled from the link cache."""
+    cadda_setFilenameLinkCache(v)
+
 def setLogLevel(v):
     """set the logging level."""
     cadda_setLogLevel(v)
@@ -220,18 +238,37 @@ def setMaxIterations(v):
     """set the maximum number of iterations."""
     cadda_setMaxIterations( v )
 
+def setNumThreads(v):  
+    """set the number of threads for optimisation."""
+    cadda_setNumThreads( v )
+
+def setLinkCache(v):  
+    """if true, cache links during optimisation."""
+    cadda_setLinkCache( v )
+
+def setLinkCacheMemory(v):  
+    """set the memory (in Mb) for cached links."""
+    cadda_setLinkCacheMemory( v )
+
+def setIncremental(v):  
+    """if true, only optimise sequences whose neighbourhood changed."""
+    cadda_setIncremental( v )
+
 def setReportStep(v):
     """set reporting interval."""
     cadda_setReportStep(v)
     
+def setMstSortMemory(v):
+    """set the memory (in Mb) for sorting edges of the mst."""
+    cadda_setMstSortMemory(v)
+
 def setEvalueThresholdTrustedLinks( v ):
     """set evalue threshold for trusted links.""" 
     cadda_setEvalueThresholdTrustedLinks( v )
     
+import os
 import alignlib
-
-# 100Mb
-DEF MAX_BUFFER_SIZE = 100000000
+import numpy
 
 cdef extern from "adda.h":
 
@@ -241,6 +278,30 @@ cdef extern from "adda.h":
     ctypedef int Length
     ctypedef int uResidue
 
+    ctypedef struct GraphHeader:
+        unsigned int version
+        unsigned int codec
+        int level
+        unsigned int chunk_size
+
+    int GRAPH_CODEC_ZLIB
+    int GRAPH_CODEC_LZF
+    int GRAPH_DEFAULT_CHUNK_SIZE
+
+    void initGraphHeader( GraphHeader *, unsigned int, int, unsigned int )
+    int writeGraphHeader( FILE *, GraphHeader * )
+    int readGraphHeader( FILE *, GraphHeader * )
+    long parseGraphHeader( unsigned char *, size_t, GraphHeader * )
+    int readRecordHeader( FILE *, GraphHeader *, Nid *, size_t *, void * )
+    int toCompressedRecord( GraphHeader *, unsigned char *, size_t, FILE * )
+    int fromCompressedRecord( GraphHeader *, unsigned char **, size_t *, size_t *, FILE * )
+    long fromCompressedMemory( GraphHeader *, unsigned char **, size_t *, size_t *, unsigned char *, size_t )
+    int skipCompressedRecord( GraphHeader *, FILE * )
+
+# codecs for compressing the graph
+GraphCodecs = { "zlib" : GRAPH_CODEC_ZLIB,
+                "lzf" : GRAPH_CODEC_LZF }
+
 ## todo: convert to a class
 ctypedef struct Neighbour:
     Nid sbjct_nid
@@ -412,6 +473,88 @@ cdef unsigned char * fromBuffer( Neighbour * n, unsigned char * buffer):
 
     return buffer
 
+cdef unsigned char * viewBuffer( Neighbour * n, unsigned char * buffer):
+    '''point *n* at data in buffer without copying.
+
+    The alignment strings in *n* refer to *buffer* and are only 
+    valid as long as *buffer* is not modified. Do not call
+    destroy_neighbour on *n*.
+
+    returns pointer to position in buffer after reading one entry
+    '''
+    cdef size_t s
+    s = sizeof( Neighbour ) - 2 * sizeof( char * )
+    memcpy( n, buffer, s )
+    buffer += s
+
+    n.query_ali = <char*>buffer
+    buffer += sizeof( char ) * ( n.query_alen + 1)
+
+    n.sbjct_ali = <char*>buffer
+    buffer += sizeof( char ) * ( n.sbjct_alen + 1)
+
+    return buffer
+
+# numeric part of a neighbour as stored in the arrays
+# returned by getNeighboursArray.
+ctypedef struct NeighbourColumns:
+    Nid sbjct_nid
+    float evalue
+    uResidue query_start
+    uResidue query_end
+    uResidue sbjct_start
+    uResidue sbjct_end
+
+# numpy equivalent of NeighbourColumns
+NeighbourDtype = numpy.dtype( [ ("sbjct_nid", "i%i" % sizeof(Nid) ),
+                                ("evalue", "f4" ),
+                                ("query_start", "u%i" % sizeof(uResidue) ),
+                                ("query_end", "u%i" % sizeof(uResidue) ),
+                                ("sbjct_start", "u%i" % sizeof(uResidue) ),
+                                ("sbjct_end", "u%i" % sizeof(uResidue) ) ],
+                              align = True )
+
+assert NeighbourDtype.itemsize == sizeof( NeighbourColumns ), \
+    "numpy and C layout of neighbours differ"
+
+cdef fillArray( unsigned char * buffer, size_t nneighbours ):
+    '''convert *nneighbours* neighbours in *buffer* into a numpy array
+    of type :data:`NeighbourDtype`.
+    '''
+    result = numpy.empty( nneighbours, dtype = NeighbourDtype )
+    if nneighbours == 0: return result
+
+    cdef size_t address, i
+    address = result.__array_interface__["data"][0]
+    cdef NeighbourColumns * dest
+    dest = <NeighbourColumns *>address
+
+    cdef Neighbour neighbour
+    for i from 0 <= i < nneighbours:
+        buffer = viewBuffer( &neighbour, buffer )
+        dest[i].sbjct_nid = neighbour.sbjct_nid
+        dest[i].evalue = neighbour.evalue
+        dest[i].query_start = neighbour.query_start
+        dest[i].query_end = neighbour.query_end
+        dest[i].sbjct_start = neighbour.sbjct_start
+        dest[i].sbjct_end = neighbour.sbjct_end
+
+    return result
+
+cdef fillAlignments( unsigned char * buffer, size_t nneighbours ):
+    '''return lists with the query and sbjct alignment strings 
+    of *nneighbours* neighbours in *buffer*.
+    '''
+    query_alis, sbjct_alis = [], []
+    cdef size_t i
+    cdef Neighbour neighbour
+    for i from 0 <= i < nneighbours:
+        buffer = viewBuffer( &neighbour, buffer )
+        query_alis.append( neighbour.query_ali )
+        sbjct_alis.append( neighbour.sbjct_ali )
+
+    return query_alis, sbjct_alis
+
 DEF Z_OK           = 0
 DEF Z_STREAM_END   = 1
 DEF Z_NEED_DICT    = 2
@@ -422,7 +565,32 @@ DEF Z_MEM_ERROR    = (-4)
 DEF Z_BUF_ERROR    = (-5)
 DEF Z_VERSION_ERROR = (-6)
     
-def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename_index, logger ):
+cdef saveIndex( output_filename_index, FileIndex * index, char * seen, Nid nnids ):
+    '''save index to file.
+
+    File positions of nids without neighbours are set to the 
+    place holder entry of nid 0.
+    '''
+    cdef Nid x
+    for x from 1 <= x < nnids:
+        if not seen[x]: index[x] = index[0]
+
+    cdef FILE * output_f
+    output_f = fopen( output_filename_index, "wb" );
+    if output_f == NULL:
+        raise ValueError( "opening of file %s failed" % output_filename_index )
+    fwrite( &nnids, sizeof( Nid ), 1, output_f )
+    fwrite( index, sizeof( FileIndex ), nnids, output_f )
+    fclose(output_f)
+
+def indexGraph( graph_iterator, 
+                num_nids, 
+                output_filename_graph, 
+                output_filename_index, 
+                logger,
+                codec = "zlib",
+                level = 9,
+                chunk_size = None ):
     """translate the pairsdb input graph into an ADDA formatted graph.
     
     This method reformats and indexes a neighbourhood graph.
@@ -430,8 +598,15 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
     The number of nids must be known beforehand and the nids are assumed
     to be contiguous from 1 to num_nids.
 
-    The ADDA graph format is binary and consists of records of
-    neighbourhood lists. Each record starts with:
+    The ADDA graph format is binary. It starts with a header::
+
+    char [8] magic (ADDAGRPH)
+    unsigned int version
+    unsigned int codec
+    int level
+    unsigned int chunk_size
+
+    followed by records of neighbourhood lists. Each record starts with:
 
     Nid query_nid
     size_t nneighbours
@@ -452,7 +627,13 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
     
     query_ali and sbjct_ali are `\0` terminated strings.
     
-    Each neighbour-record is gzipped.
+    The neighbours of a record are split into blocks of *chunk_size* 
+    bytes, which are compressed with *codec* (see :data:`GraphCodecs`).
+    *level* sets the compression level for zlib. The uncompressed and 
+    compressed size of a record are stored before its blocks.
+
+    Graphs from older versions without header contain a single
+    block per record compressed with zlib at level 9.
 
     The index format is:
     Nid number of nids
@@ -460,14 +641,27 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
 
     """
 
+    if codec not in GraphCodecs:
+        raise ValueError( "unknown codec %s" % codec )
+
+    if chunk_size is None: chunk_size = GRAPH_DEFAULT_CHUNK_SIZE
+    if chunk_size <= 0:
+        raise ValueError( "invalid chunk size %i" % chunk_size )
+
+    cdef GraphHeader header
+    initGraphHeader( &header, GraphCodecs[codec], level, chunk_size )
+
     # allocate index
     cdef FileIndex * index
+    cdef char * seen
     cdef Nid nnids 
     # add 1 for nid=0
     nnids = num_nids + 1
-    # sets file positions for unknown ids to 0.
     index = <FileIndex*>calloc( nnids, sizeof( FileIndex ) )
-    if index == NULL:
+    seen = <char*>calloc( nnids, sizeof( char ) )
+    if index == NULL or seen == NULL:
+        free(index)
+        free(seen)
         raise ValueError( "memory allocation for index failed" )
 
     # open output file
@@ -476,8 +670,11 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
     output_f = fopen( output_filename_graph, "wb" );
     if output_f == NULL:
         free(index)
+        free(seen)
         raise ValueError( "opening of file %s failed" % output_filename_graph )
 
+    writeGraphHeader( output_f, &header )
+
     # iterate over graph
     cdef Nid query_nid
     cdef FileIndex pos
@@ -485,7 +682,10 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
     # init_neighbour( &neighbour )
     cdef size_t nneighbours
     cdef unsigned char * buffer
-    buffer = <unsigned char *>calloc( MAX_BUFFER_SIZE, sizeof(unsigned char) )
+    cdef unsigned char * new_buffer
+    cdef size_t allocated, needed
+    allocated = chunk_size
+    buffer = <unsigned char *>malloc( allocated )
     cdef unsigned char * p1 
     cdef size_t used
     cdef int x, iteration, report_step
@@ -503,6 +703,7 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
 
     iteration = 0
     report_step = nnids / 1000
+    if report_step == 0: report_step = 1
 
     for neighbours in graph_iterator:
 
@@ -515,6 +716,7 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
         # save index position
         fgetpos( output_f, &pos )
         index[query_nid] = pos
+        seen[query_nid] = 1
 
         # convert neighbours
         nneighbours = len(neighbours.matches)
@@ -528,20 +730,29 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
         for x from 0 <= x < nneighbours:
             g = <NeighbourProxy>neighbours.matches[x]
             neighbour = g.neighbour
-            p1 = toBuffer( neighbour, p1 )
-
-            # print query_nid, nneighbours, neighbour.sbjct_nid, neighbour.sbjct_ali
 
-            # destroy_neighbour( neighbour )
+            # enlarge buffer if necessary
             used = p1 - buffer
-            if used > MAX_BUFFER_SIZE:
-                free(index)
-                free(buffer)
-                raise MemoryError( "memory overflow in indexing: nid=%i, neighbours=%i, used=%i, allocated=%i" % (query_nid, nneighbours, used, MAX_BUFFER_SIZE) )
-            
-        err = toCompressedFile( buffer, used, output_f )
+            needed = used + sizeof( Neighbour ) - 2 * sizeof( char * ) + \
+                neighbour.query_alen + neighbour.sbjct_alen + 2
+            if needed > allocated:
+                while allocated < needed: allocated *= 2
+                new_buffer = <unsigned char *>realloc( buffer, allocated )
+                if new_buffer == NULL:
+                    free(index)
+                    free(seen)
+                    free(buffer)
+                    raise MemoryError( "memory overflow in indexing: nid=%i, neighbours=%i, used=%i, requested=%i" % (query_nid, nneighbours, used, allocated) )
+                buffer = new_buffer
+                p1 = buffer + used
+
+            p1 = toBuffer( neighbour, p1 )
+
+        used = p1 - buffer
+        err = toCompressedRecord( &header, buffer, used, output_f )
         if err: 
             free(index)
+            free(seen)
             free(buffer)
             raise ValueError( "error %i while writing compressed buffer to file for nid %i (%i neighbours)" % (err, query_nid, nneighbours) )
 
@@ -551,35 +762,44 @@ def indexGraph( graph_iterator, num_nids, output_filename_graph, output_filename
     fclose( output_f )
 
     # save index
-    output_f = fopen( output_filename_index, "wb" );
-    if output_f == NULL:
+    try:
+        saveIndex( output_filename_index, index, seen, nnids )
+    finally:
+        # clean up part 2
         free(index)
-        raise ValueError( "opening of file %s failed" % output_filename_index )
-    fwrite( &nnids, sizeof( Nid ), 1, output_f )
-    fwrite( index, sizeof( FileIndex ), nnids, output_f )
-    fclose(output_f)
-
-    # clean up part 2
-    free(index)
+        free(seen)
 
 def reindexGraph( num_nids, input_filename_graph, output_filename_index, logger ):
-    '''reindex graph.'''
+    '''reindex graph.
+
+    The graph can be the concatenation of several graphs written
+    with the same codec.
+    '''
 
     # open output file
-    cdef FILE * input_f, * output_f
+    cdef FILE * input_f
     
     input_f = fopen( input_filename_graph, "rb" )
     if input_f == NULL:
         raise ValueError( "opening of file %s failed" % input_filename_graph )
 
+    cdef GraphHeader header
+    if readGraphHeader( input_f, &header ) != 0:
+        fclose( input_f )
+        raise ValueError( "could not read header of graph %s" % input_filename_graph )
+
     # allocate index
     cdef FileIndex * index
+    cdef char * seen
     cdef Nid nnids 
     # add 1 for nid=0
     nnids = num_nids + 1
-    # sets file positions for unknown ids to 0.
     index = <FileIndex*>calloc( nnids, sizeof( FileIndex ) )
-    if index == NULL:
+    seen = <char*>calloc( nnids, sizeof( char ) )
+    if index == NULL or seen == NULL:
+        free(index)
+        free(seen)
+        fclose( input_f )
         raise ValueError( "memory allocation for index failed" )
 
     cdef FileIndex pos
@@ -590,21 +810,21 @@ def reindexGraph( num_nids, input_filename_graph, output_filename_index, logger
     # iterate over graph
     cdef Nid query_nid
     cdef size_t nneighbours
-    cdef unsigned char * buffer
-    cdef int iteration, retval, report_stop
+    cdef int iteration, retval, report_step
 
     iteration = 0
-    buffer = <unsigned char *>calloc( MAX_BUFFER_SIZE, sizeof(unsigned char) )
     report_step = nnids / 1000
+    if report_step == 0: report_step = 1
 
-    while not feof( input_f ):
-        
-        fgetpos( input_f, &pos )
-
-        n = fread( &query_nid, sizeof(Nid), 1, input_f )
-        n += fread( &nneighbours, sizeof(size_t), 1, input_f )
+    while 1:
         
-        if feof( input_f ): break
+        retval = readRecordHeader( input_f, &header, &query_nid, &nneighbours, &pos )
+        if retval == 1: break
+        if retval != 0:
+            free(index)
+            free(seen)
+            fclose( input_f )
+            raise ValueError( "error %i while reading graph %s" % (retval, input_filename_graph) )
 
         # skip place holder pos (there might be several in the file
         # if it is the result of a merging operation)
@@ -615,29 +835,176 @@ def reindexGraph( num_nids, input_filename_graph, output_filename_index, logger
             logger.info( "indexing progress: %i/%i = %5.1f" % (iteration, nnids, 100.0 * iteration/nnids) )
         
         index[query_nid] = pos
+        seen[query_nid] = 1
 
-        retval = fromCompressedFile( buffer, MAX_BUFFER_SIZE, input_f )
+        retval = skipCompressedRecord( &header, input_f )
         if retval != 0: 
-            free(buffer)
+            free(index)
+            free(seen)
+            fclose( input_f )
             raise ValueError("error while reading data for %i" % query_nid )
+
+    fclose( input_f )
         
     # save index
-    output_f = fopen( output_filename_index, "wb" );
-    if output_f == NULL:
+    try:
+        saveIndex( output_filename_index, index, seen, nnids )
+    finally:
         free(index)
-        raise ValueError( "opening of file %s failed" % output_filename_index )
-    fwrite( &nnids, sizeof( Nid ), 1, output_f )
-    fwrite( index, sizeof( FileIndex ), nnids, output_f )
-    fclose(output_f)
+        free(seen)
+
+def mergeIndices( num_nids, filenames_graph, filenames_index, output_filename_index, logger ):
+    '''merge the indices of several graphs.
+
+    The merged index refers to the concatenation of the graphs
+    in *filenames_graph* in the order given. The graphs need to
+    have been written with the same codec.
+
+    The positions in each index are shifted by the size of the
+    preceding graphs. As in :func:`reindexGraph`, entries pointing 
+    to the place holder of a part are ignored. The place holder of 
+    the first part is used for nids without neighbours.
+    '''
+
+    if len(filenames_graph) != len(filenames_index):
+        raise ValueError( "number of graphs and indices differ" )
+
+    if len(filenames_graph) == 0:
+        raise ValueError( "no graphs to merge" )
+
+    # check that headers are compatible
+    cdef GraphHeader header, part_header
+    cdef FILE * input_f
+    cdef int part
+
+    for part from 0 <= part < len(filenames_graph):
+        filename = filenames_graph[part]
+        input_f = fopen( filename, "rb" )
+        if input_f == NULL:
+            raise ValueError( "opening of file %s failed" % filename )
+        if readGraphHeader( input_f, &part_header ) != 0:
+            fclose( input_f )
+            raise ValueError( "could not read header of graph %s" % filename )
+        fclose( input_f )
+        if part == 0: 
+            header = part_header
+        elif part_header.version != header.version or part_header.codec != header.codec:
+            raise ValueError( "graph %s is not compatible with graph %s" % (filename, filenames_graph[0]) )
+
+    # allocate index
+    cdef FileIndex * index
+    cdef FileIndex * part_index
+    cdef char * seen
+    cdef Nid nnids, part_nnids
+    # add 1 for nid=0
+    nnids = num_nids + 1
+    index = <FileIndex*>calloc( nnids, sizeof( FileIndex ) )
+    part_index = <FileIndex*>calloc( nnids, sizeof( FileIndex ) )
+    seen = <char*>calloc( nnids, sizeof( char ) )
+    if index == NULL or part_index == NULL or seen == NULL:
+        free(index)
+        free(part_index)
+        free(seen)
+        raise ValueError( "memory allocation for index failed" )
+
+    cdef Nid x
+    cdef long offset, place_holder, base
+    cdef size_t n
+    base = 0
+
+    for part from 0 <= part < len(filenames_index):
+        filename = filenames_index[part]
+        logger.info( "merging index %s at offset %i" % (filename, base) )
+
+        input_f = fopen( filename, "rb" )
+        if input_f == NULL:
+            free(index)
+            free(part_index)
+            free(seen)
+            raise ValueError( "opening of file %s failed" % filename )
+
+        n = fread( &part_nnids, sizeof( Nid ), 1, input_f )
+        if n != 1 or part_nnids > nnids:
+            fclose( input_f )
+            free(index)
+            free(part_index)
+            free(seen)
+            raise ValueError( "index %s does not match number of nids %i" % (filename, num_nids) )
+
+        n = fread( part_index, sizeof( FileIndex ), part_nnids, input_f )
+        fclose( input_f )
+        if n != part_nnids:
+            free(index)
+            free(part_index)
+            free(seen)
+            raise ValueError( "error while reading index %s" % filename )
+
+        place_holder = fileIndexToOffset( &part_index[0] )
+        if part == 0: index[0] = part_index[0]
+        
+        for x from 1 <= x < part_nnids:
+            offset = fileIndexToOffset( &part_index[x] )
+            if offset == place_holder: continue
+            offsetToFileIndex( base + offset, &index[x] )
+            seen[x] = 1
+
+        base += os.path.getsize( filenames_graph[part] )
+
+    free(part_index)
+
+    # save index
+    try:
+        saveIndex( output_filename_index, index, seen, nnids )
+    finally:
+        free(index)
+        free(seen)
 
 cdef class IndexedNeighbours:
-    """access to indexed ADDA graph."""
+    """access to indexed ADDA graph.
+
+    If *mode* is ``stdio``, each record is read from the graph
+    file with fread.
+
+    If *mode* is ``mmap``, the index and the graph are mapped
+    read-only into memory and :meth:`getNeighboursView` 
+    gives access to the decoded records without copying them.
+
+    In both modes, a single decompression buffer is re-used
+    for all records.
+
+    In both modes, :meth:`getNeighboursArray` and 
+    :meth:`iterNeighboursArrays` return the neighbours as numpy 
+    arrays instead of lists of :class:`NeighbourRecord` objects.
+    """
 
     cdef FILE * mFile
     cdef FileIndex * mIndex
     cdef Nid mNids
-
-    def __init__(self, filename_graph, filename_index ):
+    cdef GraphHeader mHeader
+    cdef unsigned char * mBuffer
+    cdef size_t mBufferSize
+
+    # memory mapped access
+    cdef int mMapped
+    cdef unsigned char * mMappedIndex
+    cdef size_t mMappedIndexSize
+    cdef unsigned char * mMappedGraph
+    cdef size_t mMappedGraphSize
+    # start of each neighbour in mBuffer
+    cdef unsigned char ** mRecords
+    cdef size_t mRecordsAllocated
+    cdef size_t mViewSize
+    cdef Nid mViewNid
+    cdef long mGeneration
+    cdef long mGraphSize
+
+    def __init__(self, filename_graph, filename_index, mode = "stdio" ):
+
+        if mode == "mmap":
+            self._openMapped( filename_graph, filename_index )
+            return
+        elif mode != "stdio":
+            raise ValueError( "unknown access mode `%s`" % mode )
 
         cdef FILE * index_f
         index_f = fopen( filename_index, "rb" )
@@ -656,122 +1023,365 @@ cdef class IndexedNeighbours:
         fclose( index_f)
 
         self.mFile = fopen( filename_graph, "rb" )
+        if self.mFile == NULL:
+            raise OSError( "could not open graph %s" % filename_graph )
+
+        if readGraphHeader( self.mFile, &self.mHeader ) != 0:
+            raise ValueError( "could not read header of graph %s" % filename_graph )
 
         if nnids == 0:
             raise ValueError("graph is empty")
         self.mNids = nnids
+        self.mGraphSize = os.path.getsize( filename_graph )
+
+    cdef _openMapped( self, filename_graph, filename_index ):
+        '''map index and graph into memory.'''
+
+        self.mMappedIndex = mapFile( filename_index, &self.mMappedIndexSize )
+        if self.mMappedIndex == NULL:
+            raise OSError( "could not map index %s" % filename_index )
+
+        self.mNids = (<Nid*>self.mMappedIndex)[0]
+        if self.mNids == 0:
+            raise ValueError("graph is empty")
+
+        if self.mMappedIndexSize < sizeof(Nid) + self.mNids * sizeof(FileIndex):
+            raise OSError( "index %s is truncated" % filename_index )
+
+        self.mIndex = <FileIndex*>(self.mMappedIndex + sizeof(Nid))
+
+        self.mMappedGraph = mapFile( filename_graph, &self.mMappedGraphSize )
+        if self.mMappedGraph == NULL:
+            raise OSError( "could not map graph %s" % filename_graph )
+
+        if parseGraphHeader( self.mMappedGraph, self.mMappedGraphSize, &self.mHeader ) < 0:
+            raise ValueError( "could not read header of graph %s" % filename_graph )
+
+        self.mMapped = 1
+        self.mGraphSize = self.mMappedGraphSize
+
+    def __dealloc__(self):
+        if self.mMappedIndex != NULL: 
+            unmapFile( self.mMappedIndex, self.mMappedIndexSize )
+        elif self.mIndex != NULL: 
+            free( self.mIndex )
+        if self.mMappedGraph != NULL: unmapFile( self.mMappedGraph, self.mMappedGraphSize )
+        if self.mFile != NULL: fclose( self.mFile )
+        if self.mBuffer != NULL: free( self.mBuffer )
+        if self.mRecords != NULL: free( self.mRecords )
 
     def getNeighbours( self, nid ):
         '''retrieve neighbours for *nid*'''
         
+        if self.mMapped:
+            return list( self.getNeighboursView( nid ) )
+
+        self._read( nid )
+
+        # create neighbours
+        cdef Neighbour neighbour
+        cdef unsigned char * p
+        cdef size_t i
+
+        result = []
+
+        p = self.mBuffer
+        for i from 0 <= i < self.mViewSize:
+            p = viewBuffer( &neighbour, p )
+            result.append( toNeighbour( nid, &neighbour) )
+
+        return result
+
+    def getNeighboursArray( self, nid, alignments = False ):
+        '''retrieve neighbours for *nid* as a numpy array of
+        type :data:`NeighbourDtype`.
+
+        If *alignments* is True, a tuple is returned of the
+        array and two lists with the query and sbjct alignment 
+        strings.
+        '''
+        self._load( nid )
+        result = fillArray( self.mBuffer, self.mViewSize )
+        if alignments:
+            query_alis, sbjct_alis = fillAlignments( self.mBuffer, self.mViewSize )
+            return result, query_alis, sbjct_alis
+        return result
+
+    def iterNeighboursArrays( self, nids, batch_size = 1000, alignments = False ):
+        '''iterate over the neighbours of *nids* in batches of 
+        *batch_size* nids.
+
+        Yields tuples of (nids, offsets, matches). *matches* is the 
+        concatenation of the neighbour arrays of all nids in the
+        batch and the neighbours of ``nids[x]`` are 
+        ``matches[offsets[x]:offsets[x+1]]``. If *alignments* is True, 
+        the tuples contain the lists of query and sbjct alignment 
+        strings as two additional elements.
+        '''
+        cdef size_t x
+        nids = list(nids)
+
+        for start in range( 0, len(nids), batch_size ):
+            batch = nids[start:start+batch_size]
+            offsets = numpy.zeros( len(batch) + 1, dtype = numpy.int64 )
+            parts, query_alis, sbjct_alis = [], [], []
+            for x from 0 <= x < len(batch):
+                self._load( batch[x] )
+                parts.append( fillArray( self.mBuffer, self.mViewSize ) )
+                offsets[x+1] = offsets[x] + self.mViewSize
+                if alignments:
+                    q, s = fillAlignments( self.mBuffer, self.mViewSize )
+                    query_alis.extend( q )
+                    sbjct_alis.extend( s )
+
+            matches = numpy.concatenate( parts )
+            if alignments:
+                yield batch, offsets, matches, query_alis, sbjct_alis
+            else:
+                yield batch, offsets, matches
+
+    def getRecordSizes( self ):
+        '''return a numpy array with the size in bytes of the
+        compressed record of each nid.
+
+        The sizes are computed from the index without reading
+        the graph. Nids without neighbours have size 0.
+        '''
+        offsets = numpy.empty( self.mNids, dtype = numpy.int64 )
+        cdef size_t address
+        address = offsets.__array_interface__["data"][0]
+        cdef long * dest
+        dest = <long *>address
+        cdef Nid x
+        for x from 0 <= x < self.mNids:
+            dest[x] = fileIndexToOffset( &self.mIndex[x] )
+
+        # a record extends to the start of the next record
+        starts = numpy.unique( offsets )
+        ends = numpy.append( starts[1:], self.mGraphSize )
+        sizes = ends[numpy.searchsorted( starts, offsets )] - offsets
+        sizes[offsets == offsets[0]] = 0
+        return sizes
+
+    def getNeighboursView( self, nid ):
+        '''retrieve neighbours for *nid* as a :class:`NeighbourView`.
+
+        The view refers to the decompression buffer of this reader 
+        and becomes invalid with the next call to this method.
+        Requires mode ``mmap``.
+        '''
+        if not self.mMapped:
+            raise ValueError( "neighbour views require mode `mmap`" )
+
+        self._decode( nid )
+        return NeighbourView( self, self.mGeneration )
+
+    cdef _load( self, Nid nid ):
+        '''uncompress record for *nid* into the shared buffer.'''
+        if self.mMapped:
+            self._decode( nid )
+        else:
+            self._read( nid )
+
+    cdef _read( self, Nid nid ):
+        '''read and uncompress record for *nid* from the graph 
+        file into the shared buffer.'''
+
         assert 0 < nid < self.mNids, "nid %i out of range, maximum is %i" % (nid, self.mNids - 1)
-        
-        cdef int r
-        r = fsetpos( self.mFile, &self.mIndex[nid] )
 
-        if r != 0:
-            raise OSError( "Could not go to file position for nid %i" % nid )
-        
-        cdef int n 
-        cdef size_t nneighbours
+        cdef size_t nneighbours, size
         cdef Nid query_nid 
 
-        n = fread( &query_nid, sizeof(Nid), 1, self.mFile )
-        n += fread( &nneighbours, sizeof(size_t), 1, self.mFile )
-    
-        assert n == 2, "wrong item count while reading from graph"
+        self.mViewSize = 0
+        self.mViewNid = nid
+
+        if fsetpos( self.mFile, &self.mIndex[nid] ) != 0:
+            raise OSError( "Could not go to file position for nid %i" % nid )
+
+        if readRecordHeader( self.mFile, &self.mHeader, &query_nid, &nneighbours, NULL ) != 0:
+            raise ValueError( "could not read record for nid %i" % nid )
+
         if nid != query_nid and query_nid != 0:
             raise ValueError( "index returned wrong nid: %i instead of %i" % (query_nid, nid) )
         
-        if query_nid == 0: return []
-
-        cdef unsigned char * buffer
-        buffer = <unsigned char *>calloc( MAX_BUFFER_SIZE, sizeof(unsigned char) )
+        if query_nid == 0: return
 
-        cdef int retval
-        retval = fromCompressedFile( buffer, MAX_BUFFER_SIZE, self.mFile )
-        if retval != 0: 
-            free(buffer)
+        if fromCompressedRecord( &self.mHeader, &self.mBuffer, &self.mBufferSize, &size, self.mFile ) != 0:
             raise ValueError("error while reading data for %i" % nid )
 
-        # create neighbours
-        cdef Neighbour neighbour
-        init_neighbour( &neighbour )
+        self.mViewSize = nneighbours
+
+    cdef _decode( self, Nid nid ):
+        '''uncompress record for *nid* from the mapped graph into
+        the shared buffer.'''
+
+        assert 0 < nid < self.mNids, "nid %i out of range, maximum is %i" % (nid, self.mNids - 1)
 
         cdef unsigned char * p
-        cdef int i
+        cdef unsigned char * end
+        cdef long offset
+        cdef Nid query_nid
+        cdef size_t nneighbours, i, size
 
-        result = []
+        # invalidate all existing views
+        self.mGeneration += 1
+        self.mViewSize = 0
+        self.mViewNid = nid
+
+        end = self.mMappedGraph + self.mMappedGraphSize
+        offset = fileIndexToOffset( &self.mIndex[nid] )
+        p = self.mMappedGraph + offset
+        if offset < 0 or p + sizeof(Nid) + sizeof(size_t) > end:
+            raise OSError( "file position for nid %i out of range" % nid )
 
-        p = buffer
+        query_nid = (<Nid*>p)[0]
+        p += sizeof(Nid)
+        nneighbours = (<size_t*>p)[0]
+        p += sizeof(size_t)
+
+        if nid != query_nid and query_nid != 0:
+            raise ValueError( "index returned wrong nid: %i instead of %i" % (query_nid, nid) )
+
+        if query_nid == 0: return
+
+        if fromCompressedMemory( &self.mHeader, 
+                                 &self.mBuffer, &self.mBufferSize, &size,
+                                 p, end - p ) < 0:
+            raise ValueError( "error while reading data for %i" % nid )
+
+        if nneighbours > self.mRecordsAllocated:
+            free( self.mRecords )
+            self.mRecords = <unsigned char **>malloc( nneighbours * sizeof( unsigned char * ) )
+            if self.mRecords == NULL:
+                self.mRecordsAllocated = 0
+                raise MemoryError( "out of memory for %i neighbours of nid %i" % (nneighbours, nid) )
+            self.mRecordsAllocated = nneighbours
+
+        # see also fillLinks in adda.h
+        p = self.mBuffer
+        end = self.mBuffer + size
         for i from 0 <= i < nneighbours:
-            p = fromBuffer( &neighbour, p )
-            result.append( toNeighbour( query_nid, &neighbour) )
+            if p + sizeof( Neighbour ) - 2 * sizeof( char * ) > end:
+                raise ValueError( "record for nid %i is truncated" % nid )
+            self.mRecords[i] = p
+            p += sizeof( Neighbour ) - 2 * sizeof( char * )
+            p += (<Neighbour*>self.mRecords[i]).query_alen + 1
+            p += (<Neighbour*>self.mRecords[i]).sbjct_alen + 1
 
-        destroy_neighbour( &neighbour )
+        self.mViewSize = nneighbours
 
-        free( buffer )
-        return result
+    cdef _toRecord( self, size_t i ):
+        '''return neighbour *i* of the current record.'''
+        cdef Neighbour neighbour
+        viewBuffer( &neighbour, self.mRecords[i] )
+        return toNeighbour( self.mViewNid, &neighbour )
+
+cdef class NeighbourView:
+    '''read-only sequence of neighbours decoded by a 
+    memory-mapped :class:`IndexedNeighbours` reader.
+
+    Records are converted into :class:`NeighbourRecord` objects
+    on access only. The view is valid until the next call to 
+    :meth:`IndexedNeighbours.getNeighboursView` on the same reader.
+    '''
+
+    cdef IndexedNeighbours mReader
+    cdef long mGeneration
+
+    def __init__(self, IndexedNeighbours reader, long generation ):
+        self.mReader = reader
+        self.mGeneration = generation
+
+    cdef _check( self ):
+        if self.mGeneration != self.mReader.mGeneration:
+            raise ValueError( "neighbour view is no longer valid" )
+
+    def __len__(self):
+        self._check()
+        return self.mReader.mViewSize
+
+    def __getitem__(self, key ):
+        self._check()
+        cdef long n
+        n = self.mReader.mViewSize
+        if isinstance( key, slice ):
+            return [ self.mReader._toRecord( x ) for x in range( *key.indices( n ) ) ]
+        if key < 0: key += n
+        if not 0 <= key < n:
+            raise IndexError( "neighbour index out of range" )
+        return self.mReader._toRecord( key )
+
+    def __iter__(self):
+        cdef size_t x
+        for x from 0 <= x < len(self):
+            yield self[x]
 
 cdef class AddaGraphIterator:
+    '''iterate over an ADDA graph.
+
+    Returns tuples of (nid, neighbours). If *as_array* is True,
+    the neighbours are returned as a numpy array of type 
+    :data:`NeighbourDtype`, otherwise as a list of 
+    :class:`NeighbourRecord` objects.
+    '''
 
     cdef FILE * input_f
     cdef unsigned char * buffer
+    cdef size_t allocated
+    cdef int as_array
+    cdef GraphHeader header
 
-    def __cinit__(self, input_filename_graph ):
+    def __cinit__(self, input_filename_graph, as_array = False ):
         # open output file
-    
+        self.as_array = as_array
+
         self.input_f = fopen( input_filename_graph, "rb" )
         if self.input_f == NULL:
             raise ValueError( "opening of file %s failed" % input_filename_graph )
 
-        self.buffer = <unsigned char *>calloc( MAX_BUFFER_SIZE, sizeof(unsigned char) )
+        if readGraphHeader( self.input_f, &self.header ) != 0:
+            raise ValueError( "could not read header of graph %s" % input_filename_graph )
 
     def __iter__(self):
         return self
 
     def __next__(self):
         cdef Nid query_nid = 0
-        cdef int nneighbours
-        cdef int n
+        cdef size_t nneighbours, size
+        cdef int retval
 
-        if feof( self.input_f ): raise StopIteration()
-        
         while query_nid == 0:
-            n = fread( &query_nid, sizeof(Nid), 1, self.input_f )
-            n += fread( &nneighbours, sizeof(size_t), 1, self.input_f )
-        
-            if feof( self.input_f ): raise StopIteration
+            retval = readRecordHeader( self.input_f, &self.header, &query_nid, &nneighbours, NULL )
+            if retval == 1: raise StopIteration
+            if retval != 0:
+                raise ValueError( "error %i while reading graph" % retval )
 
             # skip place holder pos (there might be several in the file
             # if it is the result of a merging operation)
-            if query_nid != 0: break
-
 
-        retval = fromCompressedFile( self.buffer, MAX_BUFFER_SIZE, self.input_f )
+        retval = fromCompressedRecord( &self.header, &self.buffer, &self.allocated, &size, self.input_f )
         if retval != 0: 
             raise ValueError("error while reading data for %i" % query_nid )
+
+        if self.as_array:
+            return (query_nid, fillArray( self.buffer, nneighbours ) )
         
         # create neighbours
         cdef Neighbour neighbour
-        init_neighbour( &neighbour )
-
         cdef unsigned char * p
-        cdef int i
+        cdef size_t i
 
         result = []
 
         p = self.buffer
         for i from 0 <= i < nneighbours:
-            p = fromBuffer( &neighbour, p )
+            p = viewBuffer( &neighbour, p )
             result.append( toNeighbour( query_nid, &neighbour) )
 
-        destroy_neighbour( &neighbour )
-
         return (query_nid, result )
 
     def __dealloc__(self):
-        fclose( self.input_f )
+        if self.input_f != NULL: fclose( self.input_f )
         free( self.buffer )
 
 ###############################################################################
@@ -1037,15 +1647,21 @@ class PairsDBNeighbourIterator:
 
     Identifiers not in filter are ignored.
 
+    If *nid_range* is given as a tuple (first, last), only
+    alignments with a query nid in the half-open interval
+    [first,last) are returned. Other lines are skipped without
+    being parsed.
+
     The iterator returns query_nid and an object of type :class:`Neighbour`
     for each iteration. The caller takes ownership of the object.
     '''
 
-    def __init__(self, infile, mapId2Nid, logger ):
+    def __init__(self, infile, mapId2Nid, logger, nid_range = None ):
         self.infile = infile
         self.mapId2Nid = mapId2Nid
         self.record_factory = PairsDBNeighbourRecordEmissions
         self.logger = logger
+        self.nid_range = nid_range
 
     def __iter__(self):
         return self
@@ -1063,6 +1679,13 @@ class PairsDBNeighbourIterator:
             if not line: raise StopIteration
             if line.startswith("#"): continue
             if line.startswith('query_nid'): continue
+
+            if self.nid_range:
+                nid = self.mapId2Nid.get( line[:line.find("\t")] )
+                if nid is None: continue
+                query_nid = nid
+                if query_nid < self.nid_range[0] or query_nid >= self.nid_range[1]: continue
+
             r = self.record_factory( line )
 
             # check for empty or overflowed alignments
@@ -1071,12 +1694,13 @@ class PairsDBNeighbourIterator:
                 self.logger.warn("ignoring invalid alignment: %s" % str(r))
                 continue
 
-            if r.query_token not in self.mapId2Nid or \
-                    r.sbjct_token not in self.mapId2Nid:
-                continue 
-                
-            query_nid = self.mapId2Nid[r.query_token]
-            sbjct_nid = self.mapId2Nid[r.sbjct_token]
+            qnid = self.mapId2Nid.get( r.query_token )
+            if qnid is None: continue
+            snid = self.mapId2Nid.get( r.sbjct_token )
+            if snid is None: continue
+
+            query_nid = qnid
+            sbjct_nid = snid
 
             p = NeighbourProxy()
             p.query_nid = query_nid
@@ -0,0 +1,197 @@
+//--------------------------------------------------------------------------------
+// Project adda
+//
+// Copyright (C) 2003 Andreas Heger All rights reserved
+//
+// Author: Andreas Heger <heger@ebi.ac.uk>
+//
+// $Id$
+//--------------------------------------------------------------------------------
+
+// Codecs for compressing blocks of the ADDA graph.
+//
+// Besides zlib, a fast LZ77 codec is provided. Its byte stream
+// follows the format of liblzf:
+//
+// 000LLLLL <L+1 literal bytes>
+// LLLooooo oooooooo: copy L+2 bytes from offset o+1 before the output position
+// 111ooooo LLLLLLLL oooooooo: copy L+9 bytes from offset o+1
+//
+
+#include <cstdlib>
+#include <cstring>
+#include <vector>
+#include <zlib.h>
+#include "adda.h"
+
+#define LZF_HASH_LOG 14
+#define LZF_MAX_LITERALS (1 << 5)
+#define LZF_MAX_OFFSET (1 << 13)
+#define LZF_MAX_MATCH ((1 << 8) + (1 << 3))
+
+//--------------------------------------------------------------------------------
+static inline unsigned int lzfHash( const unsigned char * p )
+{
+  unsigned int v = (p[0] << 16) | (p[1] << 8) | p[2];
+  return (v * 2654435761U) >> (32 - LZF_HASH_LOG);
+}
+
+//--------------------------------------------------------------------------------
+// write n literal bytes from src to op. Returns false if there is not enough space.
+static inline bool lzfLiterals( const unsigned char * src,
+				size_t n,
+				unsigned char * & op,
+				const unsigned char * out_end )
+{
+  while (n > 0)
+    {
+      size_t k = n < LZF_MAX_LITERALS ? n : LZF_MAX_LITERALS;
+      if (op + k + 1 > out_end) return false;
+      *op++ = (unsigned char)(k - 1);
+      memcpy( op, src, k );
+      op += k;
+      src += k;
+      n -= k;
+    }
+  return true;
+}
+
+//--------------------------------------------------------------------------------
+// compress in into out. Returns the compressed size or 0 if out is too small.
+size_t lzfCompress( const unsigned char * in, size_t in_len,
+		    unsigned char * out, size_t out_len )
+{
+  std::vector< const unsigned char * > table( 1 << LZF_HASH_LOG, (const unsigned char *)NULL );
+
+  const unsigned char * ip = in;
+  const unsigned char * in_end = in + in_len;
+  const unsigned char * anchor = in;
+  unsigned char * op = out;
+  const unsigned char * out_end = out + out_len;
+
+  while (ip + 2 < in_end)
+    {
+      unsigned int h = lzfHash( ip );
+      const unsigned char * ref = table[h];
+      table[h] = ip;
+
+      if (ref == NULL ||
+	  (size_t)(ip - ref - 1) >= LZF_MAX_OFFSET ||
+	  ref[0] != ip[0] || ref[1] != ip[1] || ref[2] != ip[2])
+	{
+	  ++ip;
+	  continue;
+	}
+
+      size_t offset = ip - ref - 1;
+      size_t max_length = in_end - ip;
+      if (max_length > LZF_MAX_MATCH) max_length = LZF_MAX_MATCH;
+      size_t length = 3;
+      while (length < max_length && ref[length] == ip[length]) ++length;
+
+      if (!lzfLiterals( anchor, ip - anchor, op, out_end )) return 0;
+      if (op + 3 > out_end) return 0;
+
+      length -= 2;
+      if (length < 7)
+	{
+	  *op++ = (unsigned char)((length << 5) | (offset >> 8));
+	}
+      else
+	{
+	  *op++ = (unsigned char)((7 << 5) | (offset >> 8));
+	  *op++ = (unsigned char)(length - 7);
+	}
+      *op++ = (unsigned char)(offset & 0xff);
+
+      ip += length + 2;
+      anchor = ip;
+    }
+
+  if (!lzfLiterals( anchor, in_end - anchor, op, out_end )) return 0;
+  return op - out;
+}
+
+//--------------------------------------------------------------------------------
+// uncompress in into out. Returns the uncompressed size or 0 on error.
+size_t lzfDecompress( const unsigned char * in, size_t in_len,
+		      unsigned char * out, size_t out_len )
+{
+  const unsigned char * ip = in;
+  const unsigned char * in_end = in + in_len;
+  unsigned char * op = out;
+  unsigned char * out_end = out + out_len;
+
+  while (ip < in_end)
+    {
+      unsigned int ctrl = *ip++;
+
+      if (ctrl < LZF_MAX_LITERALS)
+	{
+	  size_t n = ctrl + 1;
+	  if (ip + n > in_end || op + n > out_end) return 0;
+	  memcpy( op, ip, n );
+	  op += n;
+	  ip += n;
+	}
+      else
+	{
+	  size_t length = ctrl >> 5;
+	  if (length == 7)
+	    {
+	      if (ip >= in_end) return 0;
+	      length += *ip++;
+	    }
+	  if (ip >= in_end) return 0;
+	  size_t offset = ((ctrl & 0x1f) << 8) + *ip++ + 1;
+	  length += 2;
+	  if (offset > (size_t)(op - out) || op + length > out_end) return 0;
+	  // copy bytewise, source and destination can overlap
+	  const unsigned char * ref = op - offset;
+	  while (length--) *op++ = *ref++;
+	}
+    }
+  return op - out;
+}
+
+//--------------------------------------------------------------------------------
+// compress a block with codec. Returns the compressed size or 0
+// if the block could not be compressed into less than dest_len bytes.
+size_t compressBlock( unsigned int codec, int level,
+		      unsigned char * dest, size_t dest_len,
+		      const unsigned char * src, size_t src_len )
+{
+  switch (codec)
+    {
+    case GRAPH_CODEC_ZLIB:
+      {
+	uLongf size = dest_len;
+	if (compress2( dest, &size, src, src_len, level ) != Z_OK) return 0;
+	return size;
+      }
+    case GRAPH_CODEC_LZF:
+      return lzfCompress( src, src_len, dest, dest_len );
+    }
+  return 0;
+}
+
+//--------------------------------------------------------------------------------
+// uncompress a block with codec. Returns 0 on success.
+int decompressBlock( unsigned int codec,
+		     unsigned char * dest, size_t dest_len,
+		     const unsigned char * src, size_t src_len )
+{
+  switch (codec)
+    {
+    case GRAPH_CODEC_ZLIB:
+      {
+	uLongf size = dest_len;
+	int zok = uncompress( dest, &size, src, src_len );
+	if (zok != Z_OK) return zok;
+	return size == dest_len ? 0 : Z_DATA_ERROR;
+      }
+    case GRAPH_CODEC_LZF:
+      return lzfDecompress( src, src_len, dest, dest_len ) == dest_len ? 0 : Z_DATA_ERROR;
+    }
+  return Z_STREAM_ERROR;
+}
@@ -389,6 +389,7 @@ int cadda_convert( const char * filename )
 
   /*------------------------------------------------------------------*/
   FILE * file_links = NULL;
+  GraphHeader header;
   {
     if (param_loglevel >= 1)
       std::cout << "# opening links file " << param_file_name_graph << std::endl;
@@ -400,6 +401,12 @@ int cadda_convert( const char * filename )
 	std::cerr << "could not open filename with links: " << param_file_name_graph << std::endl;
 	exit(EXIT_FAILURE);
       }
+
+    if (readGraphHeader( file_links, &header ) != 0)
+      {
+	std::cerr << "could not read header of " << param_file_name_graph << std::endl;
+	exit(EXIT_FAILURE);
+      }
   }
   
   LinkProcessor * parser = NULL;
@@ -435,6 +442,7 @@ int cadda_convert( const char * filename )
       fsetpos( file_links, &map_nid2fileindex[nid] );
       
       fillLinks( file_links,
+		 header,
 		 nid,
 		 std::back_insert_iterator< LinkList >(links));
 
@@ -5,6 +5,13 @@
 #include <zlib.h>
 #include "adda.h"
 #include <cassert>
+#include <cstring>
+#include <vector>
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 //--------------------------------------------------------------------------------------------
 bool fileExists (const std::string & filename)
@@ -103,6 +110,319 @@ int fromCompressedFile( unsigned char * buffer, size_t uncompressed_size, FILE *
   return zok;
 }
   
+//--------------------------------------------------------------------------------
+void initGraphHeader( GraphHeader * header, 
+		      unsigned int codec, 
+		      int level, 
+		      unsigned int chunk_size )
+{
+  memcpy( header->magic, GRAPH_MAGIC, GRAPH_MAGIC_LENGTH );
+  header->version = GRAPH_VERSION;
+  header->codec = codec;
+  header->level = level;
+  header->chunk_size = chunk_size;
+}
+
+// graphs without header are zlib compressed version 1 graphs
+static void initLegacyGraphHeader( GraphHeader * header )
+{
+  initGraphHeader( header, GRAPH_CODEC_ZLIB, 9, 0 );
+  header->version = 1;
+}
+
+static int checkGraphHeader( const GraphHeader * header )
+{
+  if (header->version < 2 || header->version > GRAPH_VERSION) 
+    return Z_VERSION_ERROR;
+  if (header->codec != GRAPH_CODEC_ZLIB && header->codec != GRAPH_CODEC_LZF) 
+    return Z_STREAM_ERROR;
+  if (header->chunk_size == 0)
+    return Z_STREAM_ERROR;
+  return 0;
+}
+
+//--------------------------------------------------------------------------------
+int writeGraphHeader( FILE * output_f, const GraphHeader * header )
+{
+  if (fwrite( header, sizeof(GraphHeader), 1, output_f ) != 1 || ferror( output_f ))
+    return Z_ERRNO;
+  return 0;
+}
+
+//--------------------------------------------------------------------------------
+// read graph header at the current position. If there is none, the
+// file position is left unchanged and header is set to version 1.
+int readGraphHeader( FILE * input_f, GraphHeader * header )
+{
+  initLegacyGraphHeader( header );
+
+  fpos_t pos;
+  fgetpos( input_f, &pos );
+
+  GraphHeader h;
+  size_t n = fread( &h, 1, sizeof(GraphHeader), input_f );
+
+  if (n >= GRAPH_MAGIC_LENGTH && memcmp( h.magic, GRAPH_MAGIC, GRAPH_MAGIC_LENGTH ) == 0)
+    {
+      if (n != sizeof(GraphHeader)) return Z_ERRNO;
+      int retval = checkGraphHeader( &h );
+      if (retval != 0) return retval;
+      *header = h;
+      return 0;
+    }
+
+  clearerr( input_f );
+  fsetpos( input_f, &pos );
+  return 0;
+}
+
+//--------------------------------------------------------------------------------
+// parse graph header in memory. Returns the size of the header.
+long parseGraphHeader( const unsigned char * data, size_t size, GraphHeader * header )
+{
+  initLegacyGraphHeader( header );
+
+  if (size < GRAPH_MAGIC_LENGTH || memcmp( data, GRAPH_MAGIC, GRAPH_MAGIC_LENGTH ) != 0)
+    return 0;
+
+  if (size < sizeof(GraphHeader)) return Z_ERRNO;
+
+  GraphHeader h;
+  memcpy( &h, data, sizeof(GraphHeader) );
+  int retval = checkGraphHeader( &h );
+  if (retval != 0) return retval;
+  *header = h;
+  return sizeof(GraphHeader);
+}
+
+//--------------------------------------------------------------------------------
+// read nid and number of neighbours at the start of a record. Headers of
+// concatenated graphs are skipped, but need to be compatible with header.
+// If pos is given, it is set to the file position of the record.
+// Returns 1 at the end of the file.
+int readRecordHeader( FILE * input_f, 
+		      GraphHeader * header, 
+		      Nid * query_nid, 
+		      size_t * nneighbours,
+		      void * pos )
+{
+  while (1)
+    {
+      if (pos != NULL) fgetpos( input_f, (FileIndex *)pos );
+
+      if (fread( query_nid, sizeof(Nid), 1, input_f ) != 1)
+	return feof( input_f ) ? 1 : Z_ERRNO;
+
+      if (memcmp( query_nid, GRAPH_MAGIC, sizeof(Nid) ) == 0)
+	{
+	  GraphHeader h;
+	  size_t rest = sizeof(GraphHeader) - sizeof(Nid);
+	  memcpy( &h, query_nid, sizeof(Nid) );
+	  if (fread( (char*)&h + sizeof(Nid), 1, rest, input_f ) != rest)
+	    return Z_ERRNO;
+	  if (h.version != header->version || h.codec != header->codec)
+	    return Z_VERSION_ERROR;
+	  continue;
+	}
+      
+      if (fread( nneighbours, sizeof(size_t), 1, input_f ) != 1)
+	return feof( input_f ) ? 1 : Z_ERRNO;
+
+      return 0;
+    }
+}
+
+//--------------------------------------------------------------------------------
+// Layout of a version 2 record after nid and number of neighbours:
+//
+// uint64_t uncompressed size
+// uint64_t compressed size (all blocks including block headers)
+// uint32_t number of blocks
+// blocks of: uint32_t uncompressed size, uint32_t compressed size, data
+//
+// Blocks that do not compress are stored as they are and have
+// identical compressed and uncompressed sizes.
+#define RECORD_HEADER_SIZE (2 * sizeof(uint64_t) + sizeof(uint32_t))
+
+int toCompressedRecord( const GraphHeader * header, 
+			const unsigned char * buffer, 
+			size_t size, 
+			FILE * output_f )
+{
+  if (header->version < 2)
+    return toCompressedFile( (unsigned char *)buffer, size, output_f );
+
+  std::vector<unsigned char> blocks;
+  std::vector<unsigned char> compressed( header->chunk_size );
+  uint32_t nblocks = 0;
+
+  for (size_t start = 0; start < size; start += header->chunk_size)
+    {
+      uint32_t block[2];
+      block[0] = size - start < header->chunk_size ? size - start : header->chunk_size;
+
+      const unsigned char * data = &compressed[0];
+      size_t compressed_size = compressBlock( header->codec, header->level,
+					      &compressed[0], block[0],
+					      buffer + start, block[0] );
+      if (compressed_size == 0 || compressed_size >= block[0])
+	{
+	  data = buffer + start;
+	  compressed_size = block[0];
+	}
+      block[1] = compressed_size;
+
+      blocks.insert( blocks.end(), (unsigned char *)block, (unsigned char *)block + sizeof(block) );
+      blocks.insert( blocks.end(), data, data + compressed_size );
+      ++nblocks;
+    }
+
+  uint64_t sizes[2];
+  sizes[0] = size;
+  sizes[1] = blocks.size();
+
+  if (fwrite( sizes, sizeof(uint64_t), 2, output_f ) != 2 ||
+      fwrite( &nblocks, sizeof(uint32_t), 1, output_f ) != 1 ||
+      (nblocks > 0 && fwrite( &blocks[0], 1, blocks.size(), output_f ) != blocks.size()) ||
+      ferror( output_f ))
+    return Z_ERRNO;
+  
+  return 0;
+}
+
+// make sure buffer can hold at least size bytes. The contents of buffer are lost.
+static int reserveBuffer( unsigned char ** buffer, size_t * allocated, size_t size )
+{
+  if (*buffer != NULL && *allocated >= size) return 0;
+  free( *buffer );
+  *allocated = 0;
+  *buffer = (unsigned char *)malloc( size > 0 ? size : 1 );
+  if (*buffer == NULL) return Z_MEM_ERROR;
+  *allocated = size;
+  return 0;
+}
+
+//--------------------------------------------------------------------------------
+// uncompress record data at data into buffer, which is enlarged if necessary.
+// Returns the number of bytes used from data or a negative value on error.
+long fromCompressedMemory( const GraphHeader * header, 
+			   unsigned char ** buffer, 
+			   size_t * allocated, 
+			   size_t * size,
+			   const unsigned char * data, 
+			   size_t available )
+{
+  const unsigned char * end = data + available;
+  int retval;
+
+  if (header->version < 2)
+    {
+      uLongf compressed_size;
+      if (available < sizeof(uLongf)) return Z_DATA_ERROR;
+      memcpy( &compressed_size, data, sizeof(uLongf) );
+      data += sizeof(uLongf);
+      if (compressed_size > (size_t)(end - data)) return Z_DATA_ERROR;
+      retval = reserveBuffer( buffer, allocated, GRAPH_LEGACY_BUFFER_SIZE );
+      if (retval != 0) return retval;
+      uLongf uncompressed_size = *allocated;
+      retval = uncompress( *buffer, &uncompressed_size, data, compressed_size );
+      if (retval != Z_OK) return retval;
+      *size = uncompressed_size;
+      return sizeof(uLongf) + compressed_size;
+    }
+  
+  if (available < RECORD_HEADER_SIZE) return Z_DATA_ERROR;
+  uint64_t sizes[2];
+  uint32_t nblocks;
+  memcpy( sizes, data, 2 * sizeof(uint64_t) );
+  memcpy( &nblocks, data + 2 * sizeof(uint64_t), sizeof(uint32_t) );
+  data += RECORD_HEADER_SIZE;
+  if (sizes[1] > (uint64_t)(end - data)) return Z_DATA_ERROR;
+  end = data + sizes[1];
+
+  retval = reserveBuffer( buffer, allocated, sizes[0] );
+  if (retval != 0) return retval;
+
+  uint64_t done = 0;
+  for (uint32_t x = 0; x < nblocks; ++x)
+    {
+      uint32_t block[2];
+      if (data + sizeof(block) > end) return Z_DATA_ERROR;
+      memcpy( block, data, sizeof(block) );
+      data += sizeof(block);
+      if (block[1] > (size_t)(end - data) || done + block[0] > sizes[0]) return Z_DATA_ERROR;
+
+      if (block[0] == block[1])
+	memcpy( *buffer + done, data, block[0] );
+      else
+	{
+	  retval = decompressBlock( header->codec, *buffer + done, block[0], data, block[1] );
+	  if (retval != 0) return retval;
+	}
+      data += block[1];
+      done += block[0];
+    }
+  
+  if (done != sizes[0]) return Z_DATA_ERROR;
+  *size = sizes[0];
+  return RECORD_HEADER_SIZE + sizes[1];
+}
+
+//--------------------------------------------------------------------------------
+// read the sizes at the start of a record. Returns the number of bytes
+// in head and sets total to the number of bytes in the record.
+static int readRecordSizes( const GraphHeader * header, 
+			    unsigned char * head, 
+			    size_t * total,
+			    FILE * input_f )
+{
+  if (header->version < 2)
+    {
+      uLongf compressed_size;
+      if (fread( head, sizeof(uLongf), 1, input_f ) != 1 || ferror(input_f)) return Z_ERRNO;
+      memcpy( &compressed_size, head, sizeof(uLongf) );
+      *total = sizeof(uLongf) + compressed_size;
+      return sizeof(uLongf);
+    }
+
+  uint64_t sizes[2];
+  if (fread( head, RECORD_HEADER_SIZE, 1, input_f ) != 1 || ferror(input_f)) return Z_ERRNO;
+  memcpy( sizes, head, 2 * sizeof(uint64_t) );
+  *total = RECORD_HEADER_SIZE + sizes[1];
+  return RECORD_HEADER_SIZE;
+}
+
+//--------------------------------------------------------------------------------
+int fromCompressedRecord( const GraphHeader * header, 
+			  unsigned char ** buffer, 
+			  size_t * allocated, 
+			  size_t * size, 
+			  FILE * input_f )
+{
+  unsigned char head[RECORD_HEADER_SIZE];
+  size_t total;
+  int n = readRecordSizes( header, head, &total, input_f );
+  if (n < 0) return n;
+  
+  std::vector<unsigned char> data( total );
+  memcpy( &data[0], head, n );
+  if (fread( &data[n], 1, total - n, input_f ) != total - n || ferror(input_f)) return Z_ERRNO;
+
+  long retval = fromCompressedMemory( header, buffer, allocated, size, &data[0], total );
+  return retval < 0 ? retval : 0;
+}
+
+//--------------------------------------------------------------------------------
+int skipCompressedRecord( const GraphHeader * header, FILE * input_f )
+{
+  unsigned char head[RECORD_HEADER_SIZE];
+  size_t total;
+  int n = readRecordSizes( header, head, &total, input_f );
+  if (n < 0) return n;
+  if (fseek( input_f, total - n, SEEK_CUR ) != 0) return Z_ERRNO;
+  return 0;
+}
+
 //--------------------------------------------------------------------------------
 void fillFileIndexMap( FileIndexMap & map_nid2fileindex, std::string & file_name_index)
 {
@@ -147,3 +467,61 @@ void fillFileIndexMap( FileIndexMap & map_nid2fileindex, std::string & file_name
     }
   delete [] index;
 }
+
+//--------------------------------------------------------------------------------
+// map a file read-only into memory. The size of the mapping is returned
+// in *size. Returns NULL on error.
+unsigned char * mapFile( const char * filename, size_t * size )
+{
+  int fd = open( filename, O_RDONLY );
+  if (fd < 0)
+    return NULL;
+
+  struct stat st;
+  if (fstat( fd, &st ) != 0 || st.st_size == 0)
+    {
+      close( fd );
+      return NULL;
+    }
+
+  void * p = mmap( NULL, st.st_size, PROT_READ, MAP_SHARED, fd, 0 );
+  // the mapping stays valid after the descriptor is closed
+  close( fd );
+
+  if (p == MAP_FAILED)
+    return NULL;
+
+  *size = st.st_size;
+  return (unsigned char *)p;
+}
+
+//--------------------------------------------------------------------------------
+int unmapFile( unsigned char * p, size_t size )
+{
+  return munmap( p, size );
+}
+
+//--------------------------------------------------------------------------------
+// convert a file position saved by fgetpos into a byte offset.
+// The argument is untyped as python extensions are compiled with
+// _FILE_OFFSET_BITS=64, which changes the name of fpos_t.
+long fileIndexToOffset( const void * index )
+{
+#ifdef __GLIBC__
+  return (long)((const FileIndex *)index)->__pos;
+#else
+  return (long)(*(const FileIndex *)index);
+#endif
+}
+
+//--------------------------------------------------------------------------------
+// convert a byte offset into a file position that can be used with fsetpos.
+void offsetToFileIndex( long offset, void * index )
+{
+  memset( index, 0, sizeof( FileIndex ) );
+#ifdef __GLIBC__
+  ((FileIndex *)index)->__pos = offset;
+#else
+  *(FileIndex *)index = offset;
+#endif
+}
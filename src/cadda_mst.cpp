@@ -1,30 +1,34 @@
 /*
   calculate minimum spanning tree for an edge list
-  use an edge list, i.e., a list of pairs of numbers, tab separated, one pair per line
-  vertices have to be labelled by numbers, which need not be consecutive
+  use an edge list, i.e., a list of pairs of tokens and a weight, 
+  tab separated, one edge per line.
 
-  Note: the edge list has to be sorted.
-
-  usage: components [OPTIONS] edge_list
+  Note: for cadda_build_mst the edge list has to be sorted by weight.
+  cadda_sort_build_mst sorts the edges itself.
 
   implemenation details:
-  -> parses graph twice in order to find out the number of vertices, if they 
-	are not given at command line
-  -> uses algorithm as given in Sedgewick, Algorithms in C, p 507 for calculating
-  connected components. If two nodes joined by an edge belong to two different connected 
+  -> tokens of the form nid_start_end are packed into a 64-bit integer 
+  and mapped to consecutive vertex indices with a hash table. Other tokens 
+  are stored as strings.
+  -> uses Kruskal's algorithm with a union-find structure (union by rank,
+  path halving). If two nodes joined by an edge belong to two different connected 
   components, the two components are unified and the edge is dumped. Otherwise, the edge
   is discarded.
-  -> components start at 1
  */
 
 #include <vector>
 #include <map>
 #include <set>
+#include <queue>
 
 #include <iostream>
 #include <iomanip>
 #include <fstream>
+#include <sstream>
 #include <string>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
 
 #include "adda.h"
 
@@ -32,122 +36,255 @@ using namespace std;
 
 extern size_t param_initial_graph_size;
 extern int param_report_step;
+extern unsigned int param_loglevel;
+extern int param_mst_sort_memory;
 
 typedef std::string Token;
 
 #define SEPARATOR '\t'
 
+//------------------------------------------------------------
+// parse an edge from a line. Returns false for comments and
+// lines that are not edges.
+static bool parseEdge( const std::string & line,
+		       size_t & end1, 
+		       size_t & start2, 
+		       size_t & end2,
+		       Score & weight )
+{
+  if (line.size() == 0 || line[0] == '#') return false;
+
+  end1 = line.find_first_of( " \t" );
+  if (end1 == std::string::npos) return false;
+  start2 = line.find_first_not_of( " \t", end1 );
+  if (start2 == std::string::npos) return false;
+  end2 = line.find_first_of( " \t", start2 );
+  if (end2 == std::string::npos) return false;
+
+  char * endptr;
+  const char * sweight = line.c_str() + end2;
+  weight = strtod( sweight, &endptr );
+  return endptr != sweight;
+}
+
+//------------------------------------------------------------
+// Map of tokens to consecutive vertex indices.
+//
+// Tokens of the form nid_start_end are packed into 64 bits 
+// (32 bits for the nid, 16 bits for start and end each) and
+// looked up in an open addressing hash table. Other tokens are
+// kept in a map and their key has the highest bit set.
+class VertexTable
+{
+ public:
+  VertexTable( size_t size = 0 ) : mSlots( 1024, 0 )
+    {
+      mKeys.reserve( size );
+    }
+
+  size_t size() const { return mKeys.size(); }
+
+  // return the vertex index of token, adding it if necessary
+  unsigned int getIndex( const char * token, size_t length )
+  {
+    unsigned long long key;
+    if (!pack( token, length, key ))
+      {
+	Token t( token, length );
+	std::map< Token, unsigned int >::iterator it( mOtherTokens.find( t ) );
+	if (it != mOtherTokens.end()) return it->second;
+	unsigned int index = mKeys.size();
+	mKeys.push_back( (1ULL << 63) | mOthers.size() );
+	mOthers.push_back( t );
+	mOtherTokens[t] = index;
+	return index;
+      }
+
+    size_t mask = mSlots.size() - 1;
+    size_t slot = hash( key ) & mask;
+    while (mSlots[slot] != 0)
+      {
+	if (mKeys[mSlots[slot] - 1] == key) return mSlots[slot] - 1;
+	slot = (slot + 1) & mask;
+      }
+
+    unsigned int index = mKeys.size();
+    mKeys.push_back( key );
+    mSlots[slot] = index + 1;
+
+    if (mKeys.size() * 2 > mSlots.size()) grow();
+    return index;
+  }
+
+  // write the token of vertex index
+  void write( std::ostream & out, unsigned int index ) const
+  {
+    unsigned long long key = mKeys[index];
+    if (key >> 63)
+      out << mOthers[key & ~(1ULL << 63)];
+    else
+      out << (key >> 32) << '_' << ((key >> 16) & 0xffff) << '_' << (key & 0xffff);
+  }
+
+ private:
+  static inline size_t hash( unsigned long long key )
+  {
+    key ^= key >> 33;
+    key *= 0xff51afd7ed558ccdULL;
+    key ^= key >> 33;
+    return (size_t)key;
+  }
+
+  // parse an unsigned number without leading zeros, so that
+  // the token can be restored exactly.
+  static inline bool parseNumber( const char * & p, const char * end, unsigned long long max_value, unsigned long long & value )
+  {
+    if (p == end || *p < '0' || *p > '9') return false;
+    if (*p == '0' && p + 1 != end && p[1] >= '0' && p[1] <= '9') return false;
+    value = 0;
+    for (; p != end && *p >= '0' && *p <= '9'; ++p)
+      {
+	value = value * 10 + (*p - '0');
+	if (value > max_value) return false;
+      }
+    return true;
+  }
+
+  static bool pack( const char * token, size_t length, unsigned long long & key )
+  {
+    const char * p = token;
+    const char * end = token + length;
+    unsigned long long nid, start, stop;
+    if (!parseNumber( p, end, 0x7fffffffULL, nid ) || p == end || *p++ != '_') return false;
+    if (!parseNumber( p, end, 0xffffULL, start ) || p == end || *p++ != '_') return false;
+    if (!parseNumber( p, end, 0xffffULL, stop ) || p != end) return false;
+    key = (nid << 32) | (start << 16) | stop;
+    return true;
+  }
+
+  void grow()
+  {
+    mSlots.assign( mSlots.size() * 2, 0 );
+    size_t mask = mSlots.size() - 1;
+    for (unsigned int index = 0; index < mKeys.size(); ++index)
+      {
+	if (mKeys[index] >> 63) continue;
+	size_t slot = hash( mKeys[index] ) & mask;
+	while (mSlots[slot] != 0) slot = (slot + 1) & mask;
+	mSlots[slot] = index + 1;
+      }
+  }
+
+  std::vector< unsigned long long > mKeys;
+  std::vector< unsigned int > mSlots;
+  std::map< Token, unsigned int > mOtherTokens;
+  std::vector< Token > mOthers;
+};
+
+//------------------------------------------------------------
+// Union-find structure on vertex indices with union by rank 
+// and path halving.
+class UnionFind
+{
+ public:
+  UnionFind( size_t size = 0 ) 
+    {
+      mParent.reserve( size );
+      mRank.reserve( size );
+    }
+
+  // join the components of index1 and index2. Returns false
+  // if they are already in the same component.
+  bool join( unsigned int index1, unsigned int index2 )
+  {
+    unsigned int needed = std::max( index1, index2 ) + 1;
+    while (mParent.size() < needed)
+      {
+	mParent.push_back( mParent.size() );
+	mRank.push_back( 0 );
+      }
+
+    unsigned int i = find( index1 );
+    unsigned int j = find( index2 );
+    if (i == j) return false;
+
+    if (mRank[i] < mRank[j]) std::swap( i, j );
+    mParent[j] = i;
+    if (mRank[i] == mRank[j]) ++mRank[i];
+    return true;
+  }
+
+ private:
+  unsigned int find( unsigned int x )
+  {
+    while (mParent[x] != x)
+      {
+	mParent[x] = mParent[mParent[x]];
+	x = mParent[x];
+      }
+    return x;
+  }
+
+  std::vector< unsigned int > mParent;
+  std::vector< unsigned char > mRank;
+};
+
+//------------------------------------------------------------
+// write an edge of the minimum spanning tree.
+static void writeEdge( std::ostream & outfile,
+		       const VertexTable & vertices,
+		       unsigned int index1,
+		       unsigned int index2,
+		       Score weight )
+{
+  vertices.write( outfile, index1 );
+  outfile << SEPARATOR;
+  vertices.write( outfile, index2 );
+  outfile << SEPARATOR << weight << std::endl;
+}
+
 //------------------------------------------------------------
 int cadda_build_mst( const char * output_filename, 
-								const char * input_filename)
+		     const char * input_filename)
 {
 
   std::ofstream outfile( output_filename );
 
-  std::vector< Nid > dad( param_initial_graph_size, 0 );
+  VertexTable vertices( param_initial_graph_size );
+  UnionFind components( param_initial_graph_size );
 
-  std::map< Token, int > map_token2vertex;
-  std::vector< Token > map_vertex2token;
-  
   int iteration = 0;
   
   InStream infile(input_filename); 
+  std::string line;
   
   int noutput = 0;
   
-  while (!infile.eof()) 
+  while (std::getline( infile, line ))
     {
       if (++iteration % param_report_step == 0) 
 	{
 	  std::cout << "## iteration=" << iteration << std::endl;
 	}
 
-      Token token1, token2;
+      size_t end1, start2, end2;
       Score weight;
+      if (!parseEdge( line, end1, start2, end2, weight )) continue;
       
-      infile >> token1 >> token2 >> weight;
-      infile.ignore(MAX_LINE_LENGTH, '\n');
+      // do not allow self-loops
+      if (line.compare( 0, end1, line, start2, end2 - start2 ) == 0) continue;
       
-      // do not allow self-loops and skip header
-      if (token1 == token2 ) continue;
+      unsigned int index1 = vertices.getIndex( line.c_str(), end1 );
+      unsigned int index2 = vertices.getIndex( line.c_str() + start2, end2 - start2 );
       
-      unsigned int index1, index2; 
-      std::map< Token, int >::iterator it;
+      if (index1 > index2) std::swap( index1, index2 );
       
-      if ( (it = map_token2vertex.find(token1)) == map_token2vertex.end()) 
+      // nodes belong to two different components.
+      if (components.join( index1, index2 ))
 	{
-	  index1 = map_vertex2token.size();
-	  map_token2vertex[token1] = index1;
-	  map_vertex2token.push_back(token1);
-	}	 	
-      else 
-	{
-	  index1 = (*it).second;
+	  noutput += 1;
+	  writeEdge( outfile, vertices, index1, index2, weight );
 	}
-      
-      if ( (it = map_token2vertex.find(token2)) == map_token2vertex.end()) 
-	{
-	  index2 = map_vertex2token.size();
-	  map_token2vertex[token2] = index2;
-	  map_vertex2token.push_back(token2);
-	} 
-      else 
-	{
-	  index2 = (*it).second;
-	}
-      
-      if (index1 > index2) 
-	{	
-	  std::swap( token1, token2 );
-	  std::swap( index1, index2 );
-	}
-      
-      if (index2+1 >= dad.size() )
-	dad.resize( (index2 * 2) + 1, 0);
-      
-      /* Sedgewick: Algo in C, p 507 */
-      {
-	int x,y,i,j,t;
-	x = i = index1;
-	y = j = index2;
-	
-#ifdef DEBUG
-	std::cout << "before: " << token1 << "=" << index1-1 <<" " << token2 << "=" << index2-1 
-		  << " " << dad[index1] << " " << dad[index2] << std::endl;
-#endif 
-	
-	while (dad[i] > 0) i = dad[i];
-	while (dad[j] > 0) j = dad[j];
-	while (dad[x] > 0) 
-	  {
-	    t = x; x = dad[x]; dad[t] = i; 
-	  }
-	while (dad[y] > 0) 
-	  {
-	    t = y; y = dad[y]; dad[t] = j; 
-	  }
-	
-	// nodes belong to two different components.
-	if (i != j) 
-	  {
-	    noutput += 1;
-	    outfile << token1 << SEPARATOR << token2 << SEPARATOR << weight << std::endl;
-	    if (dad[j] < dad[i]) 
-	      {
-		dad[j] += dad[i] -1; dad[i] = j; 
-	      }
-	    else 
-	      {
-		dad[i] += dad[j] -1; dad[j] = i; 
-	      }
-	  }
-	
-#ifdef DEBUG
-	std::cout << "after : " << token1 << "=" << index1-1 <<" " << token2 << "=" << index2-1 
-		  << " " << dad[index1] << " " << dad[index2] << " i=" << i << " j=" << j << std::endl;
-#endif 
-	
-      }
     }
   
   outfile << TOKEN;
@@ -157,12 +294,252 @@ int cadda_build_mst( const char * output_filename,
   return noutput;
 }
 
+//------------------------------------------------------------
+// Sorting edges for the minimum spanning tree.
+//
+// Tokens are mapped to vertex indices and each edge is stored as
+// a fixed size record with an integer key that sorts in the same
+// order as the weight. Edges are collected in a buffer of at most 
+// param_mst_sort_memory Mb. Each full buffer is radix sorted and 
+// written as a run to a temporary file. The runs are merged and
+// the sorted edges passed directly to Kruskal's algorithm.
+//------------------------------------------------------------
 
+struct SortedEdge
+{
+  unsigned long long key;
+  unsigned int index1;
+  unsigned int index2;
+};
 
+// map a weight to an unsigned integer that sorts in the same order.
+inline unsigned long long weightToKey( Score weight )
+{
+  unsigned long long bits;
+  memcpy( &bits, &weight, sizeof( bits ) );
+  if (bits >> 63)
+    return ~bits;
+  else
+    return bits | (1ULL << 63);
+}
 
+inline Score keyToWeight( unsigned long long key )
+{
+  unsigned long long bits = (key >> 63) ? (key & ~(1ULL << 63)) : ~key;
+  Score weight;
+  memcpy( &weight, &bits, sizeof( weight ) );
+  return weight;
+}
 
+//------------------------------------------------------------
+// stable least significant digit radix sort of edges by key.
+// Passes in which all keys share the same byte are skipped.
+static void radixSortEdges( std::vector< SortedEdge > & edges,
+			    std::vector< SortedEdge > & buffer )
+{
+  size_t n = edges.size();
+  buffer.resize( n );
 
+  for (unsigned int shift = 0; shift < 64; shift += 8)
+    {
+      size_t counts[257];
+      memset( counts, 0, sizeof( counts ) );
+      for (size_t x = 0; x < n; ++x)
+	++counts[((edges[x].key >> shift) & 0xff) + 1];
 
+      bool skip = false;
+      for (unsigned int b = 1; b <= 256; ++b)
+	if (counts[b] == n) { skip = true; break; }
+      if (skip) continue;
 
+      for (unsigned int b = 1; b <= 256; ++b)
+	counts[b] += counts[b-1];
+      for (size_t x = 0; x < n; ++x)
+	buffer[counts[(edges[x].key >> shift) & 0xff]++] = edges[x];
+      edges.swap( buffer );
+    }
+}
+
+//------------------------------------------------------------
+// A run of sorted edges in a temporary file.
+class EdgeRun
+{
+ public:
+  EdgeRun( const std::string & filename, size_t buffer_size ) :
+    mFilename( filename ), mBufferSize( buffer_size ), mPosition(0)
+    {
+      mFile = fopen( mFilename.c_str(), "rb" );
+      if (mFile == NULL)
+	{
+	  std::cerr << "could not open run " << mFilename << std::endl;
+	  exit(EXIT_FAILURE);
+	}
+      fill();
+    }
+
+  ~EdgeRun()
+    {
+      fclose( mFile );
+      remove( mFilename.c_str() );
+    }
+
+  bool empty() const { return mPosition >= mBuffer.size(); }
+  
+  const SortedEdge & top() const { return mBuffer[mPosition]; }
+
+  void next()
+    {
+      if (++mPosition >= mBuffer.size()) fill();
+    }
+
+ private:
+  void fill()
+    {
+      mBuffer.resize( mBufferSize );
+      size_t n = fread( &mBuffer[0], sizeof( SortedEdge ), mBufferSize, mFile );
+      mBuffer.resize( n );
+      mPosition = 0;
+    }
+
+  std::string mFilename;
+  FILE * mFile;
+  size_t mBufferSize;
+  std::vector< SortedEdge > mBuffer;
+  size_t mPosition;
+};
+
+// order for the priority queue: smallest key first, ties by run
+typedef std::pair< unsigned long long, size_t > RunKey;
+
+//------------------------------------------------------------
+int cadda_sort_build_mst( const char * output_filename, 
+			  const char * input_filename,
+			  const char * tmpdir )
+{
+  // half of the memory is used for the edges, the other half for sorting
+  size_t max_edges = (size_t)param_mst_sort_memory * 1024 * 1024 / sizeof( SortedEdge ) / 2;
+  if (max_edges < 1024) max_edges = 1024;
+
+  VertexTable vertices( param_initial_graph_size );
+
+  std::vector< SortedEdge > edges;
+  std::vector< SortedEdge > buffer;
+  std::vector< std::string > run_filenames;
+
+  edges.reserve( max_edges );
+
+  InStream infile(input_filename); 
+  std::string line;
+  long iteration = 0;
+  
+  //------------------------------------------------------------
+  // read edges and write sorted runs
+  while (std::getline( infile, line ))
+    {
+      if (++iteration % param_report_step == 0) 
+	std::cout << "## iteration=" << iteration << std::endl;
+
+      size_t end1, start2, end2;
+      Score weight;
+      if (!parseEdge( line, end1, start2, end2, weight )) continue;
 
+      // do not allow self-loops
+      if (line.compare( 0, end1, line, start2, end2 - start2 ) == 0) continue;
 
+      SortedEdge edge;
+      edge.key = weightToKey( weight );
+      edge.index1 = vertices.getIndex( line.c_str(), end1 );
+      edge.index2 = vertices.getIndex( line.c_str() + start2, end2 - start2 );
+      edges.push_back( edge );
+      if (edges.size() >= max_edges)
+	{
+	  radixSortEdges( edges, buffer );
+
+	  std::ostringstream filename;
+	  filename << tmpdir << "/mst_run" << run_filenames.size();
+	  run_filenames.push_back( filename.str() );
+
+	  FILE * outfile = fopen( filename.str().c_str(), "wb" );
+	  if (outfile == NULL || 
+	      fwrite( &edges[0], sizeof( SortedEdge ), edges.size(), outfile ) != edges.size())
+	    {
+	      std::cerr << "could not write run " << filename.str() << std::endl;
+	      exit(EXIT_FAILURE);
+	    }
+	  fclose( outfile );
+
+	  if (param_loglevel >= 1)
+	    std::cout << "# written run " << run_filenames.size() << " with " << edges.size() << " edges" << std::endl;
+
+	  edges.clear();
+	}
+    }
+  infile.close();
+
+  radixSortEdges( edges, buffer );
+  std::vector< SortedEdge >().swap( buffer );
+
+  if (param_loglevel >= 1)
+    std::cout << "# read " << vertices.size() << " vertices in " 
+	      << run_filenames.size() + 1 << " runs" << std::endl;
+
+  //------------------------------------------------------------
+  // merge runs and build minimum spanning tree
+  std::ofstream outfile( output_filename );
+  UnionFind components( vertices.size() );
+  int noutput = 0;
+
+  std::vector< EdgeRun * > runs;
+  size_t run_buffer_size = max_edges / (run_filenames.size() + 1) + 1;
+  for (size_t x = 0; x < run_filenames.size(); ++x)
+    runs.push_back( new EdgeRun( run_filenames[x], run_buffer_size ) );
+  
+  // the in-memory edges are the last run
+  size_t memory_run = runs.size();
+  size_t memory_position = 0;
+
+  std::priority_queue< RunKey, std::vector< RunKey >, std::greater< RunKey > > queue;
+  for (size_t x = 0; x < runs.size(); ++x)
+    if (!runs[x]->empty()) 
+      queue.push( RunKey( runs[x]->top().key, x ) );
+  if (edges.size() > 0)
+    queue.push( RunKey( edges[0].key, memory_run ) );
+  
+  while (!queue.empty())
+    {
+      size_t run = queue.top().second;
+      queue.pop();
+
+      SortedEdge edge;
+      if (run == memory_run)
+	{
+	  edge = edges[memory_position++];
+	  if (memory_position < edges.size())
+	    queue.push( RunKey( edges[memory_position].key, run ) );
+	}
+      else
+	{
+	  edge = runs[run]->top();
+	  runs[run]->next();
+	  if (!runs[run]->empty())
+	    queue.push( RunKey( runs[run]->top().key, run ) );
+	}
+
+      unsigned int index1 = edge.index1, index2 = edge.index2;
+      if (index1 > index2) std::swap( index1, index2 );
+
+      if (components.join( index1, index2 ))
+	{
+	  noutput += 1;
+	  writeEdge( outfile, vertices, index1, index2, keyToWeight( edge.key ) );
+	}
+    }
+
+  for (size_t x = 0; x < runs.size(); ++x)
+    delete runs[x];
+
+  outfile << TOKEN;
+  outfile.close();
+
+  return noutput;
+}
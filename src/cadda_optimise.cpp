@@ -19,6 +19,8 @@
 #include <iterator>
 #include <cassert>
 #include <cstdio>
+#include <pthread.h>
+#include <unistd.h>
 
 #include <string>
 #include <map>
@@ -81,6 +83,11 @@ extern  std::string param_file_name_domains;
 extern  bool param_disallow_shortening;
 extern  bool param_descend;
 extern  int param_max_iterations;
+extern  int param_num_threads;
+extern  bool param_link_cache;
+extern  int param_link_cache_memory;
+extern  std::string param_file_name_link_cache;
+extern  bool param_incremental;
 extern  bool param_use_file_nids;
 
 /* function parameters for sigmoid */
@@ -518,6 +525,7 @@ double calculatePartitionScore( LinkList & links,
 
 // global variables
 FILE * global_file_links = NULL;
+GraphHeader global_graph_header;
 FileIndexMap global_map_nid2fileindex;
 Partitions global_partitions;
 Trees global_trees;
@@ -577,6 +585,636 @@ void mergeLinks( LinkList & links )
     }
 }
 
+//--------------------------------------------------------------------------------
+/** optimise the partitions of a single sequence.
+
+    Every current partition of nid is split. The split is retained only, 
+    if it is an improvement over the previous assignment.
+
+    Only the partitions of nid are changed. The partitions of the
+    sequences linked to nid are read.
+
+    return the improvement (negative values are better).
+ */
+double optimiseNid( Nid nid, LinkList & links )
+{
+  double improvement = 0;
+
+  PartitionList::iterator it(global_partitions[nid].begin()), end(global_partitions[nid].end());
+
+  while (it!=end)
+    {
+
+      Node node = it->node;
+
+      PartitionList new_partitions;
+      
+      fillPartitionsWithChildren(global_trees,
+				 nid,
+				 node,
+				 back_insert_iterator< PartitionList >(new_partitions));
+
+      if (new_partitions.size() == 0)
+	{
+	  ++it;
+	  continue;
+	}
+
+      if (param_loglevel >= 2)
+	{
+	  cout << "# ----> new partitions for sequence " << nid << ": ";
+	  std::copy(
+		    new_partitions.begin(),
+		    new_partitions.end(),
+		    ostream_iterator< Partition >( std::cout, ";"));
+	  cout << endl;
+	}
+
+      if (param_disallow_shortening && (new_partitions.size() != 2))
+	{
+	  ++it;
+	  continue;
+	}
+      
+      
+      double score = calculatePartitionScore( links, global_partitions, *it, new_partitions );
+
+      if (score < 0)
+	{
+	  if (param_loglevel >= 2)
+	    cout << "# ----> substituting partitition" << endl;
+	  
+	  global_partitions[nid].insert( it, new_partitions.begin(), new_partitions.end());
+	  it = global_partitions[nid].erase( it );
+	  improvement += score;
+	  
+	  if (param_descend)
+	    for (unsigned int i = 0; i < new_partitions.size(); ++i)
+	      --it;
+	}
+      else
+	{
+	  if (param_loglevel >= 2)
+	    std::cout << "# ----> keeping partitition" << endl;
+	  ++it;
+	}
+      
+      if (param_loglevel >= 4)
+	std::cout << "# ----------------------------------------------------------------" << endl;
+    }
+  
+  return improvement;
+}
+
+//--------------------------------------------------------------------------------
+/** cache of merged links.
+
+    The links of all nids are decoded and merged once and stored in
+    nid order in compressed sparse row format: the links of nid are 
+    at positions global_link_offsets[nid] to global_link_offsets[nid+1].
+
+    The first global_link_cache.size() links are kept in memory, 
+    the remaining links are spilled to a file.
+ */
+struct CachedLink
+{
+  Nid sbjct_nid;
+  Residue query_from;
+  Residue query_to;
+  Residue sbjct_from;
+  Residue sbjct_to;
+};
+
+bool global_link_cache_ready = false;
+std::vector< size_t > global_link_offsets;
+std::vector< CachedLink > global_link_cache;
+FILE * global_link_spill = NULL;
+
+void getCachedLinks( Nid nid, LinkList & links )
+{
+  size_t start = global_link_offsets[nid];
+  size_t end = global_link_offsets[nid+1];
+  if (start == end) return;
+
+  const CachedLink * cached;
+  std::vector< CachedLink > buffer;
+
+  if (end <= global_link_cache.size())
+    {
+      cached = &global_link_cache[start];
+    }
+  else
+    {
+      // read spilled links. pread does not change the file position
+      // and can be used by several threads.
+      buffer.resize( end - start );
+      size_t bytes = buffer.size() * sizeof( CachedLink );
+      off_t offset = (start - global_link_cache.size()) * sizeof( CachedLink );
+      if (pread( fileno( global_link_spill ), &buffer[0], bytes, offset ) != (ssize_t)bytes)
+	{
+	  std::cerr << "could not read cached links for nid " << nid << " from " << param_file_name_link_cache << std::endl;
+	  exit(EXIT_FAILURE);
+	}
+      cached = &buffer[0];
+    }
+
+  links.reserve( end - start );
+  for (size_t x = 0; x < end - start; ++x)
+    links.push_back( Link( nid, 
+			   cached[x].query_from, cached[x].query_to, 
+			   cached[x].sbjct_nid, 
+			   cached[x].sbjct_from, cached[x].sbjct_to, 
+			   0) );
+}
+
+//--------------------------------------------------------------------------------
+/** read and merge the links of nid from file.
+
+    If the link cache has been built, the links are taken from
+    the cache instead.
+ */
+void readLinks( FILE * file, Nid nid, LinkList & links )
+{
+  if (global_link_cache_ready)
+    {
+      getCachedLinks( nid, links );
+      return;
+    }
+
+  fsetpos( file, &global_map_nid2fileindex[nid] );
+	  
+  fillLinks( file,
+	     global_graph_header,
+	     nid,
+	     back_insert_iterator< LinkList >(links));
+
+  if (param_loglevel >= 3)
+    cout << "# --> found " << links.size() << " links" << endl;
+	  
+  if (links.size() == 0)
+    return;
+
+  mergeLinks( links );
+			
+  if (param_loglevel >= 3)
+    cout << "# --> found " << links.size() << " links" << endl;
+}
+
+//--------------------------------------------------------------------------------
+/** incremental optimisation.
+
+    The result of optimising a nid only depends on its own partitions
+    and on the partitions of the nids it is linked to. If none of these
+    have changed since the nid has been optimised last, the nid will
+    not change and can be skipped.
+
+    global_dirty flags the nids that need to be optimised. If a nid
+    changes, nids linked to it with a larger nid are flagged in the 
+    current iteration, while the nid itself and nids linked to it with 
+    a smaller nid are flagged for the next iteration. 
+
+    The nids linked to a nid are collected during the first iteration,
+    in which all nids are optimised. The results are identical to 
+    optimising all nids in each iteration.
+ */
+std::vector< char > global_dirty;
+std::vector< char > global_changed;
+bool global_linked_from_ready = false;
+std::vector< std::pair< Nid, Nid > > global_linked_from_edges;
+std::vector< size_t > global_linked_from_offsets;
+std::vector< Nid > global_linked_from;
+
+inline bool isDirty( Nid nid )
+{
+  return !param_incremental || global_dirty[nid];
+}
+
+/** record the nids that nid is linked to. */
+static void collectLinkedFrom( Nid nid, LinkList & links )
+{
+  if (!param_incremental || global_linked_from_ready) return;
+
+  Nid last = 0;
+  LinkList::iterator it(links.begin()), end(links.end());
+  for (; it != end; ++it)
+    {
+      Nid sbjct_nid = it->sbjct_nid;
+      if (sbjct_nid == nid || sbjct_nid == last) continue;
+      global_linked_from_edges.push_back( std::pair< Nid, Nid >( sbjct_nid, nid ) );
+      last = sbjct_nid;
+    }
+}
+
+/** build index of nids linked to a nid from the collected links. */
+static void buildLinkedFrom()
+{
+  Nid nnids = (Nid)global_map_nid2fileindex.size();
+
+  global_linked_from_offsets.assign( nnids + 1, 0 );
+  std::vector< std::pair< Nid, Nid > >::iterator it, end(global_linked_from_edges.end());
+  for (it = global_linked_from_edges.begin(); it != end; ++it)
+    ++global_linked_from_offsets[it->first + 1];
+  for (Nid nid = 0; nid < nnids; ++nid)
+    global_linked_from_offsets[nid + 1] += global_linked_from_offsets[nid];
+
+  std::vector< size_t > positions( global_linked_from_offsets.begin(), global_linked_from_offsets.end() - 1 );
+  global_linked_from.resize( global_linked_from_edges.size() );
+  for (it = global_linked_from_edges.begin(); it != end; ++it)
+    global_linked_from[positions[it->first]++] = it->second;
+
+  std::vector< std::pair< Nid, Nid > >().swap( global_linked_from_edges );
+  global_linked_from_ready = true;
+}
+
+/** record that nid has changed during the current iteration. */
+static void markChanged( Nid nid )
+{
+  if (!param_incremental) return;
+
+  global_changed[nid] = 1;
+  if (!global_linked_from_ready) return;
+
+  for (size_t x = global_linked_from_offsets[nid]; x < global_linked_from_offsets[nid+1]; ++x)
+    if (global_linked_from[x] > nid)
+      global_dirty[global_linked_from[x]] = 1;
+}
+
+/** flag the nids to be optimised in the next iteration. */
+static void updateDirty()
+{
+  if (!param_incremental) return;
+  if (!global_linked_from_ready) buildLinkedFrom();
+
+  Nid nnids = (Nid)global_map_nid2fileindex.size();
+  global_dirty.assign( nnids, 0 );
+  for (Nid nid = 1; nid < nnids; ++nid)
+    {
+      if (!global_changed[nid]) continue;
+      global_dirty[nid] = 1;
+      for (size_t x = global_linked_from_offsets[nid]; x < global_linked_from_offsets[nid+1]; ++x)
+	if (global_linked_from[x] < nid)
+	  global_dirty[global_linked_from[x]] = 1;
+    }
+  global_changed.assign( nnids, 0 );
+}
+
+//--------------------------------------------------------------------------------
+/** parallel optimisation.
+
+    The nids are processed in windows of consecutive nids. The links of
+    all nids in a window are read in parallel. 
+
+    Two nids conflict, if one of them is linked to the other: one 
+    of them changes partitions that the other uses for scoring. 
+    Each nid in a window is assigned to a level, which is one more than
+    the highest level of any lower conflicting nid in the window. 
+    Nids within the same level do not conflict and are optimised in 
+    parallel. Levels are processed in increasing order.
+
+    The worker threads are started once and are fed the tasks of
+    each level until cadda_optimise_destroy is called.
+
+    As each nid sees the same partitions as in a sequential
+    sweep over the nids, the results are identical.
+
+    In incremental mode, only the links of nids that are dirty or
+    might become dirty within the window are read.
+ */
+
+#define OPTIMISE_WINDOW_SIZE 10000
+
+std::vector< FILE * > global_thread_files;
+
+struct OptimiseWindow
+{
+  Nid first;
+  std::vector< LinkList > links;
+  std::vector< double > improvements;
+  std::vector< Nid > tasks;
+};
+
+typedef void (*ParallelFunction)( OptimiseWindow *, size_t, unsigned int );
+
+/** a job for the worker threads. A new job is started by 
+    incrementing generation. Workers take tasks from next
+    until end is reached and decrement active when done.
+ */
+struct ParallelJob
+{
+  ParallelFunction function;
+  OptimiseWindow * window;
+  size_t next;
+  size_t end;
+  unsigned long generation;
+  unsigned int active;
+  bool stop;
+  pthread_mutex_t lock;
+  pthread_cond_t start;
+  pthread_cond_t done;
+};
+
+struct ParallelWorker
+{
+  ParallelJob * job;
+  unsigned int thread;
+};
+
+static ParallelJob global_job;
+static std::vector< pthread_t > global_workers;
+static std::vector< ParallelWorker > global_worker_data;
+
+static void * runParallelWorker( void * arg )
+{
+  ParallelWorker * worker = (ParallelWorker *)arg;
+  ParallelJob * job = worker->job;
+  unsigned long generation = 0;
+
+  pthread_mutex_lock( &job->lock );
+  while (1)
+    {
+      // wait for the next job
+      while (job->generation == generation && !job->stop)
+	pthread_cond_wait( &job->start, &job->lock );
+      if (job->stop) break;
+      generation = job->generation;
+
+      while (job->next < job->end)
+	{
+	  size_t task = job->next++;
+	  pthread_mutex_unlock( &job->lock );
+	  job->function( job->window, task, worker->thread );
+	  pthread_mutex_lock( &job->lock );
+	}
+
+      if (--job->active == 0)
+	pthread_cond_signal( &job->done );
+    }
+  pthread_mutex_unlock( &job->lock );
+  return NULL;
+}
+
+/** start one worker thread for each thread file. 
+    The workers are kept until stopParallelWorkers is called.
+ */
+static void startParallelWorkers()
+{
+  if (global_workers.size() > 0) return;
+
+  unsigned int nthreads = global_thread_files.size();
+
+  global_job.generation = 0;
+  global_job.active = 0;
+  global_job.stop = false;
+  pthread_mutex_init( &global_job.lock, NULL );
+  pthread_cond_init( &global_job.start, NULL );
+  pthread_cond_init( &global_job.done, NULL );
+
+  global_workers.resize( nthreads );
+  global_worker_data.resize( nthreads );
+
+  for (unsigned int x = 0; x < nthreads; ++x)
+    {
+      global_worker_data[x].job = &global_job;
+      global_worker_data[x].thread = x;
+      pthread_create( &global_workers[x], NULL, runParallelWorker, &global_worker_data[x] );
+    }
+}
+
+static void stopParallelWorkers()
+{
+  if (global_workers.size() == 0) return;
+
+  pthread_mutex_lock( &global_job.lock );
+  global_job.stop = true;
+  pthread_cond_broadcast( &global_job.start );
+  pthread_mutex_unlock( &global_job.lock );
+
+  for (unsigned int x = 0; x < global_workers.size(); ++x)
+    pthread_join( global_workers[x], NULL );
+
+  pthread_cond_destroy( &global_job.done );
+  pthread_cond_destroy( &global_job.start );
+  pthread_mutex_destroy( &global_job.lock );
+
+  global_workers.clear();
+  global_worker_data.clear();
+}
+
+/** call function for tasks from start to end in parallel
+    and wait until all tasks are done. */
+static void runParallel( ParallelFunction function,
+		  OptimiseWindow * window,
+		  size_t start, 
+		  size_t end )
+{
+  if (start >= end) return;
+
+  startParallelWorkers();
+
+  pthread_mutex_lock( &global_job.lock );
+  global_job.function = function;
+  global_job.window = window;
+  global_job.next = start;
+  global_job.end = end;
+  global_job.active = global_workers.size();
+  ++global_job.generation;
+  pthread_cond_broadcast( &global_job.start );
+
+  while (global_job.active > 0)
+    pthread_cond_wait( &global_job.done, &global_job.lock );
+  pthread_mutex_unlock( &global_job.lock );
+}
+
+static void readWindowLinks( OptimiseWindow * window, size_t task, unsigned int thread )
+{
+  Nid nid = window->first + task;
+  readLinks( global_thread_files[thread], nid, window->links[task] );
+}
+
+static void readWindowTaskLinks( OptimiseWindow * window, size_t task, unsigned int thread )
+{
+  Nid nid = window->tasks[task];
+  readLinks( global_thread_files[thread], nid, window->links[nid - window->first] );
+}
+
+static void optimiseWindowNid( OptimiseWindow * window, size_t task, unsigned int thread )
+{
+  Nid nid = window->tasks[task];
+  Nid x = nid - window->first;
+  window->improvements[x] = optimiseNid( nid, window->links[x] );
+}
+
+static void optimiseWindow( OptimiseWindow & window, Nid last, double & improvement )
+{
+  Nid first = window.first;
+  size_t size = last - first;
+
+  window.links.clear();
+  window.links.resize( size );
+  window.improvements.assign( size, 0 );
+
+  // select nids that are dirty or can become dirty through
+  // a change of a smaller nid in the window
+  std::vector< char > candidates( size, 0 );
+  for (Nid x = 0; x < (Nid)size; ++x)
+    {
+      if (isDirty( first + x )) candidates[x] = 1;
+      if (!candidates[x] || !param_incremental || !global_linked_from_ready) continue;
+      for (size_t y = global_linked_from_offsets[first+x]; y < global_linked_from_offsets[first+x+1]; ++y)
+	{
+	  Nid nid = global_linked_from[y];
+	  if (nid > first + x && nid < last) candidates[nid - first] = 1;
+	}
+    }
+
+  window.tasks.clear();
+  for (Nid x = 0; x < (Nid)size; ++x)
+    if (candidates[x]) 
+      window.tasks.push_back( first + x );
+
+  // read links
+  runParallel( readWindowTaskLinks, &window, 0, window.tasks.size() );
+
+  for (Nid x = 0; x < (Nid)size; ++x)
+    collectLinkedFrom( first + x, window.links[x] );
+
+  // assign levels
+  std::vector< int > levels( size, -1 );
+  std::vector< int > constraints( size, -1 );
+  int max_level = -1;
+
+  for (Nid x = 0; x < (Nid)size; ++x)
+    {
+      LinkList & links = window.links[x];
+      if (links.size() == 0) continue;
+
+      int level = constraints[x] + 1;
+      LinkList::iterator it(links.begin()), end(links.end());
+      for (; it != end; ++it)
+	{
+	  Nid y = it->sbjct_nid - first;
+	  if (y < 0 || y >= (Nid)size || y == x) continue;
+	  if (y < x)
+	    level = std::max( level, levels[y] + 1 );
+	}
+      levels[x] = level;
+
+      // nids linked from x have to be processed after x
+      for (it = links.begin(); it != end; ++it)
+	{
+	  Nid y = it->sbjct_nid - first;
+	  if (y > x && y < (Nid)size)
+	    constraints[y] = std::max( constraints[y], level );
+	}
+      max_level = std::max( max_level, level );
+    }
+
+  // process each level in parallel
+  for (int level = 0; level <= max_level; ++level)
+    {
+      window.tasks.clear();
+      for (Nid x = 0; x < (Nid)size; ++x)
+	if (levels[x] == level && isDirty( first + x )) 
+	  window.tasks.push_back( first + x );
+
+      runParallel( optimiseWindowNid, &window, 0, window.tasks.size() );
+
+      for (size_t x = 0; x < window.tasks.size(); ++x)
+	if (window.improvements[window.tasks[x] - first] < 0)
+	  markChanged( window.tasks[x] );
+    }
+
+  // sum improvements in order of nids
+  for (Nid x = 0; x < (Nid)size; ++x)
+    improvement += window.improvements[x];
+}
+
+//--------------------------------------------------------------------------------
+/** add links to the cache. Once the memory limit is reached,
+    links are written to the spill file.
+ */
+static void addCachedLinks( Nid nid, LinkList & links, size_t max_cached )
+{
+  size_t start = global_link_offsets[nid];
+
+  std::vector< CachedLink > cached( links.size() );
+  for (size_t x = 0; x < links.size(); ++x)
+    {
+      cached[x].sbjct_nid = links[x].sbjct_nid;
+      cached[x].query_from = links[x].query_from;
+      cached[x].query_to = links[x].query_to;
+      cached[x].sbjct_from = links[x].sbjct_from;
+      cached[x].sbjct_to = links[x].sbjct_to;
+    }
+
+  if (global_link_spill == NULL && start + cached.size() > max_cached)
+    {
+      if (param_loglevel >= 1)
+	std::cout << "# link cache is full at nid " << nid << " - spilling links to " 
+		  << param_file_name_link_cache << std::endl;
+
+      global_link_spill = fopen( param_file_name_link_cache.c_str(), "w+b" );
+      if (global_link_spill == NULL)
+	{
+	  std::cerr << "could not open file for link cache: " << param_file_name_link_cache << std::endl;
+	  exit(EXIT_FAILURE);
+	}
+    }
+
+  if (global_link_spill == NULL)
+    global_link_cache.insert( global_link_cache.end(), cached.begin(), cached.end() );
+  else if (cached.size() > 0)
+    if (fwrite( &cached[0], sizeof( CachedLink ), cached.size(), global_link_spill ) != cached.size())
+      {
+	std::cerr << "could not write to link cache " << param_file_name_link_cache << std::endl;
+	exit(EXIT_FAILURE);
+      }
+
+  global_link_offsets[nid+1] = start + cached.size();
+}
+
+//--------------------------------------------------------------------------------
+/** decode and merge the links of all nids and store them in 
+    the link cache.
+ */
+static void buildLinkCache()
+{
+  Nid nnids = (Nid)global_map_nid2fileindex.size();
+  size_t max_cached = (size_t)param_link_cache_memory * 1024 * 1024 / sizeof( CachedLink );
+
+  if (param_loglevel >= 1)
+    std::cout << "# building link cache for " << nnids << " nids" << std::endl;
+
+  global_link_offsets.assign( nnids + 1, 0 );
+
+  OptimiseWindow window;
+  for (Nid first = 1; first < nnids; first += OPTIMISE_WINDOW_SIZE)
+    {
+      Nid last = std::min( first + OPTIMISE_WINDOW_SIZE, nnids );
+      window.first = first;
+      window.links.clear();
+      window.links.resize( last - first );
+
+      if (global_thread_files.size() > 0)
+	runParallel( readWindowLinks, &window, 0, last - first );
+      else
+	for (Nid nid = first; nid < last; ++nid)
+	  readLinks( global_file_links, nid, window.links[nid - first] );
+
+      for (Nid nid = first; nid < last; ++nid)
+	addCachedLinks( nid, window.links[nid - first], max_cached );
+    }
+
+  if (global_link_spill != NULL)
+    fflush( global_link_spill );
+
+  global_link_cache_ready = true;
+
+  if (param_loglevel >= 1)
+    std::cout << "# link cache: " << global_link_offsets[nnids] << " links, " 
+	      << global_link_cache.size() << " in memory" << std::endl;
+}
+
 //--------------------------------------------------------------------------------
 /** optimize partitions.
 
@@ -597,6 +1235,10 @@ void mergeLinks( LinkList & links )
 		save partitions to file
 
 	return improvement
+
+    If several threads are used, nids are optimised in parallel
+    (see optimiseWindow). In incremental mode, only nids flagged
+    as dirty are optimised.
  */
 double cadda_optimise_iteration()
 {
@@ -612,105 +1254,80 @@ double cadda_optimise_iteration()
 
   double improvement = 0;
   
-  Nid nid = 1;
+  Nid nnids = (Nid)global_map_nid2fileindex.size();
+
+  if (global_thread_files.size() > 0)
+    {
+      OptimiseWindow window;
+      for (Nid first = 1; first < nnids; first += OPTIMISE_WINDOW_SIZE)
+	{
+	  window.first = first;
+	  optimiseWindow( window, std::min( first + OPTIMISE_WINDOW_SIZE, nnids ), improvement );
+	}
+    }
+  else
+    {
+      Nid nid = 1;
   
-  for (; nid < (Nid)global_map_nid2fileindex.size(); ++nid)
+      for (; nid < nnids; ++nid)
 	{
+	  if (!isDirty( nid ))
+	    continue;
+
 	  if (param_loglevel >= 2)
 	    cout << "--> checking split of sequence " << nid << endl;
 
 	  LinkList links;
-	  fsetpos( global_file_links, &global_map_nid2fileindex[nid] );
-	  
-	  fillLinks( global_file_links,
-		     nid,
-		     back_insert_iterator< LinkList >(links));
-
-	  if (param_loglevel >= 3)
-	    cout << "# --> found " << links.size() << " links" << endl;
-	  
+	  readLinks( global_file_links, nid, links );
+	  collectLinkedFrom( nid, links );
 	  if (links.size() == 0)
 	    continue;
 
-	  mergeLinks( links );
-			
-	  if (param_loglevel >= 3)
-	    cout << "# --> found " << links.size() << " links" << endl;
-
-	  PartitionList::iterator it(global_partitions[nid].begin()), end(global_partitions[nid].end());
-
-	  while (it!=end)
-	    {
-
-	      Node node = it->node;
-
-	      PartitionList new_partitions;
-	      
-	      fillPartitionsWithChildren(global_trees,
-					 nid,
-					 node,
-					 back_insert_iterator< PartitionList >(new_partitions));
-
-	      if (new_partitions.size() == 0)
-		{
-		  ++it;
-		  continue;
-		}
-
-	      if (param_loglevel >= 2)
-		{
-		  cout << "# ----> new partitions for sequence " << nid << ": ";
-		  std::copy(
-			    new_partitions.begin(),
-			    new_partitions.end(),
-			    ostream_iterator< Partition >( std::cout, ";"));
-		  cout << endl;
-		}
-
-	      if (param_disallow_shortening && (new_partitions.size() != 2))
-		{
-		  ++it;
-		  continue;
-		}
-	      
-	      
-	      double score = calculatePartitionScore( links, global_partitions, *it, new_partitions );
-
-	      if (score < 0)
-		{
-		  if (param_loglevel >= 2)
-		    cout << "# ----> substituting partitition" << endl;
-		  
-		  global_partitions[nid].insert( it, new_partitions.begin(), new_partitions.end());
-		  it = global_partitions[nid].erase( it );
-		  improvement += score;
-		  
-		  if (param_descend)
-		    for (unsigned int i = 0; i < new_partitions.size(); ++i)
-		      --it;
-		}
-	      else
-		{
-		  if (param_loglevel >= 2)
-		    std::cout << "# ----> keeping partitition" << endl;
-		  ++it;
-		}
-	      
-	      if (param_loglevel >= 4)
-		std::cout << "# ----------------------------------------------------------------" << endl;
-	    }
+	  double delta = optimiseNid( nid, links );
+	  if (delta < 0)
+	    markChanged( nid );
+	  improvement += delta;
 	}
+    }
 
-	if (param_loglevel >= 1)
-		std::cout << "# --> improvement=" << -improvement << std::endl;
+  if (param_incremental)
+    {
+      if (param_loglevel >= 1)
+	std::cout << "# --> changed=" 
+		  << std::count( global_changed.begin(), global_changed.end(), 1 ) 
+		  << std::endl;
+      updateDirty();
+    }
 
-	return -improvement;
+  if (param_loglevel >= 1)
+    std::cout << "# --> improvement=" << -improvement << std::endl;
+
+  return -improvement;
 }
 
 //--------------------------------------------------------------------------------
 int cadda_optimise_destroy()
 {
   fclose( global_file_links );
+  if (global_link_spill != NULL)
+    {
+      fclose( global_link_spill );
+      remove( param_file_name_link_cache.c_str() );
+      global_link_spill = NULL;
+    }
+  global_link_cache_ready = false;
+  global_link_offsets.clear();
+  global_link_cache.clear();
+  global_dirty.clear();
+  global_changed.clear();
+  global_linked_from_ready = false;
+  global_linked_from_edges.clear();
+  global_linked_from_offsets.clear();
+  global_linked_from.clear();
+  stopParallelWorkers();
+  for (unsigned int x = 0; x < global_thread_files.size(); ++x)
+    fclose( global_thread_files[x] );
+  global_thread_files.clear();
   global_map_nid2fileindex.clear();
   global_partitions.clear();
   global_trees.clear();
@@ -859,6 +1476,43 @@ int cadda_optimise_initialise()
 		exit(EXIT_FAILURE);
 	}
 
+	if (readGraphHeader( global_file_links, &global_graph_header ) != 0)
+	{
+		std::cerr << "could not read header of " << param_file_name_graph << std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	// each thread reads links from its own file handle
+	if (param_num_threads > 1)
+	{
+	  if (param_loglevel >= 1)
+	    cout << "# using " << param_num_threads << " threads" << std::endl;
+
+	  for (int x = 0; x < param_num_threads; ++x)
+	    {
+	      FILE * file = fopen(param_file_name_graph.c_str(),"r");
+	      if (file == NULL)
+		{
+		  std::cerr << "could not open filename with links: " << param_file_name_graph << std::endl;
+		  exit(EXIT_FAILURE);
+		}
+	      global_thread_files.push_back( file );
+	    }
+	}
+
+	/*------------------------------------------------------------------*/
+	// links do not change between iterations
+	if (param_link_cache)
+	  buildLinkCache();
+
+	/*------------------------------------------------------------------*/
+	// all nids are optimised in the first iteration
+	if (param_incremental)
+	  {
+	    global_dirty.assign( global_map_nid2fileindex.size(), 1 );
+	    global_changed.assign( global_map_nid2fileindex.size(), 0 );
+	  }
+
 	/*------------------------------------------------------------------*/
 	// fill partitions with initial values
 	global_partitions.resize(global_map_nid2fileindex.size());
@@ -41,11 +41,16 @@ std::string param_file_name_transfers = "adda.transfers";
 std::string param_file_name_domains = "adda.domains";
 std::string param_file_name_domain_graph = "adda.domain_graph";
 std::string param_file_name_mst = "adda.mst";
+std::string param_file_name_link_cache = "adda.domains.links";
 
 /* various options */
 bool param_disallow_shortening = false;
 bool param_descend = false;
 int param_max_iterations = 10;
+int param_num_threads = 1;
+bool param_link_cache = false;
+int param_link_cache_memory = 1000;
+bool param_incremental = false;
 bool param_use_file_nids = false;
 
 double param_resolution = 1.0;
@@ -80,6 +85,7 @@ int param_min_domain_size = 30;
 
 // for mst
 size_t param_initial_graph_size;
+int param_mst_sort_memory = 1000;
 
 // parameter setters
 
@@ -91,6 +97,7 @@ void cadda_setFilenameDomains( const char * f) { param_file_name_domains = f; }
 void cadda_setFilenameDomainGraph( const char * f) { param_file_name_domain_graph = f; }
 void cadda_setFilenameTransfers( const char * f) { param_file_name_transfers = f; }
 void cadda_setFilenameMst( const char * f) { param_file_name_mst = f; }
+void cadda_setFilenameLinkCache( const char * f) { param_file_name_link_cache = f; }
 
 void cadda_setDisallowShortening( int f) { param_disallow_shortening = f; }
 void cadda_setDescend( int f) { param_descend = f; }
@@ -99,6 +106,10 @@ void cadda_setOnlyQuery( int f) { param_only_query = f; }
 void cadda_setRelativeOverhang( int f) { param_relative_overhang = f; }
 
 void cadda_setMaxIterations( int f) { param_max_iterations = f; }
+void cadda_setNumThreads( int f) { param_num_threads = f; }
+void cadda_setLinkCache( int f) { param_link_cache = f; }
+void cadda_setLinkCacheMemory( int f) { param_link_cache_memory = f; }
+void cadda_setIncremental( int f) { param_incremental = f; }
 
 void cadda_setResolution( double f) { param_resolution = f; }
 void cadda_setK( double f) { param_real_k = f; }
@@ -110,6 +121,7 @@ void cadda_setF( double f) { param_real_f = f; }
 void cadda_setLogLevel( int f) { param_loglevel = f; }
 void cadda_setReportStep( int f) { param_report_step = f; }
 void cadda_setInitialGraphSize( size_t s) { param_initial_graph_size = s; }
+void cadda_setMstSortMemory( int f) { param_mst_sort_memory = f; }
 
 void cadda_setEvalueThresholdTrustedLinks( double f) { param_evalue_threshold_trusted_links = f; }
 
@@ -140,12 +152,18 @@ void cadda_dump_parameters()
 	std::cout << "#			1: maximum overlapping pairings" << std::endl;
 	std::cout << "#			2: check pairings" << std::endl;
 	std::cout << "#			3: prune alignments" << std::endl;
+	std::cout << "# memory for sorting edges (Mb)  : " << param_mst_sort_memory << std::endl;
 	std::cout << "####################################################" << std::endl;
 	std::cout << "# options for optimisation:" << std::endl;
 	std::cout << "# use_file_nids					  : " << param_use_file_nids << std::endl;
 	std::cout << "# descend						  : " << param_descend << std::endl;  
 	std::cout << "# disallow_shortening			  : " << param_disallow_shortening << std::endl;
 	std::cout << "# max_iterations			  	  : " << param_max_iterations << std::endl;
+	std::cout << "# num_threads			  	  : " << param_num_threads << std::endl;
+	std::cout << "# link_cache			  	  : " << param_link_cache << std::endl;
+	std::cout << "# link_cache_memory (Mb)		  : " << param_link_cache_memory << std::endl;
+	std::cout << "# file with link cache		  : " << param_file_name_link_cache << std::endl;
+	std::cout << "# incremental			  	  : " << param_incremental << std::endl;
 	std::cout << "# resolution			  	  	  : " << param_resolution << std::endl;  
 	std::cout << "# sigmoid k	  					  : " << param_real_k << std::endl;  
 	std::cout << "# sigmoid c	  					  : " << param_real_c << std::endl;    